@@ -0,0 +1,105 @@
+import os
+import time
+import hashlib
+import tempfile
+from ttl_cache import TTLCache
+from typing import Iterable, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+class BlobStore:
+    """
+    Content-addressed store for large immutable workflow values.
+
+    Graph state keeps only the blob id (a sha256 of the text), so checkpoints
+    stay small no matter how large the retrieval context is. Blobs are written
+    once to disk, which keeps them readable after a restart, and recently used
+    ones are kept in memory. Blobs no checkpoint refers to any more are removed
+    by collect_garbage() when old checkpoints are pruned.
+    """
+
+    def __init__(self, directory: str, cache_size: int = 128):
+        self.directory = directory
+        self._cache = TTLCache(max_size=cache_size, ttl_seconds=3600.0)
+
+    def _path(self, blob_id: str) -> str:
+        return os.path.join(self.directory, blob_id[:2], f"{blob_id}.txt")
+
+    def put(self, text: str) -> str:
+        """Store text and return its blob id; identical text is stored once"""
+        blob_id = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        path = self._path(blob_id)
+        try:
+            # Refresh the age of a blob that is reused, so collection leaves it alone
+            os.utime(path)
+        except FileNotFoundError:
+            self._write(path, text)
+        self._cache.set(blob_id, text)
+        return blob_id
+
+    @staticmethod
+    def _write(path: str, text: str):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # A temp file of our own; other threads and processes may be writing the same blob
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=directory, suffix=".tmp", delete=False) as f:
+            f.write(text)
+        try:
+            os.replace(f.name, path)
+        except OSError:
+            os.remove(f.name)
+            # Another writer got there first; the content is the same
+            if not os.path.exists(path):
+                raise
+
+    def get(self, blob_id: Optional[str]) -> str:
+        """Return the text for blob_id ("" for an empty id)"""
+        if not blob_id:
+            return ""
+        text = self._cache.get(blob_id)
+        if text is None:
+            with open(self._path(blob_id), "r", encoding="utf-8") as f:
+                text = f.read()
+            self._cache.set(blob_id, text)
+        return text
+
+    def collect_garbage(self, live_ids: Iterable[str], min_age_seconds: float = 3600.0) -> int:
+        """Delete blobs not in live_ids; returns how many.
+
+        Blobs (and abandoned temp files) younger than min_age_seconds are kept,
+        since a running workflow may have stored one that no checkpoint refers
+        to yet.
+        """
+        live_ids = set(live_ids)
+        cutoff = time.time() - min_age_seconds
+        removed = 0
+        if not os.path.isdir(self.directory):
+            return 0
+        for prefix in os.listdir(self.directory):
+            prefix_dir = os.path.join(self.directory, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for name in os.listdir(prefix_dir):
+                blob_id, ext = os.path.splitext(name)
+                if ext == ".txt" and blob_id in live_ids:
+                    continue
+                path = os.path.join(prefix_dir, name)
+                try:
+                    if os.path.getmtime(path) >= cutoff:
+                        continue
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                if ext == ".txt":
+                    removed += 1
+        # Dropped blobs must not be served from memory either
+        self._cache.clear()
+        if removed:
+            logger.info(f"Removed {removed} unreferenced state blobs")
+        return removed
+
+# Global instance, outside the source tree by default
+state_blob_store = BlobStore(os.getenv("STATE_BLOB_DIR") or os.path.join(
+    os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "research_agents", "state_blobs"
+))
@@ -0,0 +1,237 @@
+import os
+import time
+import uuid
+import asyncio
+from contextlib import asynccontextmanager
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.checkpoint.memory import MemorySaver
+from typing import Iterable, List, Optional, Set
+import logging
+
+logger = logging.getLogger(__name__)
+
+# "sqlite" (single node), "postgres" (shared across nodes) or "memory" (in-process, not durable)
+CHECKPOINTER_BACKEND = os.getenv("CHECKPOINTER_BACKEND", "sqlite")
+CHECKPOINT_SQLITE_PATH = os.getenv("CHECKPOINT_SQLITE_PATH", "./checkpoints.sqlite")
+CHECKPOINT_POSTGRES_URL = os.getenv("CHECKPOINT_POSTGRES_URL", "")
+CHECKPOINT_POOL_SIZE = int(os.getenv("CHECKPOINT_POOL_SIZE", "4"))
+# Threads with no new checkpoint for this long are deleted (0 keeps them forever)
+CHECKPOINT_TTL_HOURS = float(os.getenv("CHECKPOINT_TTL_HOURS", "24"))
+CHECKPOINT_PRUNE_INTERVAL = float(os.getenv("CHECKPOINT_PRUNE_INTERVAL", "3600"))
+
+# 100-ns intervals between the UUID epoch (1582-10-15) and the Unix epoch
+_UUID_EPOCH_OFFSET = 0x01B21DD213814000
+
+def checkpoint_id_at(unix_seconds: float) -> str:
+    """Smallest checkpoint id created at the given time.
+
+    LangGraph checkpoint ids are time-ordered UUIDv6 strings, so comparing ids
+    as strings compares their creation times.
+    """
+    timestamp = int(unix_seconds * 10_000_000) + _UUID_EPOCH_OFFSET
+    uuid_int = ((timestamp >> 12) & 0xFFFFFFFFFFFF) << 80
+    uuid_int |= (0x6000 | (timestamp & 0x0FFF)) << 64
+    uuid_int |= 0x8000 << 48  # RFC 4122 variant
+    return str(uuid.UUID(int=uuid_int))
+
+class PooledSqliteSaver(BaseCheckpointSaver):
+    """
+    SQLite checkpointer backed by a small pool of connections in WAL mode.
+
+    Each connection is wrapped in its own AsyncSqliteSaver, which serializes
+    calls on that connection; spreading calls over the pool lets concurrent
+    runs read and write checkpoints in parallel. WAL and a busy timeout also
+    let several uvicorn workers share one database file.
+    """
+
+    def __init__(self, path: str, pool_size: int = 4):
+        super().__init__()
+        self.path = path
+        self.pool_size = max(1, pool_size)
+        self._savers = []
+        self._idle: Optional[asyncio.Queue] = None
+
+    async def open(self):
+        import aiosqlite
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._idle = asyncio.Queue()
+        for _ in range(self.pool_size):
+            conn = await aiosqlite.connect(self.path, timeout=30)
+            saver = AsyncSqliteSaver(conn, serde=self.serde)
+            self._savers.append(saver)
+            try:
+                await conn.execute("PRAGMA synchronous=NORMAL")
+                # Creates the tables and switches the database to WAL
+                await saver.setup()
+            except Exception:
+                await self.close()
+                raise
+            self._idle.put_nowait(saver)
+        logger.info(f"SQLite checkpointer opened at {self.path} with {self.pool_size} connections")
+
+    async def close(self):
+        for saver in self._savers:
+            await saver.conn.close()
+        self._savers = []
+
+    @asynccontextmanager
+    async def _saver(self):
+        saver = await self._idle.get()
+        try:
+            yield saver
+        finally:
+            self._idle.put_nowait(saver)
+
+    async def aget_tuple(self, config):
+        async with self._saver() as saver:
+            return await saver.aget_tuple(config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        async with self._saver() as saver:
+            async for checkpoint_tuple in saver.alist(config, filter=filter, before=before, limit=limit):
+                yield checkpoint_tuple
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        async with self._saver() as saver:
+            return await saver.aput(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        async with self._saver() as saver:
+            return await saver.aput_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        async with self._saver() as saver:
+            return await saver.adelete_thread(thread_id)
+
+    def get_next_version(self, current, channel):
+        return self._savers[0].get_next_version(current, channel)
+
+    async def stale_thread_ids(self, cutoff_id: str) -> List[str]:
+        """Threads whose latest checkpoint is older than cutoff_id"""
+        async with self._saver() as saver:
+            async with saver.conn.execute(
+                "SELECT thread_id FROM checkpoints GROUP BY thread_id HAVING MAX(checkpoint_id) < ?",
+                (cutoff_id,)
+            ) as cursor:
+                return [row[0] for row in await cursor.fetchall()]
+
+async def _open_postgres_saver(url: str, pool_size: int):
+    from psycopg.rows import dict_row
+    from psycopg_pool import AsyncConnectionPool
+    from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+
+    pool = AsyncConnectionPool(
+        url,
+        max_size=pool_size,
+        open=False,
+        kwargs={"autocommit": True, "prepare_threshold": 0, "row_factory": dict_row}
+    )
+    await pool.open()
+    saver = AsyncPostgresSaver(pool)
+    await saver.setup()
+    logger.info(f"Postgres checkpointer opened with a pool of {pool_size} connections")
+    return saver
+
+# Global instance, opened at API startup
+research_checkpointer = None
+
+async def open_checkpointer(backend: str = None) -> BaseCheckpointSaver:
+    """Open the configured checkpointer and make it the global instance"""
+    global research_checkpointer
+    backend = backend or CHECKPOINTER_BACKEND
+    if backend == "sqlite":
+        saver = PooledSqliteSaver(CHECKPOINT_SQLITE_PATH, CHECKPOINT_POOL_SIZE)
+        await saver.open()
+    elif backend == "postgres":
+        if not CHECKPOINT_POSTGRES_URL:
+            raise ValueError("CHECKPOINT_POSTGRES_URL is required for the postgres checkpointer")
+        saver = await _open_postgres_saver(CHECKPOINT_POSTGRES_URL, CHECKPOINT_POOL_SIZE)
+    elif backend == "memory":
+        saver = MemorySaver()
+    else:
+        raise ValueError(f"Unknown checkpointer backend: {backend}")
+    research_checkpointer = saver
+    return saver
+
+async def close_checkpointer():
+    """Close the global checkpointer's connections"""
+    global research_checkpointer
+    saver, research_checkpointer = research_checkpointer, None
+    if isinstance(saver, PooledSqliteSaver):
+        await saver.close()
+    elif saver is not None and hasattr(saver, "conn") and hasattr(saver.conn, "close"):
+        await saver.conn.close()
+
+def get_checkpointer() -> Optional[BaseCheckpointSaver]:
+    """The global checkpointer, or None if it has not been opened"""
+    return research_checkpointer
+
+async def _stale_thread_ids(saver: BaseCheckpointSaver, cutoff_id: str) -> List[str]:
+    if isinstance(saver, PooledSqliteSaver):
+        return await saver.stale_thread_ids(cutoff_id)
+    if isinstance(saver, MemorySaver):
+        return [
+            thread_id for thread_id, namespaces in list(saver.storage.items())
+            if max((max(checkpoints, default="") for checkpoints in namespaces.values()), default="") < cutoff_id
+        ]
+    # Postgres: the saver's connection is the pool
+    async with saver.conn.connection() as conn:
+        cursor = await conn.execute(
+            "SELECT thread_id FROM checkpoints GROUP BY thread_id HAVING MAX(checkpoint_id) < %s",
+            (cutoff_id,)
+        )
+        return [row["thread_id"] for row in await cursor.fetchall()]
+
+async def _delete_threads(saver: BaseCheckpointSaver, thread_ids: List[str]):
+    if isinstance(saver, (PooledSqliteSaver, MemorySaver)):
+        for thread_id in thread_ids:
+            await saver.adelete_thread(thread_id)
+        return
+    # Postgres: the pinned saver has no adelete_thread, so delete from its tables directly
+    async with saver.conn.connection() as conn:
+        async with conn.transaction():
+            for table in ("checkpoint_writes", "checkpoint_blobs", "checkpoints"):
+                await conn.execute(f"DELETE FROM {table} WHERE thread_id = ANY(%s)", (thread_ids,))
+
+async def referenced_values(saver: BaseCheckpointSaver, channels: Iterable[str]) -> Set[str]:
+    """Values of the given channels in every stored checkpoint and pending write"""
+    channels = set(channels)
+    values = set()
+    async for checkpoint_tuple in saver.alist(None):
+        channel_values = checkpoint_tuple.checkpoint.get("channel_values", {})
+        values.update(channel_values[channel] for channel in channels if channel_values.get(channel))
+        values.update(value for _, channel, value in checkpoint_tuple.pending_writes or []
+                      if channel in channels and value)
+    return values
+
+async def prune_checkpoints(saver: BaseCheckpointSaver, max_age_seconds: float,
+                            blob_store=None, blob_channels: Iterable[str] = ()) -> int:
+    """Delete threads with no checkpoint newer than max_age_seconds; returns how many.
+
+    With a blob store, blobs that no remaining checkpoint refers to through
+    blob_channels are deleted as well.
+    """
+    stale = await _stale_thread_ids(saver, checkpoint_id_at(time.time() - max_age_seconds))
+    if stale:
+        await _delete_threads(saver, stale)
+        logger.info(f"Pruned {len(stale)} checkpoint threads older than {max_age_seconds / 3600:.1f}h")
+    if blob_store is not None:
+        live_ids = await referenced_values(saver, blob_channels)
+        await asyncio.to_thread(blob_store.collect_garbage, live_ids)
+    return len(stale)
+
+async def run_checkpoint_pruning(saver: BaseCheckpointSaver,
+                                 ttl_hours: float = CHECKPOINT_TTL_HOURS,
+                                 interval_seconds: float = CHECKPOINT_PRUNE_INTERVAL,
+                                 blob_store=None, blob_channels: Iterable[str] = ()):
+    """Prune expired threads (and the blobs only they used) periodically; run as a background task"""
+    if ttl_hours <= 0:
+        return
+    while True:
+        try:
+            await prune_checkpoints(saver, ttl_hours * 3600, blob_store, blob_channels)
+        except Exception as e:
+            logger.error(f"Error pruning checkpoints: {e}")
+        await asyncio.sleep(interval_seconds)
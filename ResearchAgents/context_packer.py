@@ -0,0 +1,92 @@
+import re
+from langchain_core.documents import Document
+from typing import Any, Dict, List, Set
+
+# The splitter overlaps neighbouring chunks by up to 200 characters; look a
+# little further to be safe
+MAX_OVERLAP_CHARS = 300
+# Shorter matches are coincidence (a shared word or punctuation), not overlap
+MIN_OVERLAP_CHARS = 20
+NEAR_DUPLICATE_THRESHOLD = 0.8
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English prose)"""
+    return max(1, len(text) // 4) if text else 0
+
+def _shingles(text: str, size: int = 3) -> Set[str]:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def _overlap_length(left: str, right: str) -> int:
+    """Length of the longest suffix of left that is also a prefix of right"""
+    for n in range(min(len(left), len(right), MAX_OVERLAP_CHARS), MIN_OVERLAP_CHARS - 1, -1):
+        if right.startswith(left[-n:]):
+            return n
+    return 0
+
+class ContextPacker:
+    """
+    Packs retrieved chunks into a context string that fits a token budget.
+
+    Chunks are taken greedily in relevance order. Text shared with an
+    already selected chunk of the same source (splitter overlap) is trimmed,
+    near-duplicate chunks are dropped, and chunks that no longer fit are
+    skipped in favour of smaller, less relevant ones.
+    """
+
+    def __init__(self, token_budget: int):
+        self.token_budget = token_budget
+
+    def pack(self, docs: List[Document]) -> Dict[str, Any]:
+        selected = []  # (source, text, shingles)
+        tokens_used = 0
+        dropped = 0
+
+        for doc in docs:
+            text = doc.page_content.strip()
+            if not text:
+                continue
+            source = doc.metadata.get("source", "")
+
+            for other_source, other_text, _ in selected:
+                if other_source != source:
+                    continue
+                # Trim overlap with the chunk before and after this one
+                text = text[_overlap_length(other_text, text):]
+                tail = _overlap_length(text, other_text)
+                if tail:
+                    text = text[:-tail]
+            text = text.strip()
+            if not text:
+                dropped += 1
+                continue
+
+            shingles = _shingles(text)
+            if any(self._similarity(shingles, other) >= NEAR_DUPLICATE_THRESHOLD for _, _, other in selected):
+                dropped += 1
+                continue
+
+            # Count the "Context N:" header and separator against the budget too
+            tokens = estimate_tokens(f"Context {len(selected) + 1}:\n{text}\n\n")
+            if tokens_used + tokens > self.token_budget:
+                dropped += 1
+                continue
+
+            selected.append((source, text, shingles))
+            tokens_used += tokens
+
+        context = "\n\n".join(f"Context {i + 1}:\n{text}" for i, (_, text, _) in enumerate(selected))
+        return {
+            "context": context,
+            "tokens_used": estimate_tokens(context),
+            "chunks_used": len(selected),
+            "chunks_dropped": dropped,
+        }
+
+    @staticmethod
+    def _similarity(left: Set[str], right: Set[str]) -> float:
+        if not left or not right:
+            return 0.0
+        return len(left & right) / len(left | right)
@@ -0,0 +1,199 @@
+import os
+import hashlib
+import threading
+import numpy as np
+from collections import Counter
+from file_lock import FileLock
+from langchain_core.embeddings import Embeddings
+from typing import List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+class CachedEmbeddings(Embeddings):
+    """
+    Disk-backed embedding cache wrapping another LangChain embeddings model.
+
+    Vectors live in an append-only float32 file that is read through a memory
+    map; a small tab-separated index maps cache keys (model name plus a hash of
+    the normalized text) to row numbers in that file. The vector dimension is
+    recorded once, in its own file, by the first writer.
+
+    Several processes (e.g. uvicorn workers) may share one cache directory:
+    appends happen under an OS file lock, take their row numbers from the
+    vector file's actual size, and first pick up entries other processes
+    appended since this instance last read the index.
+    """
+
+    def __init__(self, embeddings: Embeddings, model_name: str, cache_dir: str):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache_dir = cache_dir
+        self.vectors_path = os.path.join(cache_dir, "vectors.f32")
+        self.index_path = os.path.join(cache_dir, "index.tsv")
+        self.dim_path = os.path.join(cache_dir, "dim")
+
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._file_lock_path = os.path.join(cache_dir, "cache.lock")
+        self._index = {}
+        self._index_offset = 0  # bytes of index.tsv already read
+        self._dim = None
+        self._rows = 0
+        self._mmap = None
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._refresh()
+        logger.info(f"Embedding cache loaded with {len(self._index)} vectors from {self.cache_dir}")
+
+    def _key(self, text: str) -> str:
+        normalized = " ".join(text.split())
+        digest = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+        return f"{self.model_name}:{digest}"
+
+    def _refresh(self):
+        """Read index entries appended since the last read, by this or any other process"""
+        if self._dim is None and os.path.exists(self.dim_path):
+            with open(self.dim_path, "r", encoding="utf-8") as f:
+                self._dim = int(f.read())
+
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "rb") as f:
+                f.seek(self._index_offset)
+                data = f.read()
+            # Only complete lines; a partial one is re-read once its writer finishes
+            end = data.rfind(b"\n") + 1
+            self._index_offset += end
+            entries = []
+            for line in data[:end].decode("utf-8", errors="replace").splitlines():
+                # A line torn by a crashed writer, and completed by the next
+                # writer's newline, has lost fields or digits from its end
+                try:
+                    key, row, dim = line.split("\t")
+                    entries.append((key, int(row), int(dim)))
+                except ValueError:
+                    continue
+            if self._dim is None and entries:
+                # A cache written before the dimension had its own file: a torn
+                # line is at most one per crash, so the common value is right
+                self._dim = Counter(dim for _, _, dim in entries).most_common(1)[0][0]
+            for key, row, dim in entries:
+                if dim != self._dim:
+                    continue
+                # First entry wins, should a key ever be written twice
+                self._index.setdefault(key, row)
+
+        if self._dim:
+            vector_bytes = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+            self._rows = vector_bytes // (self._dim * 4)
+
+    def _vectors(self) -> Optional[np.ndarray]:
+        """Memory-mapped view of all cached vectors, remapped after appends"""
+        if self._rows == 0:
+            return None
+        if self._mmap is None or self._mmap.shape[0] != self._rows:
+            self._mmap = np.memmap(self.vectors_path, dtype=np.float32, mode="r",
+                                   shape=(self._rows, self._dim))
+        return self._mmap
+
+    def lookup(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Return cached vectors for texts, with None for every miss"""
+        with self._lock:
+            self._refresh()
+            vectors = self._vectors()
+            results = []
+            for text in texts:
+                row = self._index.get(self._key(text))
+                # Rows past the mapped size belong to a vector that never fully reached disk
+                if row is None or row >= self._rows:
+                    results.append(None)
+                    self.misses += 1
+                else:
+                    results.append(vectors[row].tolist())
+                    self.hits += 1
+            return results
+
+    def store(self, texts: List[str], vectors: List[List[float]]):
+        """Append newly computed vectors to the cache"""
+        if not texts:
+            return
+        with self._lock, FileLock(self._file_lock_path):
+            self._refresh()
+            new_keys, new_vectors = [], []
+            seen = set()
+            for text, vector in zip(texts, vectors):
+                key = self._key(text)
+                if key in self._index or key in seen:
+                    continue
+                seen.add(key)
+                new_keys.append(key)
+                new_vectors.append(vector)
+            if not new_keys:
+                return
+
+            matrix = np.asarray(new_vectors, dtype=np.float32)
+            if self._dim is None:
+                self._dim = matrix.shape[1]
+            if not os.path.exists(self.dim_path):
+                with open(self.dim_path + ".tmp", "w", encoding="utf-8") as f:
+                    f.write(str(self._dim))
+                os.replace(self.dim_path + ".tmp", self.dim_path)
+            row_bytes = self._dim * 4
+
+            # Vectors first, then index: a crash between the two only loses entries
+            with open(self.vectors_path, "ab") as f:
+                f.seek(0, os.SEEK_END)
+                first_row, torn = divmod(f.tell(), row_bytes)
+                if torn:
+                    # Drop a torn trailing row so appends stay aligned
+                    f.truncate(first_row * row_bytes)
+                f.write(matrix.tobytes())
+            with open(self.index_path, "a+b") as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell():
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        # Terminate a line torn by a crashed writer so it doesn't swallow ours
+                        f.write(b"\n")
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                for offset, key in enumerate(new_keys):
+                    f.write(f"{key}\t{first_row + offset}\t{self._dim}\n")
+
+            # Our own lines are picked up like anyone else's
+            self._refresh()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        results = self.lookup(texts)
+        missing = [i for i, vector in enumerate(results) if vector is None]
+        if missing:
+            computed = self.embeddings.embed_documents([texts[i] for i in missing])
+            self.store([texts[i] for i in missing], computed)
+            for i, vector in zip(missing, computed):
+                results[i] = vector
+        return results
+
+    def embed_query(self, text: str) -> List[float]:
+        cached = self.lookup([text])[0]
+        if cached is not None:
+            return cached
+        vector = self.embeddings.embed_query(text)
+        self.store([text], [vector])
+        return vector
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed several queries, encoding all cache misses as one batch.
+
+        Misses go through embed_documents, which matches embed_query for
+        symmetric models such as the SentenceTransformers used here.
+        """
+        return self.embed_documents(texts)
+
+    def get_stats(self):
+        """Cache size and hit/miss counters"""
+        return {
+            "entries": len(self._index),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
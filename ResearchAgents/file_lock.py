@@ -0,0 +1,72 @@
+import os
+import time
+
+if os.name == "nt":
+    import msvcrt
+
+    def _try_lock(f) -> bool:
+        f.seek(0)
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+    def _unlock(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _try_lock(f) -> bool:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            return False
+
+    def _unlock(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+class FileLock:
+    """
+    Exclusive lock on a file, shared by every process (and every FileLock
+    instance) that opens the same path. Uses flock on POSIX and msvcrt byte
+    locking on Windows.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    @property
+    def held(self) -> bool:
+        return self._file is not None
+
+    def acquire(self, blocking: bool = True, poll_interval: float = 0.01) -> bool:
+        """Take the lock; with blocking=False return False instead of waiting"""
+        if self._file is not None:
+            return True
+        f = open(self.path, "a+b")
+        while not _try_lock(f):
+            if not blocking:
+                f.close()
+                return False
+            time.sleep(poll_interval)
+        self._file = f
+        return True
+
+    def release(self):
+        f, self._file = self._file, None
+        if f is not None:
+            try:
+                _unlock(f)
+            finally:
+                f.close()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
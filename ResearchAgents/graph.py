@@ -1,105 +1,204 @@
 from langgraph.graph import StateGraph, MessagesState, START, END
 from langgraph.prebuilt import ToolNode
 from langchain_core.tools import tool
-from langchain.chat_models import init_chat_model
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
 from langgraph.checkpoint.memory import MemorySaver
-from vector_store import get_research_vectorstore
+from langgraph.constants import Send
+from vector_store import start_vectorstore_warmup
+from model_registry import get_model_for_role, get_provider_for_role, get_context_token_budget
+from rate_limiter import get_provider_limiter
+from blob_store import state_blob_store
+from checkpointer import get_checkpointer
 from typing import TypedDict, Annotated
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import functools
+import os
 import re
 
-# Enhanced state to track the workflow progress
+# Bounded pool for sync-only work (Chroma searches, embedding) called from async nodes
+_blocking_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("BLOCKING_POOL_SIZE", "8")),
+    thread_name_prefix="research-blocking"
+)
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking call on the bounded pool without stalling the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_blocking_executor, functools.partial(func, *args, **kwargs))
+
+async def wait_for_vectorstore():
+    """Wait for the background vector store warm-up (starting it if needed) and return the store"""
+    return await asyncio.wrap_future(start_vectorstore_warmup())
+
+# Tag prefix marking which workflow stage an LLM call belongs to; streaming
+# clients use it to label tokens (first_cut, feedback, final). Specialist
+# reviews are also tagged with the reviewer they come from.
+STAGE_TAG_PREFIX = "stage:"
+REVIEWER_TAG_PREFIX = "reviewer:"
+
+async def generate_for_stage(model, messages, stage: str, provider: str = None, reviewer: str = None):
+    """Stream a chat completion tagged with its workflow stage and return the full message"""
+    if provider:
+        # Shared per-provider limit across all concurrent requests
+        await get_provider_limiter(provider).acquire()
+    tags = [f"{STAGE_TAG_PREFIX}{stage}"]
+    if reviewer:
+        tags.append(f"{REVIEWER_TAG_PREFIX}{reviewer}")
+    response = None
+    async for chunk in model.with_config(tags=tags).astream(messages):
+        response = chunk if response is None else response + chunk
+    return response
+
+def merge_token_usage(left: dict, right: dict) -> dict:
+    """Reducer summing per-stage token counts, so concurrent reviewers can report usage.
+    
+    An update with "reset" set starts the totals over for a new run on the same thread.
+    """
+    right = dict(right or {})
+    merged = {} if right.pop("reset", False) else dict(left or {})
+    for stage, usage in right.items():
+        previous = merged.get(stage) or {}
+        merged[stage] = {key: previous.get(key, 0) + value for key, value in usage.items()}
+    return merged
+
+def merge_reviews(left: list, right: list) -> list:
+    """Reducer appending specialist reviews; None clears them for a new run"""
+    if right is None:
+        return []
+    return (left or []) + right
+
+# Specialist reviewers run concurrently in the senior review stage; each one
+# checks one aspect of the draft and scores it
+REVIEWER_FOCUS = {
+    "financials": """Review the FINANCIAL ANALYSIS only:
+1. Accuracy of figures, ratios and growth rates against the research context
+2. Whether valuation and the investment thesis follow from the numbers
+3. Financial data in the research context that the report misses""",
+    "risks": """Review the RISK ASSESSMENT only:
+1. Completeness of company, sector, market and regulatory risks
+2. Whether risks are specific to the company rather than generic
+3. Balance between the investment thesis and the downside case""",
+    "structure": """Review the STRUCTURE AND PRESENTATION only:
+1. Report structure, section order and completeness
+2. Clarity of the executive summary and recommendation
+3. Professional formatting, conciseness and actionable insights""",
+}
+
+# Rounds of review and rewrite; review stops early once every reviewer's
+# quality score reaches the threshold (out of 10)
+DEFAULT_MAX_REVIEW_ROUNDS = int(os.getenv("REVIEW_MAX_ROUNDS", "1"))
+DEFAULT_QUALITY_THRESHOLD = float(os.getenv("REVIEW_QUALITY_THRESHOLD", "8"))
+
+QUALITY_SCORE_PATTERN = re.compile(r"QUALITY SCORE:\s*\**\s*(\d+(?:\.\d+)?)", re.IGNORECASE)
+
+def get_review_settings(config=None) -> dict:
+    """Review rounds, quality threshold and reviewers for a run, overridable in the run config"""
+    configurable = (config or {}).get("configurable", {})
+    reviewers = configurable.get("reviewers") or list(REVIEWER_FOCUS)
+    unknown = [name for name in reviewers if name not in REVIEWER_FOCUS]
+    if unknown:
+        raise ValueError(f"Unknown reviewers: {unknown}")
+    return {
+        "max_review_rounds": int(configurable.get("max_review_rounds", DEFAULT_MAX_REVIEW_ROUNDS)),
+        "quality_threshold": float(configurable.get("quality_threshold", DEFAULT_QUALITY_THRESHOLD)),
+        "reviewers": list(reviewers),
+    }
+
+# State keys holding blob store ids; their blobs are kept while a checkpoint refers to them
+BLOB_CHANNELS = ("context_ref",)
+
+# Enhanced state to track the workflow progress. Nodes return only the keys
+# they change, and the retrieval context is kept in the blob store with only
+# its content-addressed id in the state, so checkpoints stay small.
 class ResearchState(TypedDict):
     messages: Annotated[list, "The conversation messages"]
     company_code: str
     sector_code: str
     report_type: str
-    research_context: str
+    context_ref: str  # Blob id of the research context
     first_cut_report: str
     feedback: str
     final_report: str
     analyst_iterations: int
+    token_usage: Annotated[dict, merge_token_usage]  # Per-stage prompt/cached/completion token counts
+    reviews: Annotated[list, merge_reviews]  # {"round", "reviewer", "feedback", "score"} from every round
+    review_round: int
+    quality_score: float
+    max_review_rounds: int
+    quality_threshold: float
+    reviewers: list
 
-def initialize_research(state):
+async def initialize_research(state, config=None):
     """Initialize the research process by getting context from ChromaDB"""
-    messages = state["messages"]
     company_code = state.get("company_code", "")
     sector_code = state.get("sector_code", "")
     report_type = state.get("report_type", "")
     
     print(f"DEBUG: initialize_research - Company: {company_code}, Sector: {sector_code}, Report: {report_type}")
     
+    review_settings = get_review_settings(config)
+    
     # Get relevant context from ChromaDB
-    vectorstore = get_research_vectorstore()
+    vectorstore = await wait_for_vectorstore()
     context = ""
+    token_usage = {}
     
     if company_code and company_code != "UNKNOWN":
         print(f"DEBUG: Retrieving context for company: {company_code}")
-        context = vectorstore.get_context_for_company(company_code)
-        print(f"DEBUG: Retrieved context length: {len(context)} characters")
+        packed = await run_blocking(
+            vectorstore.get_packed_context,
+            company_code,
+            token_budget=get_context_token_budget(config)
+        )
+        context = packed["context"]
+        token_usage["context"] = {
+            "tokens_used": packed["tokens_used"],
+            "chunks_used": packed["chunks_used"],
+            "chunks_dropped": packed["chunks_dropped"]
+        }
+        print(f"DEBUG: Retrieved context length: {len(context)} characters, ~{packed['tokens_used']} tokens")
     
+    context_ref = await run_blocking(state_blob_store.put, context)
+    
+    # Reset the per-run fields; a thread may already hold a previous run's state
     return {
-        "messages": messages,
-        "company_code": company_code,
-        "sector_code": sector_code,
-        "report_type": report_type,
-        "research_context": context,
+        "context_ref": context_ref,
         "first_cut_report": "",
         "feedback": "",
         "final_report": "",
-        "analyst_iterations": 0
+        "analyst_iterations": 0,
+        "token_usage": {"reset": True, **token_usage},
+        "reviews": None,
+        "review_round": 0,
+        "quality_score": 0.0,
+        **review_settings
     }
 
-def equity_research_analyst(state):
-    """Junior Equity Research Analyst - generates reports using RAG context"""
-    messages = state["messages"]
-    company_code = state.get("company_code", "")
-    context = state.get("research_context", "")
-    feedback = state.get("feedback", "")
-    iterations = state.get("analyst_iterations", 0)
-    
-    print(f"DEBUG: Equity Research Analyst - Iteration {iterations + 1}")
-    
-    # Extract user message content (handle both tuple and message object formats)
-    user_request = ""
-    if messages and len(messages) > 0:
-        if isinstance(messages[0], tuple):
-            user_request = messages[0][1]  # For ("user", content) format
-        else:
-            user_request = messages[0].content  # For message object format
-    
-    # Determine if this is first cut or final report
-    is_final_report = iterations > 0 and feedback
-    
-    if is_final_report:
-        system_content = f"""You are a Junior Equity Research Analyst. You are revising your research report based on senior analyst feedback.
+# Prompts are laid out so that every LLM call for a report starts with the same
+# long prefix (team preamble, company, research context, user request). Provider
+# side prompt caching can then reuse it; only the role-specific tail differs.
+RESEARCH_TEAM_PREAMBLE = """You are part of an equity research team made up of a Junior Equity Research Analyst and a Senior Equity Research Analyst with 15+ years of experience.
+The junior analyst drafts research reports from the research context below; the senior analyst reviews the drafts and provides constructive feedback.
+Your specific role and task for this step are given in the final instructions."""
 
-ORIGINAL USER REQUEST:
-{user_request}
+def build_shared_prefix(company_code: str, context: str, user_request: str) -> SystemMessage:
+    """Build the system message shared verbatim by every LLM call for one report"""
+    return SystemMessage(content=f"""{RESEARCH_TEAM_PREAMBLE}
 
-SENIOR ANALYST FEEDBACK:
-{feedback}
+COMPANY: {company_code}
 
 RESEARCH CONTEXT:
 === RESEARCH CONTEXT ===
 {context}
 === END CONTEXT ===
 
-Please revise your report addressing all the feedback points. Generate a comprehensive, well-structured FINAL research report that incorporates the senior analyst's suggestions.
-
-Use professional formatting with clear sections, bullet points, and actionable insights.
-Make sure to address every concern raised in the feedback.
-"""
-    else:
-        system_content = f"""You are a Junior Equity Research Analyst. Generate a comprehensive first-cut equity research report using the provided research context.
-
 USER REQUEST:
 {user_request}
+""")
 
-RESEARCH CONTEXT:
-=== RESEARCH CONTEXT ===
-{context}
-=== END CONTEXT ===
+def build_first_cut_instructions() -> HumanMessage:
+    return HumanMessage(content="""You are the Junior Equity Research Analyst. Generate a comprehensive first-cut equity research report for the user request using the provided research context.
 
 Generate a detailed first-cut research report with the following structure:
 1. Executive Summary
@@ -111,115 +210,194 @@ Generate a detailed first-cut research report with the following structure:
 
 Use professional formatting with clear sections, bullet points, and actionable insights.
 Base your analysis on the research context provided above.
-"""
+""")
+
+def build_final_instructions(feedback: str, draft: str) -> HumanMessage:
+    return HumanMessage(content=f"""You are the Junior Equity Research Analyst. You are revising your research report based on senior analyst feedback.
+
+YOUR CURRENT REPORT:
+=== REPORT TO REVISE ===
+{draft}
+=== END REPORT ===
+
+SENIOR ANALYST FEEDBACK:
+{feedback}
+
+Please revise your report addressing all the feedback points. Generate a comprehensive, well-structured FINAL research report that incorporates the senior analyst's suggestions.
+
+Use professional formatting with clear sections, bullet points, and actionable insights.
+Make sure to address every concern raised in the feedback.
+""")
+
+def build_review_instructions(draft: str, reviewer: str) -> HumanMessage:
+    return HumanMessage(content=f"""You are the Senior Equity Research Analyst. Your role is to review the junior analyst's report and provide constructive feedback.
+
+JUNIOR ANALYST'S REPORT:
+=== REPORT TO REVIEW ===
+{draft}
+=== END REPORT ===
+
+{REVIEWER_FOCUS[reviewer]}
+
+Be specific about what needs to be corrected, enhanced, or added. 
+Provide actionable suggestions for improvement.
+
+End your review with a single line rating the report on this aspect from 1 (poor) to 10 (publishable):
+QUALITY SCORE: <score>
+""")
+
+def parse_quality_score(feedback: str):
+    """Score from a review's closing "QUALITY SCORE: n" line, or None if missing"""
+    matches = QUALITY_SCORE_PATTERN.findall(feedback or "")
+    return min(float(matches[-1]), 10.0) if matches else None
+
+def get_user_request(messages) -> str:
+    """Extract user message content (handle both tuple and message object formats)"""
+    if not messages:
+        return ""
+    if isinstance(messages[0], tuple):
+        return messages[0][1]  # For ("user", content) format
+    return messages[0].content  # For message object format
+
+def extract_token_usage(response) -> dict:
+    """Prompt, cached-prompt and completion token counts reported for one LLM call"""
+    usage = {"prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+    usage_metadata = getattr(response, "usage_metadata", None)
+    if usage_metadata:
+        usage["prompt_tokens"] = usage_metadata.get("input_tokens", 0)
+        usage["completion_tokens"] = usage_metadata.get("output_tokens", 0)
+        usage["cached_tokens"] = (usage_metadata.get("input_token_details") or {}).get("cache_read", 0)
+        return usage
+    
+    # Fall back to the raw OpenAI-style usage block in the response metadata
+    token_usage = (getattr(response, "response_metadata", None) or {}).get("token_usage") or {}
+    usage["prompt_tokens"] = token_usage.get("prompt_tokens", 0)
+    usage["completion_tokens"] = token_usage.get("completion_tokens", 0)
+    usage["cached_tokens"] = (token_usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0)
+    return usage
+
+async def equity_research_analyst(state, config=None):
+    """Junior Equity Research Analyst - generates reports using RAG context"""
+    messages = state["messages"]
+    company_code = state.get("company_code", "")
+    context = state_blob_store.get(state.get("context_ref"))
+    feedback = state.get("feedback", "")
+    iterations = state.get("analyst_iterations", 0)
     
-    system_message = SystemMessage(content=system_content)
-    model = init_chat_model("groq:llama3-8b-8192", temperature=0.7)
+    print(f"DEBUG: Equity Research Analyst - Iteration {iterations + 1}")
     
-    # Create proper message for the model
-    user_message = HumanMessage(content=user_request)
-    response = model.invoke([system_message, user_message])
+    user_request = get_user_request(messages)
+    
+    # Determine if this is first cut or a revision after a review round
+    is_final_report = state.get("review_round", 0) > 0 and feedback
+    
+    if is_final_report:
+        draft = state.get("final_report") or state.get("first_cut_report", "")
+        instructions = build_final_instructions(feedback, draft)
+    else:
+        instructions = build_first_cut_instructions()
+    
+    prompt = [build_shared_prefix(company_code, context, user_request), instructions]
+    model = get_model_for_role("junior_analyst", config)
+    
+    stage = "final" if is_final_report else "first_cut"
+    provider = get_provider_for_role("junior_analyst", config)
+    response = await generate_for_stage(model, prompt, stage, provider)
     report_content = response.content
     
+    usage = extract_token_usage(response)
+    print(f"DEBUG: {stage} token usage: {usage}")
+    
     updated_state = {
-        "messages": state["messages"],
-        "company_code": company_code,
-        "sector_code": state.get("sector_code", ""),
-        "report_type": state.get("report_type", ""),
-        "research_context": context,
-        "analyst_iterations": iterations + 1
+        "analyst_iterations": iterations + 1,
+        "token_usage": {stage: usage}
     }
     
     if is_final_report:
         print(f"DEBUG: Generated FINAL report")
         updated_state["final_report"] = report_content
-        updated_state["first_cut_report"] = state.get("first_cut_report", "")
-        updated_state["feedback"] = feedback
     else:
         print(f"DEBUG: Generated FIRST CUT report")
         updated_state["first_cut_report"] = report_content
-        updated_state["feedback"] = ""
-        updated_state["final_report"] = ""
     
     return updated_state
 
-def senior_equity_research_analyst(state):
-    """Senior Equity Research Analyst - reviews and provides feedback"""
-    first_cut_report = state.get("first_cut_report", "")
-    company_code = state.get("company_code", "")
-    context = state.get("research_context", "")
-    messages = state["messages"]
+async def specialist_reviewer(state, config=None):
+    """One specialist reviewer; runs concurrently with the others via Send"""
+    reviewer = state["reviewer"]
+    review_round = state["review_round"]
+    
+    print(f"DEBUG: Specialist reviewer '{reviewer}' - Round {review_round}")
+    
+    prompt = [
+        build_shared_prefix(
+            state["company_code"],
+            state_blob_store.get(state["context_ref"]),
+            get_user_request(state["messages"])
+        ),
+        build_review_instructions(state["draft"], reviewer)
+    ]
+    model = get_model_for_role("senior_analyst", config)
+    
+    provider = get_provider_for_role("senior_analyst", config)
+    response = await generate_for_stage(model, prompt, "feedback", provider, reviewer=reviewer)
+    score = parse_quality_score(response.content)
+    
+    usage = extract_token_usage(response)
+    print(f"DEBUG: Reviewer '{reviewer}' scored {score}, token usage: {usage}")
     
-    print(f"DEBUG: Senior Equity Research Analyst - Reviewing first cut report")
-    
-    # Extract user message content (handle both tuple and message object formats)
-    user_request = ""
-    if messages and len(messages) > 0:
-        if isinstance(messages[0], tuple):
-            user_request = messages[0][1]  # For ("user", content) format
-        else:
-            user_request = messages[0].content  # For message object format
-    
-    system_content = f"""You are a Senior Equity Research Analyst with 15+ years of experience. 
-Your role is to review the junior analyst's first-cut report and provide constructive feedback.
-
-ORIGINAL USER REQUEST:
-{user_request}
-
-COMPANY: {company_code}
-
-RESEARCH CONTEXT:
-=== RESEARCH CONTEXT ===
-{context}
-=== END CONTEXT ===
-
-JUNIOR ANALYST'S FIRST CUT REPORT:
-=== REPORT TO REVIEW ===
-{first_cut_report}
-=== END REPORT ===
-
-Please provide detailed, constructive feedback focusing on:
-1. Accuracy of financial analysis
-2. Completeness of risk assessment
-3. Quality of investment thesis
-4. Use of research context and data
-5. Report structure and presentation
-6. Missing critical information
-7. Specific improvements needed
+    return {
+        "reviews": [{"round": review_round, "reviewer": reviewer, "feedback": response.content, "score": score}],
+        "token_usage": {f"feedback_{reviewer}": usage}
+    }
 
-Be specific about what needs to be corrected, enhanced, or added. 
-Provide actionable suggestions for improvement.
-"""
-    
-    system_message = SystemMessage(content=system_content)
-    model = init_chat_model("groq:llama3-8b-8192", temperature=0.3)  # Lower temperature for more consistent feedback
+def senior_equity_research_analyst(state):
+    """Senior Equity Research Analyst - merges the specialist reviews of this round into feedback"""
+    review_round = state.get("review_round", 0) + 1
+    reviews = [review for review in state.get("reviews", []) if review["round"] == review_round]
     
-    response = model.invoke([system_message])
-    feedback_content = response.content
+    feedback_content = "\n\n".join(
+        f"### {review['reviewer'].title()} review\n{review['feedback']}" for review in reviews
+    )
+    # Every aspect has to pass, so the round is scored by its weakest review
+    scores = [review["score"] for review in reviews]
+    quality_score = min(scores) if scores and None not in scores else 0.0
     
-    print(f"DEBUG: Generated feedback for first cut report")
+    print(f"DEBUG: Senior Equity Research Analyst - Round {review_round} merged {len(reviews)} reviews, quality score {quality_score}")
     
     return {
-        "messages": state["messages"],
-        "company_code": company_code,
-        "sector_code": state.get("sector_code", ""),
-        "report_type": state.get("report_type", ""),
-        "research_context": context,
-        "first_cut_report": first_cut_report,
         "feedback": feedback_content,
-        "final_report": "",
-        "analyst_iterations": state.get("analyst_iterations", 0)
+        "review_round": review_round,
+        "quality_score": quality_score
     }
 
 def should_continue_to_senior(state):
-    """Determine if we should go to senior analyst (after first cut)"""
-    iterations = state.get("analyst_iterations", 0)
-    return "senior_analyst" if iterations == 1 else "finalize"
+    """Fan out to the specialist reviewers, or finalize once all review rounds are done"""
+    review_round = state.get("review_round", 0)
+    max_review_rounds = state.get("max_review_rounds", DEFAULT_MAX_REVIEW_ROUNDS)
+    if review_round >= max_review_rounds:
+        return "finalize"
+    
+    draft = state.get("final_report") or state.get("first_cut_report", "")
+    return [
+        Send("specialist_reviewer", {
+            "reviewer": reviewer,
+            "review_round": review_round + 1,
+            "draft": draft,
+            "messages": state["messages"],
+            "company_code": state.get("company_code", ""),
+            "context_ref": state.get("context_ref", "")
+        })
+        for reviewer in state.get("reviewers") or list(REVIEWER_FOCUS)
+    ]
 
 def should_continue_to_final(state):
-    """Determine if we should go to final report (after feedback)"""
-    iterations = state.get("analyst_iterations", 0)
-    return "junior_analyst" if iterations == 1 else "finalize"
+    """Revise the report after a review round, unless it already meets the quality threshold"""
+    threshold = state.get("quality_threshold", DEFAULT_QUALITY_THRESHOLD)
+    if state.get("quality_score", 0.0) >= threshold:
+        print(f"DEBUG: Quality score {state['quality_score']} meets threshold {threshold}, stopping early")
+        return "finalize"
+    return "junior_analyst"
 
 def finalize_research(state):
     """Finalize the research process and return the appropriate report"""
@@ -235,7 +413,7 @@ def finalize_research(state):
         "messages": [AIMessage(content=report_to_return)]
     }
 
-def create_research_graph():
+def create_research_graph(checkpointer=None):
     """Create and return the multi-agent research graph."""
     
     # Create the state graph with custom ResearchState
@@ -244,6 +422,7 @@ def create_research_graph():
     # Add nodes for the workflow
     workflow.add_node("initialize", initialize_research)
     workflow.add_node("junior_analyst", equity_research_analyst)
+    workflow.add_node("specialist_reviewer", specialist_reviewer)
     workflow.add_node("senior_analyst", senior_equity_research_analyst)
     workflow.add_node("finalize", finalize_research)
     
@@ -251,26 +430,43 @@ def create_research_graph():
     workflow.add_edge(START, "initialize")
     workflow.add_edge("initialize", "junior_analyst")
     
-    # Conditional routing after junior analyst
+    # After each draft, fan out to the specialist reviewers in parallel (or finalize)
     workflow.add_conditional_edges(
         "junior_analyst",
         should_continue_to_senior,
+        ["specialist_reviewer", "finalize"]
+    )
+    
+    # The senior analyst merges the reviews once all reviewers have finished
+    workflow.add_edge("specialist_reviewer", "senior_analyst")
+    
+    # Go back to the junior analyst for a revision unless the quality bar is met
+    workflow.add_conditional_edges(
+        "senior_analyst",
+        should_continue_to_final,
         {
-            "senior_analyst": "senior_analyst",
+            "junior_analyst": "junior_analyst",
             "finalize": "finalize"
         }
     )
     
-    # After senior analyst feedback, go back to junior analyst for final report
-    workflow.add_edge("senior_analyst", "junior_analyst")
-    
     # End the workflow after finalization
     workflow.add_edge("finalize", END)
     
-    # Add memory
-    memory = MemorySaver()
+    # Add memory: the durable checkpointer when one is given, else in-process
+    memory = checkpointer or MemorySaver()
     
     # Compile the graph
     app = workflow.compile(checkpointer=memory)
     
     return app
+
+# Global compiled graph, built on first use rather than at import time
+_research_graph = None
+
+def get_research_graph():
+    """Get or create the compiled research graph, using the checkpointer opened at startup"""
+    global _research_graph
+    if _research_graph is None:
+        _research_graph = create_research_graph(get_checkpointer())
+    return _research_graph
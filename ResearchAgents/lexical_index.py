@@ -0,0 +1,143 @@
+import os
+import re
+import json
+import math
+import heapq
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Keeps tickers, fiscal labels and metric names ("AAPL", "FY24", "EBITDA") as single tokens
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+class BM25Index:
+    """
+    In-memory BM25 inverted index over the chunks of the vector store.
+
+    Postings map each term to {chunk_id: term_frequency}; chunk metadata is
+    kept alongside so searches can be restricted to one company. The index is
+    updated incrementally with add()/remove() and persisted as JSON.
+    """
+
+    def __init__(self, index_path: str, k1: float = 1.5, b: float = 0.75):
+        self.index_path = index_path
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._doc_lengths: Dict[str, int] = {}
+        self._doc_terms: Dict[str, List[str]] = {}
+        self._doc_metadata: Dict[str, Dict[str, Any]] = {}
+        self._total_length = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._doc_lengths)
+
+    def add(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]]):
+        """Index (or re-index) chunks"""
+        with self._lock:
+            self._remove_unlocked(ids)
+            for chunk_id, text, metadata in zip(ids, texts, metadatas):
+                counts = Counter(tokenize(text))
+                for term, tf in counts.items():
+                    self._postings.setdefault(term, {})[chunk_id] = tf
+                length = sum(counts.values())
+                self._doc_lengths[chunk_id] = length
+                self._doc_terms[chunk_id] = list(counts)
+                self._doc_metadata[chunk_id] = dict(metadata or {})
+                self._total_length += length
+
+    def remove(self, ids: List[str]):
+        """Drop chunks from the index; unknown ids are ignored"""
+        with self._lock:
+            self._remove_unlocked(ids)
+
+    def _remove_unlocked(self, ids: List[str]):
+        for chunk_id in ids:
+            if chunk_id not in self._doc_lengths:
+                continue
+            for term in self._doc_terms.pop(chunk_id):
+                postings = self._postings.get(term)
+                if postings is not None:
+                    postings.pop(chunk_id, None)
+                    if not postings:
+                        del self._postings[term]
+            self._total_length -= self._doc_lengths.pop(chunk_id)
+            self._doc_metadata.pop(chunk_id, None)
+
+    def search(self, query: str, k: int = 10, filter_dict: Optional[Dict[str, Any]] = None) -> List[Tuple[str, float]]:
+        """Return up to k (chunk_id, bm25_score) pairs, best first"""
+        with self._lock:
+            doc_count = len(self._doc_lengths)
+            if doc_count == 0:
+                return []
+            avg_length = self._total_length / doc_count
+
+            scores: Dict[str, float] = {}
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, tf in postings.items():
+                    if filter_dict and not self._matches(chunk_id, filter_dict):
+                        continue
+                    norm = tf + self.k1 * (1 - self.b + self.b * self._doc_lengths[chunk_id] / avg_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+
+            return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def _matches(self, chunk_id: str, filter_dict: Dict[str, Any]) -> bool:
+        metadata = self._doc_metadata.get(chunk_id, {})
+        return all(metadata.get(key) == value for key, value in filter_dict.items())
+
+    def load(self) -> bool:
+        """Load the persisted index; returns False if there is none"""
+        if not os.path.exists(self.index_path):
+            return False
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable lexical index {self.index_path}: {e}")
+            return False
+
+        with self._lock:
+            self._postings = data["postings"]
+            self._doc_lengths = data["doc_lengths"]
+            self._doc_metadata = data["doc_metadata"]
+            self._total_length = sum(self._doc_lengths.values())
+            self._doc_terms = {chunk_id: [] for chunk_id in self._doc_lengths}
+            for term, postings in self._postings.items():
+                for chunk_id in postings:
+                    self._doc_terms[chunk_id].append(term)
+        logger.info(f"Lexical index loaded with {len(self)} chunks")
+        return True
+
+    def save(self):
+        """Atomically persist the index"""
+        with self._lock:
+            data = {
+                "postings": self._postings,
+                "doc_lengths": self._doc_lengths,
+                "doc_metadata": self._doc_metadata,
+            }
+            os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+            tmp_path = self.index_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.index_path)
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Fuse several ranked id lists into one, best first"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -1,65 +1,129 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import Dict, Any
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Dict, Any, List, Optional, Tuple
 import uvicorn
+import asyncio
 import json
 import os
-from graph import create_research_graph
-from vector_store import initialize_vector_store
+import uuid
+from graph import get_research_graph, run_blocking, wait_for_vectorstore, STAGE_TAG_PREFIX, REVIEWER_TAG_PREFIX, BLOB_CHANNELS
+from vector_store import start_vectorstore_warmup, get_vectorstore_warmup
+from model_registry import model_registry, get_context_token_budget
+from prompt_catalog import PromptCatalog
+from checkpointer import open_checkpointer, close_checkpointer, run_checkpoint_pruning
+from blob_store import state_blob_store
+from report_cache import ReportCache, CACHE_BYPASS, CACHE_MISS
 
 app = FastAPI(title="Equity Research Agent API with ChromaDB", version="1.0.0")
 
-# Initialize vector store on startup
-@app.on_event("startup")
-async def startup_event():
-    """Initialize the vector store when the API starts"""
-    print("🚀 Initializing Equity Research API with ChromaDB...")
+# Background warm-up: the server accepts traffic immediately while the embedding
+# model, vector store and chat model clients load. /ready reports when it is done.
+model_warmup_task = None
+vectorstore_warmup_task = None
+checkpoint_pruning_task = None
+
+async def warm_up_models():
+    """Build the chat model clients once so requests reuse their connection pools"""
+    try:
+        await run_blocking(model_registry.warm)
+        print("✅ Chat model clients initialized")
+    except Exception as e:
+        print(f"❌ Error initializing chat model clients: {e}")
+        # Kept on the task so /ready reports the failure
+        raise
+
+async def warm_up_vector_store():
+    """Wait for the vector store warm-up and report its outcome"""
     try:
-        vectorstore = initialize_vector_store()
-        stats = vectorstore.get_collection_stats()
+        vectorstore = await wait_for_vectorstore()
+        watch_vectorstore(vectorstore)
+        stats = await run_blocking(vectorstore.get_collection_stats)
         print(f"✅ Vector store initialized: {stats}")
     except Exception as e:
         print(f"❌ Error initializing vector store: {e}")
 
-# Load prompts data
-def load_prompts_data():
-    """Load the prompts configuration from JSON file"""
+@app.on_event("startup")
+async def startup_event():
+    """Start warming up the vector store and models without blocking startup"""
+    global model_warmup_task, vectorstore_warmup_task, checkpoint_pruning_task
+    print("🚀 Starting Equity Research API, warming up in the background...")
+    start_vectorstore_warmup()
+    vectorstore_warmup_task = asyncio.create_task(warm_up_vector_store())
+    model_warmup_task = asyncio.create_task(warm_up_models())
+    
+    # Durable thread state; opening it is quick, and the graph is compiled with it on first use
     try:
-        prompts_path = os.path.join(os.path.dirname(__file__), "Prompts.json")
-        with open(prompts_path, 'r') as f:
-            return json.load(f)
+        checkpointer = await open_checkpointer()
+        print(f"✅ Checkpointer initialized: {type(checkpointer).__name__}")
     except Exception as e:
-        print(f"Error loading prompts: {e}")
-        return []
+        print(f"❌ Error initializing checkpointer, falling back to in-memory state: {e}")
+        checkpointer = await open_checkpointer("memory")
+    checkpoint_pruning_task = asyncio.create_task(
+        run_checkpoint_pruning(checkpointer, blob_store=state_blob_store, blob_channels=BLOB_CHANNELS)
+    )
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop checkpoint pruning and close the checkpointer's connections"""
+    if checkpoint_pruning_task is not None:
+        checkpoint_pruning_task.cancel()
+    await close_checkpointer()
 
-PROMPTS_DATA = load_prompts_data()
+# Prompt catalog, indexed by (company, sector, report type) and reloaded when Prompts.json changes
+prompt_catalog = PromptCatalog(os.path.join(os.path.dirname(__file__), "Prompts.json"))
 
 def get_prompt_for_request(company_code: str, sector_code: str, report_type: str) -> str:
     """Get the specific prompt for the given parameters"""
-    # Search for matching prompt in the data
-    for prompt_config in PROMPTS_DATA:
-        if (prompt_config.get("CompanyCode") == company_code and 
-            prompt_config.get("SectorCode") == sector_code and 
-            prompt_config.get("ReportType") == report_type):
-            
-            prompt = prompt_config.get("Prompt", "No specific prompt found")
-            print(f"✅ Found matching prompt for {company_code}-{sector_code}-{report_type}")
-            return prompt
+    return prompt_catalog.get_prompt(company_code, sector_code, report_type)
+
+# Finished reports for repeated requests, keyed by request, prompt and research context
+report_cache = ReportCache(
+    ttl_seconds=float(os.getenv("REPORT_CACHE_TTL", "3600")),
+    max_size=int(os.getenv("REPORT_CACHE_SIZE", "512")),
+    semantic_threshold=float(os.getenv("REPORT_CACHE_SEMANTIC_THRESHOLD", "0"))
+)
+report_cache_watched_store = None
+
+def invalidate_cached_reports(company_codes):
+    """Drop cached reports for companies whose documents were just ingested or removed"""
+    dropped = report_cache.invalidate_companies(company_codes)
+    if dropped:
+        print(f"🧹 Invalidated {dropped} cached reports for {sorted(company_codes)}")
+
+def watch_vectorstore(vectorstore):
+    """Subscribe the report cache to document changes (once per vector store)"""
+    global report_cache_watched_store
+    if report_cache_watched_store is not vectorstore:
+        vectorstore.add_change_listener(invalidate_cached_reports)
+        report_cache_watched_store = vectorstore
+
+async def lookup_cached_report(company_code: str, sector_code: str, report_type: str,
+                               prompt: str) -> Tuple[tuple, Optional[List[float]], Optional[Dict[str, Any]], str]:
+    """Look a request up in the report cache; returns (key, prompt embedding, entry, cache status)"""
+    vectorstore = await wait_for_vectorstore()
+    watch_vectorstore(vectorstore)
     
-    # If no exact match found, return a generic prompt
-    generic_prompt = f"""You are an expert equity research analyst. Generate a comprehensive {report_type} 
-    for {company_code} in the {sector_code} sector. Provide professional analysis including company overview, 
-    financial performance, market position, risks, and investment recommendation."""
+    # Same retrieval the graph runs first; it is served from the context cache afterwards
+    context = ""
+    if company_code and company_code != "UNKNOWN":
+        packed = await run_blocking(vectorstore.get_packed_context, company_code, token_budget=get_context_token_budget())
+        context = packed["context"]
     
-    print(f"⚠️ No specific prompt found, using generic prompt for {company_code}-{sector_code}-{report_type}")
-    return generic_prompt
+    key = ReportCache.make_key(company_code, sector_code, report_type, prompt, context)
+    embedding = await run_blocking(vectorstore.embeddings.embed_query, prompt) if report_cache.semantic_enabled else None
+    entry, status = report_cache.get(key, embedding)
+    return key, embedding, entry, status
 
 # Pydantic models for request/response
 class ResearchRequest(BaseModel):
     company_code: str
     sector_code: str
     report_type: str
-    thread_id: str = "default"
+    # A fresh thread per request unless the client continues an existing one
+    thread_id: str = Field(default_factory=lambda: f"research-{uuid.uuid4().hex}")
+    # Set to false to always generate a new report
+    use_cache: bool = True
 
 class ResearchResponse(BaseModel):
     result: str
@@ -68,43 +132,86 @@ class ResearchResponse(BaseModel):
     report_type: str
     thread_id: str
     status: str
+    token_usage: Dict[str, Any] = {}
 
-# Initialize the graph
-research_graph = create_research_graph()
+class BatchResearchItem(BaseModel):
+    company_code: str
+    sector_code: str
+    report_type: str
+
+class BatchResearchRequest(BaseModel):
+    items: List[BatchResearchItem]
+    max_concurrency: int = 4
+    thread_id: str = Field(default_factory=lambda: f"batch-{uuid.uuid4().hex}")
+
+def build_graph_input(request: ResearchRequest) -> Dict[str, Any]:
+    """Build the initial graph state for a research request"""
+    specific_prompt = get_prompt_for_request(
+        request.company_code, 
+        request.sector_code, 
+        request.report_type
+    )
+    return {
+        "messages": [("user", specific_prompt)],
+        "company_code": request.company_code,
+        "sector_code": request.sector_code,
+        "report_type": request.report_type
+    }
+
+def extract_report(state: Dict[str, Any]) -> str:
+    """Pull the report out of a finished graph state"""
+    return state.get("final_report") or state.get("first_cut_report") or "No result generated"
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """Format one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 @app.get("/")
 async def root():
     return {"message": "Research Agent API is running!"}
 
 @app.post("/research", response_model=ResearchResponse)
-async def research_query(request: ResearchRequest):
+async def research_query(request: ResearchRequest, response: Response):
     """
-    Generate equity research report based on company, sector, and report type
+    Generate equity research report based on company, sector, and report type.
+    
+    Repeated requests are served from the report cache; the X-Cache header is
+    HIT, HIT-SEMANTIC, MISS or BYPASS (use_cache false).
     """
     try:
         config = {"configurable": {"thread_id": request.thread_id}}
+        graph_input = build_graph_input(request)
+        prompt = graph_input["messages"][0][1]
         
-        # Get the specific prompt for this request
-        specific_prompt = get_prompt_for_request(
-            request.company_code, 
-            request.sector_code, 
-            request.report_type
-        )
-          # Run the graph with the specific prompt and request parameters
+        cache_status = CACHE_BYPASS
+        if request.use_cache:
+            cache_key, prompt_embedding, cached, cache_status = await lookup_cached_report(
+                request.company_code, request.sector_code, request.report_type, prompt
+            )
+        response.headers["X-Cache"] = cache_status
+        if cache_status not in (CACHE_BYPASS, CACHE_MISS):
+            return ResearchResponse(
+                result=cached["result"],
+                company_code=request.company_code,
+                sector_code=request.sector_code,
+                report_type=request.report_type,
+                thread_id=request.thread_id,
+                status="success"
+            )
+        
+        # Run the graph with the specific prompt and request parameters
         final_result = None
+        token_usage = {}
         
-        # Use stream_mode="values" to get the final state values
-        for state in research_graph.stream(
-            {
-                "messages": [("user", specific_prompt)],
-                "company_code": request.company_code,
-                "sector_code": request.sector_code,
-                "report_type": request.report_type
-            }, 
+        # Use stream_mode="values" to get the final state values. The async API
+        # keeps the event loop free while the LLM and retrieval calls are running.
+        async for state in get_research_graph().astream(
+            graph_input, 
             config,
             stream_mode="values"
         ):
             print(f"DEBUG API: State keys: {list(state.keys())}")
+            token_usage = state.get("token_usage") or token_usage
             if "messages" in state:
                 messages = state["messages"]
                 print(f"DEBUG API: Found {len(messages)} total messages")
@@ -118,18 +225,177 @@ async def research_query(request: ResearchRequest):
                         final_result = msg.content
                         print(f"DEBUG API: Found AI message: {msg.content[:100]}...")
                         break
+        
+        if final_result and cache_status == CACHE_MISS:
+            report_cache.set(cache_key, final_result, token_usage, prompt_embedding)
         return ResearchResponse(
             result=final_result or "No result generated",
             company_code=request.company_code,
             sector_code=request.sector_code,
             report_type=request.report_type,
             thread_id=request.thread_id,
-            status="success"
+            status="success",
+            token_usage=token_usage
         )
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}")
 
+@app.post("/research/stream")
+async def research_stream(request: ResearchRequest):
+    """
+    Stream report tokens as Server-Sent Events while the workflow runs.
+    
+    Each `token` event carries the stage it belongs to (first_cut, feedback,
+    final), plus the reviewer for feedback tokens, since specialist reviewers
+    stream concurrently; a closing `done` event carries the finished report.
+    """
+    config = {"configurable": {"thread_id": request.thread_id}}
+    graph_input = build_graph_input(request)
+    done = {
+        "company_code": request.company_code,
+        "sector_code": request.sector_code,
+        "report_type": request.report_type,
+        "thread_id": request.thread_id,
+        "status": "success"
+    }
+    
+    cache_status = CACHE_BYPASS
+    if request.use_cache:
+        try:
+            cache_key, prompt_embedding, cached, cache_status = await lookup_cached_report(
+                request.company_code, request.sector_code, request.report_type, graph_input["messages"][0][1]
+            )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}")
+    
+    async def event_stream():
+        if cache_status not in (CACHE_BYPASS, CACHE_MISS):
+            # Cached report: no tokens to stream, just the finished result
+            yield format_sse("done", {"result": cached["result"], **done})
+            return
+        try:
+            async for event in get_research_graph().astream_events(graph_input, config, version="v1"):
+                if event["event"] != "on_chat_model_stream":
+                    continue
+                stage = next(
+                    (tag[len(STAGE_TAG_PREFIX):] for tag in event.get("tags", []) if tag.startswith(STAGE_TAG_PREFIX)),
+                    None
+                )
+                reviewer = next(
+                    (tag[len(REVIEWER_TAG_PREFIX):] for tag in event.get("tags", []) if tag.startswith(REVIEWER_TAG_PREFIX)),
+                    None
+                )
+                content = event["data"]["chunk"].content
+                if stage and content:
+                    token = {"stage": stage, "content": content}
+                    if reviewer:
+                        token["reviewer"] = reviewer
+                    yield format_sse("token", token)
+            
+            state = await get_research_graph().aget_state(config)
+            result = extract_report(state.values)
+            if cache_status == CACHE_MISS and (state.values.get("final_report") or state.values.get("first_cut_report")):
+                report_cache.set(cache_key, result, state.values.get("token_usage"), prompt_embedding)
+            yield format_sse("done", {"result": result, **done})
+        except Exception as e:
+            yield format_sse("error", {"detail": f"Error processing request: {str(e)}"})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Cache": cache_status}
+    )
+
+@app.post("/research/batch")
+async def research_batch(request: BatchResearchRequest):
+    """
+    Run many research requests concurrently and stream results as NDJSON.
+    
+    At most max_concurrency workflows run at once; LLM calls are further
+    throttled by the shared per-provider rate limiters. Retrieval runs once per
+    company up front and is then served from the context cache. One JSON line
+    is emitted per item as soon as it completes, in completion order.
+    """
+    if not request.items:
+        raise HTTPException(status_code=400, detail="At least one item is required")
+    
+    semaphore = asyncio.Semaphore(max(1, request.max_concurrency))
+    prompts = prompt_catalog.get_prompts(
+        [(item.company_code, item.sector_code, item.report_type) for item in request.items]
+    )
+    
+    async def warm_company_contexts():
+        vectorstore = await wait_for_vectorstore()
+        companies = {item.company_code for item in request.items if item.company_code and item.company_code != "UNKNOWN"}
+        await asyncio.gather(*[
+            run_blocking(vectorstore.get_packed_context, company_code, token_budget=get_context_token_budget())
+            for company_code in companies
+        ])
+    
+    async def run_item(index: int, item: BatchResearchItem, prompt: str) -> Dict[str, Any]:
+        thread_id = f"{request.thread_id}-{index}"
+        result = {
+            "index": index,
+            "company_code": item.company_code,
+            "sector_code": item.sector_code,
+            "report_type": item.report_type,
+            "thread_id": thread_id
+        }
+        try:
+            cache_key, prompt_embedding, cached, cache_status = await lookup_cached_report(
+                item.company_code, item.sector_code, item.report_type, prompt
+            )
+        except Exception as e:
+            cache_key, prompt_embedding, cached, cache_status = None, None, None, CACHE_BYPASS
+            print(f"⚠️ Report cache lookup failed for {item.company_code}: {e}")
+        result["cache"] = cache_status
+        if cached is not None:
+            result.update({"result": cached["result"], "token_usage": {}, "status": "success"})
+            return result
+        
+        async with semaphore:
+            try:
+                state = await get_research_graph().ainvoke(
+                    {
+                        "messages": [("user", prompt)],
+                        "company_code": item.company_code,
+                        "sector_code": item.sector_code,
+                        "report_type": item.report_type
+                    },
+                    {"configurable": {"thread_id": thread_id}}
+                )
+                result.update({
+                    "result": extract_report(state),
+                    "token_usage": state.get("token_usage") or {},
+                    "status": "success"
+                })
+                if cache_status == CACHE_MISS and (state.get("final_report") or state.get("first_cut_report")):
+                    report_cache.set(cache_key, result["result"], result["token_usage"], prompt_embedding)
+            except Exception as e:
+                result.update({"status": "error", "detail": f"Error processing request: {str(e)}"})
+        return result
+    
+    async def result_stream():
+        try:
+            await warm_company_contexts()
+        except Exception as e:
+            print(f"⚠️ Error pre-fetching company contexts: {e}")
+        
+        tasks = [
+            asyncio.ensure_future(run_item(index, item, prompt))
+            for index, (item, prompt) in enumerate(zip(request.items, prompts))
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield json.dumps(await next_done) + "\n"
+        finally:
+            # Client went away: stop the remaining workflows
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
 @app.post("/research-debug", response_model=dict)
 async def research_query_debug(request: ResearchRequest):
     """
@@ -139,8 +405,8 @@ async def research_query_debug(request: ResearchRequest):
         config = {"configurable": {"thread_id": request.thread_id}}
         
         events = []
-        for event in research_graph.stream(
-            {"messages": [("user", request.query)]}, 
+        async for event in get_research_graph().astream(
+            build_graph_input(request), 
             config
         ):
             # Convert event to serializable format
@@ -171,51 +437,108 @@ async def research_query_debug(request: ResearchRequest):
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/ready")
+async def readiness_check():
+    """
+    Readiness probe: 200 once the vector store and model clients are warmed up.
+    
+    Returns 503 while warm-up is running or after it failed, so load balancers
+    only route traffic to workers that can serve requests without waiting.
+    """
+    vectorstore_future = get_vectorstore_warmup()
+    components = {
+        "vector_store": "warming_up" if vectorstore_future is None or not vectorstore_future.done()
+            else "failed" if vectorstore_future.exception() is not None else "ready",
+        "models": "warming_up" if model_warmup_task is None or not model_warmup_task.done()
+            else "failed" if model_warmup_task.exception() is not None else "ready"
+    }
+    if all(status == "ready" for status in components.values()):
+        return {"status": "ready", "components": components}
+    
+    content = {"status": "not_ready", "components": components}
+    errors = []
+    if components["vector_store"] == "failed":
+        errors.append(f"vector_store: {vectorstore_future.exception()}")
+    if components["models"] == "failed":
+        errors.append(f"models: {model_warmup_task.exception()}")
+    if errors:
+        content["detail"] = "; ".join(errors)
+    return JSONResponse(status_code=503, content=content)
+
 @app.get("/vectorstore/status")
 async def vectorstore_status():
     """Get the status of the vector store"""
     try:
-        from vector_store import get_research_vectorstore
-        vectorstore = get_research_vectorstore()
-        stats = vectorstore.get_collection_stats()
+        warmup = get_vectorstore_warmup()
+        if warmup is None or not warmup.done():
+            return {"status": "warming_up"}
+        vectorstore = warmup.result()
+        stats = await run_blocking(vectorstore.get_collection_stats)
         return {
             "status": "active",
-            "stats": stats
+            "stats": stats,
+            "context_cache": vectorstore.context_cache.get_stats(),
+            "report_cache": report_cache.get_stats()
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting vector store status: {str(e)}")
 
 @app.post("/vectorstore/search")
 async def search_vectorstore(request: dict):
-    """Search the vector store for relevant documents"""
+    """
+    Search the vector store for relevant documents.
+    
+    Accepts a single "query" or a list of "queries" (embedded together in one
+    call), plus optional "company_code", "k", "search_type" ("similarity" or
+    "mmr"), "score_threshold", "fetch_k", "lambda_mult" and "filters"
+    (company_code, document_type, date_from, date_to).
+    """
     try:
-        from vector_store import get_research_vectorstore
-        
         query = request.get("query", "")
+        queries = request.get("queries") or ([query] if query else [])
         company_code = request.get("company_code", None)
         k = request.get("k", 5)
         
-        if not query:
+        if not queries:
             raise HTTPException(status_code=400, detail="Query is required")
         
-        vectorstore = get_research_vectorstore()
-        docs = vectorstore.search_similar_documents(query, company_code, k)
+        vectorstore = await wait_for_vectorstore()
+        batch_results = await run_blocking(
+            vectorstore.search_documents_batch,
+            queries,
+            company_code,
+            k,
+            filters=request.get("filters"),
+            search_type=request.get("search_type", "similarity"),
+            score_threshold=request.get("score_threshold"),
+            fetch_k=request.get("fetch_k", 20),
+            lambda_mult=request.get("lambda_mult", 0.5)
+        )
         
-        results = []
-        for doc in docs:
-            results.append({
-                "content": doc.page_content,
-                "metadata": doc.metadata,
-                "score": getattr(doc, 'score', None)
+        responses = []
+        for query_text, docs in zip(queries, batch_results):
+            results = []
+            for doc, score in docs:
+                results.append({
+                    "content": doc.page_content,
+                    "metadata": doc.metadata,
+                    "score": score
+                })
+            responses.append({
+                "query": query_text,
+                "company_code": company_code,
+                "results_count": len(results),
+                "results": results
             })
         
-        return {
-            "query": query,
-            "company_code": company_code,
-            "results_count": len(results),
-            "results": results
-        }
+        if "queries" in request:
+            return {"queries": responses}
+        return responses[0]
     
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error searching vector store: {str(e)}")
 
@@ -0,0 +1,144 @@
+import re
+from langchain_core.documents import Document
+from context_packer import estimate_tokens
+from typing import Any, Dict, List, Tuple
+
+HEADING_PATTERN = re.compile(r"^(#{1,6})[ \t]+(.+?)[ \t#]*$")
+
+def _tokens(text: str) -> int:
+    """Token estimate that does not count the CR of CRLF line endings"""
+    return estimate_tokens(text.replace("\r\n", "\n"))
+
+class _Section:
+    def __init__(self, level: int, heading: str, start: int):
+        self.level = level
+        self.heading = heading
+        self.start = start
+        self.end = start
+        self.children = []
+
+class MarkdownSectionChunker:
+    """
+    Splits Markdown research documents along their heading structure.
+
+    A section (with its sub-sections) becomes a single chunk when it fits in
+    max_tokens; otherwise its own text and each sub-section are chunked
+    separately. Only sections that are still too large on their own are split
+    further, at paragraph boundaries. Sections never overlap, so no text is
+    embedded twice. Each chunk records its heading, its section path, the
+    top-level section it belongs to and its byte offsets in the source file;
+    for those to be right the text must keep the file's line endings (read it
+    with newline=""). Chunk text itself always uses LF line endings.
+    """
+
+    def __init__(self, max_tokens: int = 400, max_heading_level: int = 3):
+        self.max_tokens = max_tokens
+        self.max_heading_level = max_heading_level
+
+    def split_documents(self, documents: List[Document]) -> List[Document]:
+        chunks = []
+        for document in documents:
+            for piece in self.split_text(document.page_content):
+                metadata = dict(document.metadata)
+                metadata.update(piece["metadata"])
+                chunks.append(Document(page_content=piece["text"], metadata=metadata))
+        return chunks
+
+    def split_text(self, text: str) -> List[Dict[str, Any]]:
+        root = self._parse(text)
+        spans = []
+        self._chunk_section(text, root, [], spans)
+
+        pieces = []
+        for start, end, path in spans:
+            headings = [heading for _, heading in path]
+            # The top-level section is the "##" ancestor, or the outermost heading
+            section = next((heading for level, heading in path if level == 2), headings[0] if headings else "")
+            raw = text[start:end]
+            stripped = raw.strip()
+            if not stripped:
+                continue
+            start += len(raw) - len(raw.lstrip())
+            end = start + len(stripped)
+            # Offsets are in bytes of the UTF-8 encoded file
+            byte_start = len(text[:start].encode("utf-8"))
+            byte_end = byte_start + len(stripped.encode("utf-8"))
+            pieces.append({
+                "text": stripped.replace("\r\n", "\n"),
+                "metadata": {
+                    "heading": headings[-1] if headings else "",
+                    "section_path": " > ".join(headings),
+                    "section": section,
+                    "byte_start": byte_start,
+                    "byte_end": byte_end,
+                },
+            })
+        return pieces
+
+    def _parse(self, text: str) -> _Section:
+        """Build the heading tree, with character offsets for each section"""
+        root = _Section(0, "", 0)
+        root.end = len(text)
+        stack = [root]
+        in_code_block = False
+        offset = 0
+
+        for line in text.splitlines(keepends=True):
+            stripped = line.strip()
+            if stripped.startswith("```"):
+                in_code_block = not in_code_block
+            match = None if in_code_block else HEADING_PATTERN.match(stripped)
+            if match and len(match.group(1)) <= self.max_heading_level:
+                level = len(match.group(1))
+                while stack[-1].level >= level:
+                    stack.pop().end = offset
+                section = _Section(level, match.group(2), offset)
+                stack[-1].children.append(section)
+                stack.append(section)
+            offset += len(line)
+
+        while len(stack) > 1:
+            stack.pop().end = offset
+        return root
+
+    def _chunk_section(self, text: str, section: _Section, parent_path: List[Tuple[int, str]], spans: List):
+        path = parent_path + [(section.level, section.heading)] if section.heading else parent_path
+        if _tokens(text[section.start:section.end].strip()) <= self.max_tokens:
+            spans.append((section.start, section.end, path))
+            return
+
+        body_end = section.children[0].start if section.children else section.end
+        if self._has_body(text[section.start:body_end], section):
+            self._split_body(text, section.start, body_end, path, spans)
+        for child in section.children:
+            self._chunk_section(text, child, path, spans)
+
+    @staticmethod
+    def _has_body(body: str, section: _Section) -> bool:
+        """False when the text before the first sub-section is only the heading line"""
+        if section.heading:
+            body = body.split("\n", 1)[1] if "\n" in body else ""
+        return bool(body.strip())
+
+    def _split_body(self, text: str, start: int, end: int, path: List[Tuple[int, str]], spans: List):
+        """Pack paragraphs of an oversized section into chunks, hard-splitting huge paragraphs"""
+        max_chars = self.max_tokens * 4
+        boundaries = [start]
+        for match in re.finditer(r"\n\s*\n", text[start:end]):
+            boundaries.append(start + match.end())
+        boundaries.append(end)
+
+        chunk_start = start
+        for paragraph_start, paragraph_end in zip(boundaries, boundaries[1:]):
+            if paragraph_start > chunk_start and _tokens(text[chunk_start:paragraph_end]) > self.max_tokens:
+                spans.append((chunk_start, paragraph_start, path))
+                chunk_start = paragraph_start
+            while paragraph_end - chunk_start > max_chars:
+                # A single paragraph larger than the limit; cut at a line break if possible
+                cut = text.rfind("\n", chunk_start + 1, chunk_start + max_chars)
+                if cut <= chunk_start:
+                    cut = chunk_start + max_chars
+                spans.append((chunk_start, cut, path))
+                chunk_start = cut
+        if chunk_start < end:
+            spans.append((chunk_start, end, path))
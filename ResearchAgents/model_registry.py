@@ -0,0 +1,108 @@
+import os
+import threading
+from langchain.chat_models import init_chat_model
+from typing import Any, Dict, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = os.getenv("LLM_MODEL", "groq:llama3-8b-8192")
+DEFAULT_MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS")) if os.getenv("LLM_MAX_TOKENS") else None
+
+# Token budget for the retrieved research context, per model. The context is
+# shared by every role's prompt, so the smallest budget among the roles wins.
+CONTEXT_TOKEN_BUDGETS = {
+    "groq:llama3-8b-8192": 1500,
+}
+DEFAULT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+
+# Model settings for each role in the research workflow
+ROLE_SPECS = {
+    "junior_analyst": {"model": DEFAULT_MODEL, "temperature": 0.7, "max_tokens": DEFAULT_MAX_TOKENS},
+    # Lower temperature for more consistent feedback
+    "senior_analyst": {"model": DEFAULT_MODEL, "temperature": 0.3, "max_tokens": DEFAULT_MAX_TOKENS},
+}
+
+class ModelRegistry:
+    """
+    Builds each chat model client once and hands it out by role.
+
+    Clients are keyed by (provider, model, temperature, max_tokens), so roles
+    with identical settings share one client and its HTTP connection pool.
+    Roles can be pointed at a prebuilt model (e.g. a fake model in benchmarks)
+    with register().
+    """
+
+    def __init__(self, role_specs: Dict[str, Dict[str, Any]] = None):
+        self.role_specs = dict(role_specs or ROLE_SPECS)
+        self._clients = {}
+        self._overrides = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(spec: Dict[str, Any]) -> Tuple[str, str, float, Optional[int]]:
+        provider, _, model = spec["model"].partition(":")
+        return (provider, model, spec.get("temperature", 0.0), spec.get("max_tokens"))
+
+    def register(self, role: str, model):
+        """Serve a prebuilt chat model for role instead of building one"""
+        with self._lock:
+            self._overrides[role] = model
+
+    def get(self, role: str):
+        """Return the shared chat model client for role"""
+        override = self._overrides.get(role)
+        if override is not None:
+            return override
+
+        spec = self.role_specs[role]
+        key = self._key(spec)
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    provider, model, temperature, max_tokens = key
+                    kwargs = {"temperature": temperature}
+                    if max_tokens is not None:
+                        kwargs["max_tokens"] = max_tokens
+                    client = init_chat_model(f"{provider}:{model}", **kwargs)
+                    self._clients[key] = client
+                    logger.info(f"Built chat model client {key} for role {role}")
+        return client
+
+    def provider_for(self, role: str) -> Optional[str]:
+        """Provider serving role, or None when role uses a registered prebuilt model"""
+        if role in self._overrides:
+            return None
+        return self._key(self.role_specs[role])[0]
+
+    def context_token_budget(self) -> int:
+        """Token budget for the research context that fits every role's model"""
+        return min(
+            CONTEXT_TOKEN_BUDGETS.get(spec["model"], DEFAULT_CONTEXT_TOKEN_BUDGET)
+            for spec in self.role_specs.values()
+        )
+
+    def warm(self):
+        """Build the clients for every role up front"""
+        for role in self.role_specs:
+            self.get(role)
+
+# Global instance
+model_registry = ModelRegistry()
+
+def _registry_from_config(config: Dict[str, Any] = None) -> ModelRegistry:
+    return (config or {}).get("configurable", {}).get("model_registry") or model_registry
+
+def get_model_for_role(role: str, config: Dict[str, Any] = None):
+    """Resolve the chat model for a workflow role, honouring a registry in the run config"""
+    return _registry_from_config(config).get(role)
+
+def get_provider_for_role(role: str, config: Dict[str, Any] = None) -> Optional[str]:
+    """Resolve the provider behind a workflow role, for rate limiting"""
+    return _registry_from_config(config).provider_for(role)
+
+def get_context_token_budget(config: Dict[str, Any] = None) -> int:
+    """Resolve the research context token budget for the models in use"""
+    return _registry_from_config(config).context_token_budget()
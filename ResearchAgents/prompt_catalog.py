@@ -0,0 +1,106 @@
+import os
+import json
+import time
+import threading
+from typing import Dict, Iterable, List, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# CompanyCode/SectorCode value marking a sector-level or global prompt entry
+WILDCARD = "*"
+
+GENERIC_PROMPT = """You are an expert equity research analyst. Generate a comprehensive {report_type}
+    for {company_code} in the {sector_code} sector. Provide professional analysis including company overview,
+    financial performance, market position, risks, and investment recommendation."""
+
+class PromptCatalog:
+    """
+    Indexed view of Prompts.json.
+
+    Prompts are looked up by (CompanyCode, SectorCode, ReportType). Entries
+    with CompanyCode "*" act as sector-level defaults, and entries with both
+    CompanyCode and SectorCode "*" as global defaults for a report type; if
+    nothing matches the generic prompt is used. Fallback prompts may use the
+    {company_code}, {sector_code} and {report_type} placeholders. Entries
+    missing any of the three keys are skipped, and for duplicate keys the
+    first entry in the file wins.
+
+    The file is re-read when its modification time changes, checked at most
+    once every reload_interval seconds.
+    """
+
+    def __init__(self, prompts_path: str, reload_interval: float = 2.0):
+        self.prompts_path = prompts_path
+        self.reload_interval = reload_interval
+        self._index = {}
+        self._mtime = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self._reload_if_changed(force=True)
+
+    def _reload_if_changed(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._last_check < self.reload_interval:
+            return
+        with self._lock:
+            self._last_check = now
+            try:
+                mtime = os.path.getmtime(self.prompts_path)
+            except OSError as e:
+                logger.error(f"Error reading prompts file {self.prompts_path}: {e}")
+                return
+            if mtime == self._mtime:
+                return
+            try:
+                with open(self.prompts_path, 'r', encoding="utf-8") as f:
+                    entries = json.load(f)
+            except Exception as e:
+                # Keep serving the previous index if the file is mid-edit or invalid
+                logger.error(f"Error loading prompts: {e}")
+                return
+
+            index = {}
+            for position, entry in enumerate(entries):
+                key = (entry.get("CompanyCode"), entry.get("SectorCode"), entry.get("ReportType"))
+                if not all(key):
+                    # Wildcards must be spelled "*"; a missing key never matched before either
+                    logger.warning(f"Skipping prompt entry {position} with missing CompanyCode, SectorCode or ReportType")
+                    continue
+                if key in index:
+                    # First match wins, as with the original linear search
+                    logger.warning(f"Ignoring duplicate prompt entry {position} for {'-'.join(key)}")
+                    continue
+                index[key] = entry.get("Prompt", "No specific prompt found")
+
+            self._index = index
+            self._mtime = mtime
+            logger.info(f"Loaded {len(index)} prompts from {self.prompts_path}")
+
+    def get_prompt(self, company_code: str, sector_code: str, report_type: str) -> str:
+        """Get the most specific prompt for the given parameters"""
+        self._reload_if_changed()
+        return self._lookup(self._index, company_code, sector_code, report_type)
+
+    def get_prompts(self, requests: Iterable[Tuple[str, str, str]]) -> List[str]:
+        """Bulk lookup of (company_code, sector_code, report_type) tuples"""
+        self._reload_if_changed()
+        index = self._index
+        return [self._lookup(index, *request) for request in requests]
+
+    @staticmethod
+    def _lookup(index: Dict[Tuple[str, str, str], str], company_code: str, sector_code: str, report_type: str) -> str:
+        prompt = index.get((company_code, sector_code, report_type))
+        if prompt is not None:
+            return prompt
+
+        template = (index.get((WILDCARD, sector_code, report_type))
+                    or index.get((WILDCARD, WILDCARD, report_type))
+                    or GENERIC_PROMPT)
+        return (template
+                .replace("{company_code}", company_code)
+                .replace("{sector_code}", sector_code)
+                .replace("{report_type}", report_type))
+
+    def __len__(self) -> int:
+        return len(self._index)
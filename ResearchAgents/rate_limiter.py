@@ -0,0 +1,53 @@
+import os
+import time
+import asyncio
+from typing import Dict
+import logging
+
+logger = logging.getLogger(__name__)
+
+class AsyncTokenBucket:
+    """
+    Async token-bucket rate limiter: allows `burst` calls at once and refills
+    at `rate_per_minute` tokens per minute.
+    """
+
+    def __init__(self, rate_per_minute: float, burst: int = 1):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate_per_second)
+        self._updated = now
+
+    async def acquire(self):
+        """Wait until a token is available and take it"""
+        # The lock makes waiters queue up in arrival order
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate_per_second)
+                self._refill()
+            self._tokens -= 1
+
+# One limiter per LLM provider, shared by every request in the process
+_provider_limiters: Dict[str, AsyncTokenBucket] = {}
+
+def get_provider_limiter(provider: str) -> AsyncTokenBucket:
+    """
+    Get the shared limiter for a provider, configured from
+    <PROVIDER>_REQUESTS_PER_MINUTE and <PROVIDER>_BURST
+    """
+    limiter = _provider_limiters.get(provider)
+    if limiter is None:
+        prefix = provider.upper()
+        rate = float(os.getenv(f"{prefix}_REQUESTS_PER_MINUTE", "30"))
+        burst = int(os.getenv(f"{prefix}_BURST", "5"))
+        limiter = AsyncTokenBucket(rate, burst)
+        _provider_limiters[provider] = limiter
+        logger.info(f"Rate limiting {provider} to {rate} requests/minute (burst {burst})")
+    return limiter
@@ -0,0 +1,124 @@
+import time
+import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+CACHE_HIT = "HIT"
+CACHE_SEMANTIC_HIT = "HIT-SEMANTIC"
+CACHE_MISS = "MISS"
+CACHE_BYPASS = "BYPASS"
+
+def _hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class ReportCache:
+    """
+    TTL cache of finished research reports.
+
+    Reports are keyed by (company, sector, report type, prompt hash, retrieval
+    context hash), so a changed prompt or new research context never serves a
+    stale report. With a semantic threshold set, a request whose prompt
+    embedding is close enough to a cached one for the same company, sector,
+    report type and context reuses that report. Entries for a company are
+    dropped when the vector store ingests documents for it.
+    """
+
+    def __init__(self, ttl_seconds: float = 3600.0, max_size: int = 512, semantic_threshold: float = 0.0):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        # Cosine similarity needed for a semantic hit; 0 disables the semantic tier
+        self.semantic_threshold = semantic_threshold
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires_at, entry)
+        self._lock = threading.Lock()
+
+    @property
+    def semantic_enabled(self) -> bool:
+        return self.semantic_threshold > 0
+
+    @staticmethod
+    def make_key(company_code: str, sector_code: str, report_type: str, prompt: str, context: str) -> Tuple[str, ...]:
+        return (company_code, sector_code, report_type, _hash(prompt), _hash(context))
+
+    def get(self, key: Tuple[str, ...], prompt_embedding: Optional[List[float]] = None) -> Tuple[Optional[Dict[str, Any]], str]:
+        """Return (entry, cache status) for key, falling back to a semantic match"""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            item = self._entries.get(key)
+            if item is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return item[1], CACHE_HIT
+
+            if self.semantic_enabled and prompt_embedding is not None:
+                best_key, best_score = None, self.semantic_threshold
+                query = np.asarray(prompt_embedding, dtype=np.float32)
+                for other_key, (_, entry) in self._entries.items():
+                    # Same request tuple and context; only the prompt may differ
+                    if other_key[:3] != key[:3] or other_key[4] != key[4] or entry["prompt_embedding"] is None:
+                        continue
+                    score = self._cosine(query, entry["prompt_embedding"])
+                    if score >= best_score:
+                        best_key, best_score = other_key, score
+                if best_key is not None:
+                    self._entries.move_to_end(best_key)
+                    self.semantic_hits += 1
+                    return self._entries[best_key][1], CACHE_SEMANTIC_HIT
+
+            self.misses += 1
+            return None, CACHE_MISS
+
+    def set(self, key: Tuple[str, ...], result: str, token_usage: Dict[str, Any] = None,
+            prompt_embedding: Optional[List[float]] = None):
+        """Cache a finished report"""
+        entry = {
+            "result": result,
+            "token_usage": token_usage or {},
+            "prompt_embedding": np.asarray(prompt_embedding, dtype=np.float32) if prompt_embedding is not None else None,
+            "created_at": time.time(),
+        }
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, entry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate_companies(self, company_codes: Iterable[str]) -> int:
+        """Drop every cached report for the given companies; returns how many"""
+        company_codes = set(company_codes)
+        with self._lock:
+            stale = [key for key in self._entries if key[0] in company_codes]
+            for key in stale:
+                del self._entries[key]
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "semantic_threshold": self.semantic_threshold,
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+            }
+
+    def _evict_expired(self, now: float):
+        expired = [key for key, (expires_at, _) in self._entries.items() if expires_at <= now]
+        for key in expired:
+            del self._entries[key]
+
+    @staticmethod
+    def _cosine(left: np.ndarray, right: np.ndarray) -> float:
+        denominator = float(np.linalg.norm(left) * np.linalg.norm(right))
+        return float(left @ right) / denominator if denominator else 0.0
@@ -0,0 +1,81 @@
+import asyncio
+import os
+import threading
+import time
+
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.checkpoint.memory import MemorySaver
+
+import checkpointer
+from blob_store import BlobStore
+
+def test_concurrent_puts_of_the_same_text(tmp_path):
+    store = BlobStore(str(tmp_path))
+    texts = [f"context {i} " * 10000 for i in range(50)]
+    barrier = threading.Barrier(8)
+    errors = []
+
+    def put():
+        for text in texts:
+            # All threads store each text at the same moment
+            barrier.wait()
+            try:
+                store.put(text)
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=put) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    for text in texts:
+        blob_id = store.put(text)
+        assert BlobStore(str(tmp_path)).get(blob_id) == text
+    # No temp files left behind
+    assert all(name.endswith(".txt") for _, _, names in os.walk(tmp_path) for name in names)
+
+def age(store, blob_id, seconds):
+    old = time.time() - seconds
+    os.utime(store._path(blob_id), (old, old))
+
+def test_collect_garbage_keeps_live_and_recent_blobs(tmp_path):
+    store = BlobStore(str(tmp_path))
+    live, dead, recent = store.put("live"), store.put("dead"), store.put("recent")
+    age(store, live, 7200)
+    age(store, dead, 7200)
+
+    assert store.collect_garbage({live}, min_age_seconds=3600) == 1
+    assert not os.path.exists(store._path(dead))
+    assert store.get(live) == "live" and store.get(recent) == "recent"
+
+    # Storing the same text again makes the blob recent
+    age(store, live, 7200)
+    store.put("live")
+    assert store.collect_garbage(set(), min_age_seconds=3600) == 0
+
+def test_pruning_removes_blobs_of_deleted_threads(tmp_path):
+    store = BlobStore(str(tmp_path))
+    kept, pruned = store.put("kept context"), store.put("pruned context")
+    age(store, kept, 7200)
+    age(store, pruned, 7200)
+
+    async def put_checkpoint(saver, thread_id, created_at, context_ref):
+        checkpoint = empty_checkpoint()
+        checkpoint["id"] = checkpointer.checkpoint_id_at(created_at)
+        checkpoint["channel_values"] = {"context_ref": context_ref}
+        checkpoint["channel_versions"] = {"context_ref": 1}
+        config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+        await saver.aput(config, checkpoint, {}, {"context_ref": 1})
+
+    async def main():
+        saver = MemorySaver()
+        await put_checkpoint(saver, "old", time.time() - 2 * 86400, pruned)
+        await put_checkpoint(saver, "new", time.time(), kept)
+        return await checkpointer.prune_checkpoints(saver, 86400, store, ("context_ref",))
+
+    assert asyncio.run(main()) == 1
+    assert os.path.exists(store._path(kept))
+    assert not os.path.exists(store._path(pruned))
@@ -0,0 +1,117 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+
+import pytest
+from langgraph.checkpoint.base import BaseCheckpointSaver, empty_checkpoint
+from langgraph.checkpoint.base.id import uuid6
+from langgraph.checkpoint.memory import MemorySaver
+
+import checkpointer
+
+def test_checkpoint_id_at_orders_like_checkpoint_ids():
+    now = time.time()
+    assert checkpointer.checkpoint_id_at(now - 1) < str(uuid6()) < checkpointer.checkpoint_id_at(now + 1)
+    assert checkpointer.checkpoint_id_at(now - 3600) < checkpointer.checkpoint_id_at(now)
+
+async def put_checkpoint(saver, thread_id, created_at):
+    checkpoint = empty_checkpoint()
+    checkpoint["id"] = checkpointer.checkpoint_id_at(created_at)
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    await saver.aput(config, checkpoint, {}, {})
+
+async def prune_threads(saver):
+    now = time.time()
+    await put_checkpoint(saver, "old", now - 7200)
+    await put_checkpoint(saver, "active", now - 7200)
+    await put_checkpoint(saver, "active", now - 60)
+    await put_checkpoint(saver, "new", now - 60)
+
+    pruned = await checkpointer.prune_checkpoints(saver, 3600)
+    remaining = {
+        thread_id: await saver.aget_tuple({"configurable": {"thread_id": thread_id}}) is not None
+        for thread_id in ("old", "active", "new")
+    }
+    return pruned, remaining
+
+def test_prune_deletes_only_threads_without_recent_checkpoints():
+    pruned, remaining = asyncio.run(prune_threads(MemorySaver()))
+    assert pruned == 1
+    assert remaining == {"old": False, "active": True, "new": True}
+
+def test_prune_with_pooled_sqlite_saver(tmp_path):
+    async def main():
+        saver = checkpointer.PooledSqliteSaver(str(tmp_path / "checkpoints.sqlite"), pool_size=2)
+        await saver.open()
+        try:
+            return await prune_threads(saver)
+        finally:
+            await saver.close()
+
+    pruned, remaining = asyncio.run(main())
+    assert pruned == 1
+    assert remaining == {"old": False, "active": True, "new": True}
+
+class FakePostgresConnection:
+    """Just enough of a psycopg connection for the SQL the pruning issues"""
+
+    def __init__(self, tables):
+        self.tables = tables
+        self.statements = []
+
+    async def execute(self, query, params):
+        self.statements.append(query)
+        if query.startswith("SELECT"):
+            latest = {}
+            for thread_id, checkpoint_id in self.tables["checkpoints"]:
+                latest[thread_id] = max(latest.get(thread_id, ""), checkpoint_id)
+            rows = [{"thread_id": thread_id} for thread_id, newest in latest.items() if newest < params[0]]
+            return type("Cursor", (), {"fetchall": staticmethod(lambda: asyncio.sleep(0, rows))})()
+        table = query.split()[2]
+        self.tables[table] = [row for row in self.tables[table] if row[0] not in params[0]]
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+class FakePostgresPool:
+    def __init__(self, tables):
+        self.conn = FakePostgresConnection(tables)
+
+    @asynccontextmanager
+    async def connection(self):
+        yield self.conn
+
+def test_prune_deletes_postgres_rows_directly():
+    now = time.time()
+    old, new = checkpointer.checkpoint_id_at(now - 7200), checkpointer.checkpoint_id_at(now - 60)
+    tables = {
+        "checkpoints": [("old", old), ("active", old), ("active", new)],
+        "checkpoint_blobs": [("old", "messages"), ("active", "messages")],
+        "checkpoint_writes": [("old", old), ("active", new)],
+    }
+    saver = type("PostgresSaver", (BaseCheckpointSaver,), {})()
+    saver.conn = FakePostgresPool(tables)
+
+    assert asyncio.run(checkpointer.prune_checkpoints(saver, 3600)) == 1
+    assert tables == {
+        "checkpoints": [("active", old), ("active", new)],
+        "checkpoint_blobs": [("active", "messages")],
+        "checkpoint_writes": [("active", new)],
+    }
+
+@pytest.mark.skipif(not os.getenv("CHECKPOINT_TEST_POSTGRES_URL"), reason="needs CHECKPOINT_TEST_POSTGRES_URL")
+def test_prune_with_postgres_saver():
+    async def main():
+        saver = await checkpointer._open_postgres_saver(os.environ["CHECKPOINT_TEST_POSTGRES_URL"], 2)
+        try:
+            # Left over from an earlier run against the same database
+            await checkpointer._delete_threads(saver, ["old", "active", "new"])
+            return await prune_threads(saver)
+        finally:
+            await saver.conn.close()
+
+    pruned, remaining = asyncio.run(main())
+    assert pruned >= 1
+    assert remaining == {"old": False, "active": True, "new": True}
@@ -0,0 +1,47 @@
+from langchain_core.documents import Document
+
+from context_packer import ContextPacker, estimate_tokens
+
+def doc(text, source="report.md"):
+    return Document(page_content=text, metadata={"source": source})
+
+def test_splitter_overlap_with_same_source_is_trimmed():
+    shared = "Operating margin expanded to 31 percent in FY24."
+    first = "Revenue grew 8 percent on services strength. " + shared
+    second = shared + " Guidance for FY25 calls for low single digit growth."
+
+    packed = ContextPacker(token_budget=1000).pack([doc(first), doc(second)])
+    assert packed["context"].count(shared) == 1
+    assert packed["chunks_used"] == 2
+    assert packed["context"].endswith("Guidance for FY25 calls for low single digit growth.")
+
+def test_overlap_is_kept_across_sources():
+    shared = "Operating margin expanded to 31 percent in FY24."
+    packed = ContextPacker(token_budget=1000).pack([
+        doc("Revenue grew 8 percent. " + shared, "a.md"),
+        doc(shared + " Guidance was raised.", "b.md"),
+    ])
+    assert packed["context"].count(shared) == 2
+
+def test_near_duplicates_and_empty_chunks_are_dropped():
+    text = "The company repurchased 90 billion dollars of shares and raised the dividend by four percent this year"
+    packed = ContextPacker(token_budget=1000).pack([
+        doc(text, "a.md"),
+        doc(text + " again", "b.md"),
+        doc("   ", "c.md"),
+    ])
+    assert packed["chunks_used"] == 1 and packed["chunks_dropped"] == 1
+
+def test_chunks_over_budget_are_skipped_for_smaller_ones():
+    large = "word " * 200
+    small = "Net cash stood at 50 billion dollars."
+    packed = ContextPacker(token_budget=40).pack([doc(large, "a.md"), doc(small, "b.md")])
+
+    assert packed["context"] == f"Context 1:\n{small}"
+    assert packed["chunks_dropped"] == 1
+    assert packed["tokens_used"] == estimate_tokens(packed["context"]) <= 40
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abc") == 1
+    assert estimate_tokens("a" * 400) == 100
@@ -0,0 +1,83 @@
+import os
+
+from langchain_core.embeddings import Embeddings
+
+from embedding_cache import CachedEmbeddings
+
+class CountingEmbeddings(Embeddings):
+    def __init__(self):
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += len(texts)
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+def make_cache(directory, embeddings=None):
+    return CachedEmbeddings(embeddings or CountingEmbeddings(), "test-model", str(directory))
+
+def test_cached_vectors_survive_reload(tmp_path):
+    embeddings = CountingEmbeddings()
+    cache = make_cache(tmp_path, embeddings)
+    assert cache.embed_documents(["alpha", "beta gamma"]) == [[5.0, 1.0], [10.0, 1.0]]
+
+    reloaded = make_cache(tmp_path, embeddings)
+    assert reloaded.embed_documents(["alpha", "beta  gamma"]) == [[5.0, 1.0], [10.0, 1.0]]
+    assert embeddings.calls == 2
+
+def test_instances_sharing_a_directory_keep_rows_aligned(tmp_path):
+    first = make_cache(tmp_path)
+    second = make_cache(tmp_path)
+
+    first.store(["a"], [[5.0, 1.0]])
+    # second has not seen first's row; it must not reuse row 0
+    second.store(["b"], [[24.0, 1.0]])
+    first.store(["c"], [[7.0, 1.0]])
+    second.store(["d", "a"], [[9.0, 1.0], [99.0, 99.0]])
+
+    expected = [[5.0, 1.0], [24.0, 1.0], [7.0, 1.0], [9.0, 1.0]]
+    assert make_cache(tmp_path).lookup(["a", "b", "c", "d"]) == expected
+    assert first.lookup(["a", "b", "c", "d"]) == expected
+    assert second.lookup(["a", "b", "c", "d"]) == expected
+
+def test_torn_trailing_row_is_dropped(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.store(["a"], [[5.0, 1.0]])
+    with open(cache.vectors_path, "ab") as f:
+        f.write(b"\x00\x00")
+
+    cache.store(["b"], [[24.0, 1.0]])
+    assert make_cache(tmp_path).lookup(["a", "b"]) == [[5.0, 1.0], [24.0, 1.0]]
+
+def test_torn_index_lines_are_skipped(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.store(["a"], [[5.0, 1.0]])
+    key = cache._key("lost")
+    # Writers that died partway through a line; the next writer completes the line
+    for i, torn in enumerate((f"{key}\t1\t", f"{key}\t1", f"{key}", "\xff\xfe garbage")):
+        with open(cache.index_path, "a", encoding="utf-8") as f:
+            f.write(torn)
+        cache.store([f"after {i}"], [[7.0, float(i)]])
+
+    reloaded = make_cache(tmp_path)
+    assert reloaded.lookup(["a", "lost", "after 3"]) == [[5.0, 1.0], None, [7.0, 3.0]]
+    assert reloaded.get_stats()["entries"] == 5
+
+def test_torn_first_line_does_not_set_the_dimension(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.store(["a", "b", "c"], [[5.0, 1.0], [6.0, 1.0], [7.0, 1.0]])
+    # A cache written before the dimension was recorded, whose first line lost
+    # digits of its dimension ("2" became "") and then of a longer one
+    os.remove(cache.dim_path)
+    with open(cache.index_path, "r", encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    lines[0] = lines[0][:-1] + "23"
+    with open(cache.index_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+    reloaded = make_cache(tmp_path)
+    assert reloaded.lookup(["a", "b", "c"]) == [None, [6.0, 1.0], [7.0, 1.0]]
+    reloaded.store(["d"], [[8.0, 1.0]])
+    assert make_cache(tmp_path).lookup(["d"]) == [[8.0, 1.0]]
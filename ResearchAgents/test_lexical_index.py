@@ -0,0 +1,52 @@
+from lexical_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+def make_index(path):
+    index = BM25Index(str(path / "lexical.json"))
+    index.add(
+        ["a1", "a2", "m1"],
+        ["AAPL FY24 revenue grew on iPhone sales",
+         "AAPL EBITDA margin and services revenue revenue",
+         "MSFT FY24 cloud revenue"],
+        [{"company_code": "AAPL"}, {"company_code": "AAPL"}, {"company_code": "MSFT"}],
+    )
+    return index
+
+def test_tokenize_keeps_tickers_and_fiscal_labels():
+    assert tokenize("AAPL's FY24 EBITDA-margin") == ["aapl", "s", "fy24", "ebitda", "margin"]
+
+def test_search_ranks_by_bm25_and_applies_filters(tmp_path):
+    index = make_index(tmp_path)
+    assert [chunk_id for chunk_id, _ in index.search("EBITDA")] == ["a2"]
+    # "revenue" is in every chunk; the rarer "cloud" decides the ranking
+    assert index.search("cloud revenue")[0][0] == "m1"
+    assert {chunk_id for chunk_id, _ in index.search("fy24", filter_dict={"company_code": "AAPL"})} == {"a1"}
+    assert len(index.search("revenue", k=2)) == 2
+    assert index.search("unknown") == []
+
+def test_reindexing_and_removal_update_postings(tmp_path):
+    index = make_index(tmp_path)
+    index.add(["a2"], ["Guidance raised"], [{"company_code": "AAPL"}])
+    assert index.search("EBITDA") == []
+    assert index.search("guidance")[0][0] == "a2"
+
+    index.remove(["a2", "missing"])
+    assert len(index) == 2
+    assert index.search("guidance") == []
+    assert "guidance" not in index._postings
+
+def test_save_and_load_round_trip(tmp_path):
+    index = make_index(tmp_path)
+    index.save()
+
+    loaded = BM25Index(index.index_path)
+    assert loaded.load()
+    assert loaded.search("fy24 revenue") == index.search("fy24 revenue")
+    loaded.remove(["m1"])
+    assert loaded.search("cloud") == []
+
+    assert not BM25Index(str(tmp_path / "missing.json")).load()
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "c", "d"]], k=60)
+    assert [chunk_id for chunk_id, _ in fused] == ["b", "c", "a", "d"]
+    assert fused[0][1] == 1 / 62 + 1 / 61
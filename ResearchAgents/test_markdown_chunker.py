@@ -0,0 +1,81 @@
+from langchain_core.documents import Document
+
+from markdown_chunker import MarkdownSectionChunker
+
+TEXT = """# Apple FY24 Review
+
+Intro paragraph.
+
+## Revenue
+
+Services revenue reached a record.
+
+### iPhone
+
+iPhone sales were flat.
+
+## Margins
+
+Gross margin was 46 percent.
+
+```
+## not a heading
+```
+"""
+
+def test_small_document_is_one_chunk():
+    pieces = MarkdownSectionChunker(max_tokens=400).split_text(TEXT)
+    assert len(pieces) == 1
+    assert pieces[0]["text"] == TEXT.strip()
+    # The whole file is the untitled root section
+    assert pieces[0]["metadata"]["section_path"] == ""
+
+def test_oversized_document_splits_along_headings():
+    pieces = MarkdownSectionChunker(max_tokens=20).split_text(TEXT)
+    paths = [piece["metadata"]["section_path"] for piece in pieces]
+    assert paths == ["Apple FY24 Review", "Apple FY24 Review > Revenue", "Apple FY24 Review > Margins"]
+
+    margins = pieces[2]
+    assert margins["metadata"]["heading"] == "Margins"
+    assert margins["metadata"]["section"] == "Margins"
+    # Fenced code is not parsed for headings
+    assert "## not a heading" in margins["text"]
+    # Sections never overlap
+    assert "".join(piece["text"] for piece in pieces).count("Services revenue") == 1
+
+def test_sub_sections_are_chunked_when_the_parent_is_too_large():
+    pieces = MarkdownSectionChunker(max_tokens=12).split_text(TEXT)
+    by_path = {piece["metadata"]["section_path"]: piece for piece in pieces}
+    iphone = by_path["Apple FY24 Review > Revenue > iPhone"]
+    assert iphone["text"] == "### iPhone\n\niPhone sales were flat."
+    assert iphone["metadata"]["section"] == "Revenue"
+
+def test_byte_offsets_point_into_the_utf8_file():
+    text = "# Résumé\n\nCafé — naïve\n\n## Détails\n\n" + "Données financières. " * 40
+    encoded = text.encode("utf-8")
+    for piece in MarkdownSectionChunker(max_tokens=30).split_text(text):
+        metadata = piece["metadata"]
+        assert encoded[metadata["byte_start"]:metadata["byte_end"]].decode("utf-8") == piece["text"]
+
+def test_long_paragraphs_are_split_within_the_limit():
+    paragraph = "\n".join(f"Line {i} of a long table row." for i in range(100))
+    pieces = MarkdownSectionChunker(max_tokens=50).split_text(f"## Table\n\n{paragraph}\n\nClosing remark.")
+    assert len(pieces) > 1
+    assert all(len(piece["text"]) <= 200 for piece in pieces)
+    assert pieces[-1]["text"].endswith("Closing remark.")
+
+def test_split_documents_keeps_document_metadata():
+    chunks = MarkdownSectionChunker(max_tokens=20).split_documents(
+        [Document(page_content=TEXT, metadata={"source": "apple.md", "company_code": "AAPL"})]
+    )
+    assert len(chunks) == 3
+    assert all(chunk.metadata["source"] == "apple.md" and chunk.metadata["company_code"] == "AAPL" for chunk in chunks)
+
+def test_crlf_offsets_index_the_raw_file():
+    raw = TEXT.replace("\n", "\r\n")
+    data = raw.encode("utf-8")
+    pieces = MarkdownSectionChunker(max_tokens=20).split_text(raw)
+    assert [piece["text"] for piece in pieces] == [piece["text"] for piece in MarkdownSectionChunker(max_tokens=20).split_text(TEXT)]
+    for piece in pieces:
+        metadata = piece["metadata"]
+        assert data[metadata["byte_start"]:metadata["byte_end"]].decode("utf-8").replace("\r\n", "\n") == piece["text"]
@@ -0,0 +1,37 @@
+import json
+
+from prompt_catalog import GENERIC_PROMPT, PromptCatalog
+
+def write_prompts(path, entries):
+    path.write_text(json.dumps(entries), encoding="utf-8")
+    return str(path)
+
+def test_exact_sector_and_global_prompts(tmp_path):
+    catalog = PromptCatalog(write_prompts(tmp_path / "Prompts.json", [
+        {"CompanyCode": "AAPL", "SectorCode": "IT", "ReportType": "FirstCut", "Prompt": "apple"},
+        {"CompanyCode": "*", "SectorCode": "IT", "ReportType": "FirstCut", "Prompt": "IT {company_code}"},
+        {"CompanyCode": "*", "SectorCode": "*", "ReportType": "FirstCut", "Prompt": "any {sector_code}"},
+    ]))
+    assert catalog.get_prompts([
+        ("AAPL", "IT", "FirstCut"),
+        ("MSFT", "IT", "FirstCut"),
+        ("JPM", "BANK", "FirstCut"),
+    ]) == ["apple", "IT MSFT", "any BANK"]
+    assert catalog.get_prompt("AAPL", "IT", "Other") == GENERIC_PROMPT.format(
+        company_code="AAPL", sector_code="IT", report_type="Other")
+
+def test_first_duplicate_wins(tmp_path):
+    catalog = PromptCatalog(write_prompts(tmp_path / "Prompts.json", [
+        {"CompanyCode": "AAPL", "SectorCode": "IT", "ReportType": "FirstCut", "Prompt": "first"},
+        {"CompanyCode": "AAPL", "SectorCode": "IT", "ReportType": "FirstCut", "Prompt": "second"},
+    ]))
+    assert catalog.get_prompt("AAPL", "IT", "FirstCut") == "first"
+    assert len(catalog) == 1
+
+def test_entries_with_missing_keys_are_not_wildcards(tmp_path):
+    catalog = PromptCatalog(write_prompts(tmp_path / "Prompts.json", [
+        {"SectorCode": "IT", "ReportType": "FirstCut", "Prompt": "no company"},
+        {"CompanyCode": "", "SectorCode": "IT", "ReportType": "FirstCut", "Prompt": "empty company"},
+    ]))
+    assert len(catalog) == 0
+    assert catalog.get_prompt("MSFT", "IT", "FirstCut").startswith("You are an expert equity research analyst")
@@ -0,0 +1,45 @@
+import report_cache
+from report_cache import CACHE_HIT, CACHE_MISS, CACHE_SEMANTIC_HIT, ReportCache
+
+def make_key(prompt="Write the report", context="context", company="AAPL"):
+    return ReportCache.make_key(company, "IT", "Equity", prompt, context)
+
+def test_exact_hit_and_miss_on_changed_prompt_or_context():
+    cache = ReportCache()
+    cache.set(make_key(), "report", {"total_tokens": 10})
+
+    entry, status = cache.get(make_key())
+    assert status == CACHE_HIT and entry["result"] == "report" and entry["token_usage"] == {"total_tokens": 10}
+    assert cache.get(make_key(prompt="Write a report"))[1] == CACHE_MISS
+    assert cache.get(make_key(context="new context"))[1] == CACHE_MISS
+
+def test_semantic_hit_requires_same_context_and_threshold():
+    cache = ReportCache(semantic_threshold=0.9)
+    cache.set(make_key(), "report", prompt_embedding=[1.0, 0.0])
+
+    entry, status = cache.get(make_key(prompt="Draft the report"), prompt_embedding=[0.99, 0.1])
+    assert status == CACHE_SEMANTIC_HIT and entry["result"] == "report"
+    assert cache.get(make_key(prompt="Other"), prompt_embedding=[0.0, 1.0])[1] == CACHE_MISS
+    assert cache.get(make_key(prompt="Other", context="new"), prompt_embedding=[1.0, 0.0])[1] == CACHE_MISS
+    assert cache.get(make_key(prompt="Other", company="MSFT"), prompt_embedding=[1.0, 0.0])[1] == CACHE_MISS
+    assert cache.get_stats()["semantic_hits"] == 1
+
+def test_semantic_tier_is_off_by_default():
+    cache = ReportCache()
+    cache.set(make_key(), "report", prompt_embedding=[1.0, 0.0])
+    assert cache.get(make_key(prompt="Other"), prompt_embedding=[1.0, 0.0])[1] == CACHE_MISS
+
+def test_expiry_eviction_and_company_invalidation(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(report_cache.time, "monotonic", lambda: now[0])
+    cache = ReportCache(ttl_seconds=60, max_size=2)
+    cache.set(make_key(company="AAPL"), "apple")
+    cache.set(make_key(company="MSFT"), "microsoft")
+    cache.set(make_key(company="NVDA"), "nvidia")
+    assert cache.get(make_key(company="AAPL"))[1] == CACHE_MISS
+
+    assert cache.invalidate_companies(["MSFT", "TSLA"]) == 1
+    assert cache.get(make_key(company="NVDA"))[1] == CACHE_HIT
+    now[0] = 60
+    assert cache.get(make_key(company="NVDA"))[1] == CACHE_MISS
+    assert cache.get_stats()["size"] == 0
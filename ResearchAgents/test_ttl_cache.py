@@ -0,0 +1,34 @@
+import ttl_cache
+from ttl_cache import TTLCache
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(ttl_cache.time, "monotonic", lambda: now[0])
+    cache = TTLCache(ttl_seconds=10)
+    cache.set("key", "value")
+
+    now[0] += 9
+    assert cache.get("key") == "value"
+    now[0] += 1
+    assert cache.get("key", "default") == "default"
+    assert cache.get_stats()["size"] == 0
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+def test_stats_count_hits_and_misses():
+    cache = TTLCache(max_size=4, ttl_seconds=60)
+    cache.set("a", None)
+    assert cache.get("a", "default") is None
+    assert cache.get("b") is None
+
+    assert cache.get_stats() == {"size": 1, "max_size": 4, "ttl_seconds": 60, "hits": 1, "misses": 1}
+    cache.clear()
+    assert cache.get_stats()["size"] == 0
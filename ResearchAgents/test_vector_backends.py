@@ -0,0 +1,192 @@
+import os
+
+import numpy as np
+import pytest
+
+from vector_backends import LocalMmapBackend, create_backend
+
+def vectors(*rows):
+    return [list(map(float, row)) for row in rows]
+
+def make_backend(tmp_path, **kwargs):
+    return LocalMmapBackend(str(tmp_path / "index"), **kwargs)
+
+def add(backend, ids, company="AAPL", date=1):
+    rng = np.random.default_rng(len(ids))
+    embeddings = rng.normal(size=(len(ids), 8)).tolist()
+    backend.upsert(ids, embeddings, [f"text {chunk_id}" for chunk_id in ids],
+                   [{"company_code": company, "document_date": date} for _ in ids])
+    return embeddings
+
+def test_query_get_delete_and_filters(tmp_path):
+    backend = make_backend(tmp_path)
+    backend.upsert(["a", "b", "c"], vectors([1, 0, 0], [0, 1, 0], [0.9, 0.1, 0]),
+                   ["doc a", "doc b", "doc c"],
+                   [{"company_code": "AAPL", "document_date": 10},
+                    {"company_code": "MSFT", "document_date": 20},
+                    {"company_code": "AAPL", "document_date": 30}])
+    backend.flush()
+
+    result = backend.query(vectors([1, 0, 0]), n_results=2)
+    assert result["ids"] == [["a", "c"]]
+    assert result["documents"] == [["doc a", "doc c"]]
+    assert result["distances"][0][0] == pytest.approx(0.0, abs=1e-2)
+
+    filtered = backend.query(vectors([1, 0, 0]), n_results=3,
+                             where={"$and": [{"company_code": "AAPL"}, {"document_date": {"$gte": 20}}]})
+    assert filtered["ids"] == [["c"]]
+
+    backend.upsert(["a"], vectors([0, 0, 1]), ["doc a v2"], [{"company_code": "AAPL"}])
+    backend.delete(["b"])
+    backend.flush()
+    assert backend.count() == 2
+    assert backend.get(["a", "b"])["documents"] == ["doc a v2"]
+    assert sorted(backend.get()["ids"]) == ["a", "c"]
+
+def test_second_instance_is_a_read_only_follower(tmp_path):
+    writer = make_backend(tmp_path)
+    reader = make_backend(tmp_path)
+    add(writer, ["a", "b"])
+    assert writer.acquire_writer()
+    assert not reader.acquire_writer()
+    with pytest.raises(RuntimeError):
+        add(reader, ["c"])
+
+    # Unflushed rows are invisible to readers
+    assert reader.count() == 0
+    writer.flush()
+    assert reader.count() == 2
+    assert sorted(reader.get()["ids"]) == ["a", "b"]
+    # Readers map the index instead of loading it
+    assert isinstance(reader._records, np.memmap) and isinstance(reader._vectors, np.memmap)
+
+    writer.close()
+    assert reader.acquire_writer()
+    add(reader, ["c"])
+    reader.flush()
+    assert make_backend(tmp_path).count() == 3
+
+def test_compaction_switches_generation_and_removes_old_files(tmp_path):
+    writer = make_backend(tmp_path)
+    reader = make_backend(tmp_path)
+    add(writer, [f"id{i}" for i in range(10)])
+    writer.flush()
+    assert reader.count() == 10
+
+    writer.delete([f"id{i}" for i in range(6)])
+    writer.flush()
+    files = os.listdir(writer.directory)
+    assert "vectors.1.bin" in files and "vectors.0.bin" not in files
+    assert sorted(reader.get()["ids"]) == [f"id{i}" for i in range(6, 10)]
+    assert len(reader.query([[1.0] * 8], n_results=10)["ids"][0]) == 4
+
+def test_ivf_is_published_atomically_with_the_manifest(tmp_path):
+    writer = make_backend(tmp_path, ivf_min_rows=1000, nprobe=2)
+    reader = make_backend(tmp_path, nprobe=2)
+    embeddings = add(writer, [f"id{i}" for i in range(64)])
+    writer.flush()
+
+    writer.train_ivf(nlist=4)
+    # Not flushed yet: readers still search exactly
+    assert reader.query([embeddings[5]], n_results=1)["ids"] == [["id5"]]
+    assert reader._centroids is None
+
+    writer.flush()
+    assert reader.query([embeddings[5]], n_results=1)["ids"] == [["id5"]]
+    assert reader._centroids is not None and reader._centroids.shape == (4, 8)
+    assert (np.asarray(reader._list_ids) >= 0).all()
+
+def test_legacy_sidecar_is_ignored_and_removed(tmp_path):
+    directory = tmp_path / "index"
+    directory.mkdir()
+    (directory / "sidecar.json").write_text("{}", encoding="utf-8")
+    (directory / "centroids.f32").write_bytes(b"")
+
+    backend = make_backend(tmp_path)
+    assert backend.count() == 0
+    assert backend.acquire_writer()
+    assert sorted(os.listdir(directory)) == ["writer.lock"]
+
+def test_where_operators(tmp_path):
+    backend = make_backend(tmp_path)
+    backend.upsert(["a", "b", "c", "d"], vectors([1, 0], [1, 0.1], [1, 0.2], [1, 0.3]), ["a", "b", "c", "d"],
+                   [{"company_code": "AAPL", "document_date": 10},
+                    {"company_code": "MSFT", "document_date": 20},
+                    {"company_code": "NVDA"},
+                    {"company_code": "AAPL", "document_date": 40}])
+
+    def ids(where):
+        return sorted(backend.query(vectors([1, 0]), n_results=10, where=where)["ids"][0])
+
+    assert ids({"company_code": {"$in": ["MSFT", "NVDA"]}}) == ["b", "c"]
+    assert ids({"company_code": {"$nin": ["AAPL"]}}) == ["b", "c"]
+    assert ids({"company_code": {"$ne": "AAPL"}}) == ["b", "c"]
+    assert ids({"$or": [{"company_code": "NVDA"}, {"document_date": {"$gt": 30}}]}) == ["c", "d"]
+    # Missing numeric values never match a range
+    assert ids({"document_date": {"$lt": 100}}) == ["a", "b", "d"]
+    with pytest.raises(ValueError):
+        ids({"company_code": {"$gt": "A"}})
+    with pytest.raises(ValueError):
+        ids({"company_code": {"$like": "A%"}})
+
+def test_float16_index_returns_normalized_embeddings(tmp_path):
+    backend = make_backend(tmp_path, dtype="float16")
+    backend.upsert(["a"], vectors([3, 4]), ["doc a"], [{}])
+    result = backend.query(vectors([3, 4]), n_results=5, include_embeddings=True)
+    assert result["ids"] == [["a"]]
+    assert result["embeddings"][0][0] == pytest.approx([0.6, 0.8], abs=1e-3)
+    assert result["distances"][0][0] == pytest.approx(0.0, abs=1e-3)
+
+    with pytest.raises(ValueError):
+        make_backend(tmp_path, dtype="float32")
+
+def test_create_backend(tmp_path):
+    backend = create_backend("local", str(tmp_path), "research")
+    assert isinstance(backend, LocalMmapBackend)
+    assert backend.directory == str(tmp_path / "research_local")
+    with pytest.raises(ValueError):
+        create_backend("faiss", str(tmp_path), "research")
+
+def test_filters_and_id_lookups_read_the_mapped_sidecar(tmp_path, monkeypatch):
+    writer = make_backend(tmp_path)
+    add(writer, [f"id{i}" for i in range(20)], company="AAPL", date=10)
+    add(writer, [f"msft{i}" for i in range(5)], company="MSFT", date=20.0)
+    writer.upsert(["risk"], [[1.0] * 8], ["text risk"], [{"company_code": "MSFT", "section": "Risks"}])
+    writer.flush()
+
+    reader = make_backend(tmp_path)
+    assert all(isinstance(codes, np.memmap) for codes in reader._codes)
+    assert isinstance(reader._id_hashes, np.memmap) and isinstance(reader._id_rows, np.memmap)
+
+    decoded = []
+    record = LocalMmapBackend._record
+    monkeypatch.setattr(LocalMmapBackend, "_record", lambda self, row: decoded.append(row) or record(self, row))
+
+    result = reader.query([[1.0] * 8], n_results=2, where={"company_code": "MSFT", "document_date": {"$lte": 20}})
+    assert len(result["ids"][0]) == 2 and len(decoded) == 2
+    # 20 and 20.0 are the same value; rows written before "section" existed lack it
+    assert len(reader.query([[1.0] * 8], n_results=10, where={"document_date": 20})["ids"][0]) == 5
+    assert reader.query([[1.0] * 8], n_results=10, where={"section": "Risks"})["ids"] == [["risk"]]
+
+    decoded.clear()
+    assert reader.get(["id3", "missing", "msft1"])["ids"] == ["id3", "msft1"]
+    # One decode confirms each hash match and one returns the record
+    assert len(decoded) == 4
+
+def test_id_lookup_follows_upserts_deletes_and_compaction(tmp_path):
+    writer = make_backend(tmp_path)
+    add(writer, [f"id{i}" for i in range(10)])
+    writer.flush()
+
+    writer.upsert(["id1", "id1"], [[1.0] * 8, [2.0] * 8], ["first", "second"], [{}, {}])
+    writer.delete(["id2", "id3", "id4", "id5"])
+    assert writer.get(["id1", "id2"])["documents"] == ["second"]
+    writer.flush()
+    assert writer._generation == 1
+
+    reader = make_backend(tmp_path)
+    assert reader.count() == 6 and len(reader._id_hashes) == 6
+    assert reader.get(["id1", "id2", "id9"])["documents"] == ["second", "text id9"]
+    writer.delete(["id1"])
+    writer.flush()
+    assert reader.get(["id1"])["ids"] == [] and reader.count() == 5
@@ -0,0 +1,127 @@
+import os
+import shutil
+import hashlib
+
+import pytest
+import langchain_community.embeddings
+from langchain_core.embeddings import Embeddings
+
+from vector_store import ResearchVectorStore
+
+DOCS_DIR = os.path.join(os.path.dirname(__file__), "docs")
+
+class HashEmbeddings(Embeddings):
+    def __init__(self, model_name=None):
+        pass
+
+    def embed_documents(self, texts):
+        return [[byte / 255.0 for byte in hashlib.sha256(text.encode("utf-8")).digest()[:8]] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+@pytest.fixture
+def make_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(langchain_community.embeddings, "SentenceTransformerEmbeddings", HashEmbeddings)
+
+    def make():
+        return ResearchVectorStore(str(tmp_path / "store"), ingest_workers=1, backend="local")
+    return make
+
+def chunk_metadata(store):
+    existing = store.backend.get()
+    return {metadata["section_path"]: metadata for metadata in existing["metadatas"]}
+
+def test_edited_file_refreshes_metadata_of_retained_chunks(tmp_path, make_store):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    shutil.copy(os.path.join(DOCS_DIR, "AAPL_research.md"), docs)
+    path = docs / "AAPL_research.md"
+
+    store = make_store()
+    store.sync_documents(str(docs))
+    before = {key: value["byte_start"] for key, value in chunk_metadata(store).items()}
+
+    text = path.read_text(encoding="utf-8")
+    inserted = "Inserted line above the overview.\n"
+    path.write_text(text.replace("## Company Overview", inserted + "## Company Overview", 1), encoding="utf-8")
+    os.utime(path, (1_700_000_000, 1_700_000_000))
+
+    stats = store.sync_documents(str(docs))
+    assert stats["chunks_updated"] > 0
+
+    data = path.read_bytes()
+    for section_path, metadata in chunk_metadata(store).items():
+        chunk_text = data[metadata["byte_start"]:metadata["byte_end"]].decode("utf-8")
+        assert chunk_text.strip()
+        assert metadata["document_date"] == 1_700_000_000
+        if section_path in before and before[section_path] > text.index("## Company Overview"):
+            assert metadata["byte_start"] == before[section_path] + len(inserted.encode("utf-8"))
+
+def test_unchanged_files_are_skipped(tmp_path, make_store):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    shutil.copy(os.path.join(DOCS_DIR, "MSFT_research.md"), docs)
+
+    store = make_store()
+    first = store.sync_documents(str(docs))
+    assert first["chunks_added"] > 0
+    store.backend.close()
+
+    second = make_store().sync_documents(str(docs))
+    assert second["files_changed"] == 0 and second["chunks_added"] == 0 and second["chunks_updated"] == 0
+
+def test_only_one_process_syncs_the_local_index(tmp_path, make_store):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    shutil.copy(os.path.join(DOCS_DIR, "MSFT_research.md"), docs)
+
+    writer = make_store()
+    reader = make_store()
+    assert writer.sync_documents(str(docs))["chunks_added"] > 0
+    assert reader.sync_documents(str(docs))["files_changed"] == 0
+    assert reader.backend.count() == writer.backend.count() > 0
+
+def test_readers_follow_the_writers_ingestion_passes(tmp_path, make_store):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    shutil.copy(os.path.join(DOCS_DIR, "MSFT_research.md"), docs)
+
+    writer = make_store()
+    reader = make_store()
+    changed = []
+    reader.add_change_listener(changed.append)
+    version = reader.collection_version
+    assert len(reader.lexical_index) == 0
+
+    writer.sync_documents(str(docs))
+    packed = reader.get_packed_context("MSFT")
+    assert packed["chunks_used"] > 0
+    assert changed == [{"MSFT"}] and reader.collection_version > version
+    assert len(reader.lexical_index) == len(writer.lexical_index) > 0
+
+    # Nothing new was published, so nothing is reloaded
+    reader.get_packed_context("MSFT")
+    assert changed == [{"MSFT"}]
+
+    shutil.copy(os.path.join(DOCS_DIR, "AAPL_research.md"), docs)
+    writer.sync_documents(str(docs))
+    reader.search_similar_documents("revenue", "AAPL")
+    assert changed == [{"MSFT"}, {"AAPL"}]
+
+def test_crlf_files_get_byte_offsets_of_the_file(tmp_path, make_store):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    with open(os.path.join(DOCS_DIR, "AAPL_research.md"), "r", encoding="utf-8") as f:
+        text = f.read()
+    path = docs / "AAPL_research.md"
+    path.write_bytes(text.replace("\n", "\r\n").encode("utf-8"))
+
+    store = make_store()
+    store.sync_documents(str(docs))
+    data = path.read_bytes()
+    existing = store.backend.get()
+    assert len(existing["ids"]) > 1
+    for document, metadata in zip(existing["documents"], existing["metadatas"]):
+        assert "\r" not in document
+        assert data[metadata["byte_start"]:metadata["byte_end"]].decode("utf-8").replace("\r\n", "\n") == document
@@ -0,0 +1,687 @@
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+from file_lock import FileLock
+from typing import Any, Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+class VectorBackend:
+    """
+    Storage interface used by ResearchVectorStore.
+
+    Results follow Chroma's layout: get() returns flat "ids", "documents" and
+    "metadatas" lists, and query() returns one such list per query plus
+    "distances" (and "embeddings" when requested).
+    """
+
+    name = "base"
+
+    def upsert(self, ids: List[str], embeddings: List[List[float]], documents: List[str], metadatas: List[Dict[str, Any]]):
+        raise NotImplementedError
+
+    def delete(self, ids: List[str]):
+        raise NotImplementedError
+
+    def get(self, ids: List[str] = None) -> Dict[str, List]:
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def query(self, query_embeddings: List[List[float]], n_results: int,
+              where: Dict[str, Any] = None, include_embeddings: bool = False) -> Dict[str, List]:
+        raise NotImplementedError
+
+    def flush(self):
+        """Persist buffered writes; called at the end of every ingestion pass"""
+
+    def acquire_writer(self) -> bool:
+        """Whether this process may write; False when another process owns the index"""
+        return True
+
+class ChromaBackend(VectorBackend):
+    """Chroma persistent collection (SQLite + HNSW)"""
+
+    name = "chroma"
+
+    def __init__(self, persist_directory: str, collection_name: str):
+        # Imported here so the local backend (and app startup) never loads chromadb
+        import chromadb
+        self.client = chromadb.PersistentClient(path=persist_directory)
+        self.collection = self.client.get_or_create_collection(collection_name)
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self.collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def delete(self, ids):
+        self.collection.delete(ids=list(ids))
+
+    def get(self, ids=None):
+        return self.collection.get(ids=ids, include=["documents", "metadatas"])
+
+    def count(self):
+        return self.collection.count()
+
+    def query(self, query_embeddings, n_results, where=None, include_embeddings=False):
+        include = ["documents", "metadatas", "distances"]
+        if include_embeddings:
+            include.append("embeddings")
+        return self.collection.query(
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            where=where,
+            include=include
+        )
+
+class LocalMmapBackend(VectorBackend):
+    """
+    Quantized vectors in memory-mapped files, searched with NumPy.
+
+    Vectors are L2-normalized and stored as int8 (with a float32 scale per row)
+    or float16. Every per-row file is opened with np.memmap, so worker
+    processes share one page-cached copy and keep almost nothing in private
+    memory: each row's id, document and metadata are a JSON record in an
+    append-only records file, decoded only for the rows a query returns.
+    Where filters run on columns: one int32 file per metadata key holding a
+    code per row (-1 when missing) into that key's append-only file of
+    distinct values. Ids are looked up through a sorted array of id hashes
+    and the matching rows. Search is exact by default; once the index holds
+    ivf_min_rows vectors it is partitioned with k-means (IVF) and only the
+    nprobe closest partitions are scanned.
+
+    manifest.json names the files that make up the index and is replaced
+    atomically, always after the files it names are complete. Vector, record
+    and column files belong to a generation that is appended to until deletes
+    are compacted into a new one; the alive flags, IVF list assignments,
+    centroids and id lookup are written as a new version on every flush.
+    Files no longer named by the manifest are removed, or retried after the
+    next flush while a reader still has them mapped (Windows does not allow
+    removing them).
+
+    Only one process writes. The first to write takes an OS lock on
+    writer.lock and keeps it for its lifetime; in other processes
+    acquire_writer() returns False and writes raise, and reads pick up the
+    writer's flushed changes when the manifest changes.
+    """
+
+    name = "local"
+    BLOCK_ROWS = 65536
+    MANIFEST_FORMAT = 3
+    # Files owned by the index; anything else in the directory is left alone
+    DATA_PREFIXES = ("vectors.", "scales.", "records.", "offsets.", "alive.", "lists.", "centroids.",
+                     "idhash.", "idrows.", "columns.", "values.", "sidecar.json")
+
+    def __init__(self, directory: str, dtype: str = "int8", ivf_min_rows: int = 20000, nprobe: int = 8):
+        if dtype not in ("int8", "float16"):
+            raise ValueError(f"Unsupported local index dtype: {dtype}")
+        self.directory = directory
+        self.dtype = dtype
+        self.ivf_min_rows = ivf_min_rows
+        self.nprobe = nprobe
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        self._lock = threading.RLock()
+        self._writer_lock = FileLock(os.path.join(directory, "writer.lock"))
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    # Loading and persistence
+
+    def _path(self, kind: str, number: int) -> str:
+        extension = {"vectors": "bin", "scales": "f32", "records": "jsonl", "offsets": "i64",
+                     "alive": "u8", "lists": "i32", "centroids": "f32",
+                     "idhash": "u64", "idrows": "i64", "values": "jsonl"}[kind]
+        return os.path.join(self.directory, f"{kind}.{number}.{extension}")
+
+    def _column_path(self, generation: int, column: int) -> str:
+        return os.path.join(self.directory, f"columns.{generation}.{column}.i32")
+
+    def _manifest_stamp(self):
+        """Change marker for the manifest file, or None if it does not exist"""
+        try:
+            stat = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def _load(self):
+        with self._lock:
+            for attempt in range(3):
+                try:
+                    self._load_once()
+                    return
+                except FileNotFoundError:
+                    # The writer replaced the manifest and removed the files we were opening
+                    if attempt == 2:
+                        raise
+
+    def _load_once(self):
+        self._stamp = self._manifest_stamp()
+        manifest = None
+        if self._stamp is not None:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("format") != self.MANIFEST_FORMAT:
+                # Written by an older version; its chunks are re-ingested once
+                logger.info(f"Ignoring local index at {self.directory} in format {manifest.get('format')}")
+                manifest = None
+            elif manifest["dtype"] != self.dtype:
+                raise ValueError(f"Local index at {self.directory} is {manifest['dtype']}, not {self.dtype}")
+        manifest = manifest or {"format": self.MANIFEST_FORMAT, "generation": 0, "version": 0, "dim": None,
+                                "dtype": self.dtype, "rows": 0, "records_bytes": 0, "nlist": 0,
+                                "live": 0, "columns": []}
+
+        self._generation = manifest["generation"]
+        self._version = manifest["version"]
+        self._dim = manifest["dim"]
+        self._rows = manifest["rows"]
+        self._records_bytes = manifest["records_bytes"]
+        self._alive = self._map(self._path("alive", self._version), np.bool_, (self._rows,))
+        self._list_ids = self._map(self._path("lists", self._version), np.int32, (self._rows,))
+        self._centroids = None
+        if manifest["nlist"]:
+            self._centroids = np.fromfile(self._path("centroids", self._version),
+                                          dtype=np.float32).reshape(manifest["nlist"], self._dim)
+        # Id hashes of the live rows at the last flush, sorted, and their rows
+        self._id_hashes = self._map(self._path("idhash", self._version), np.uint64, (manifest["live"],))
+        self._id_rows = self._map(self._path("idrows", self._version), np.int64, (manifest["live"],))
+        # Rows written since the last flush, by id (writer only)
+        self._pending_rows = {}
+        # Metadata keys with a column, and the bytes of their values files
+        self._columns = [key for key, _ in manifest["columns"]]
+        self._values_bytes = [values_bytes for _, values_bytes in manifest["columns"]]
+        self._column_values = {}
+        self._dirty = False
+        self._open_maps()
+
+    @staticmethod
+    def _map(path: str, dtype, shape) -> np.ndarray:
+        """Read-only memory map of path; np.memmap cannot map zero bytes"""
+        if not int(np.prod(shape)):
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+    def _open_maps(self):
+        self._vectors = self._scales = None
+        if self._dim:
+            self._vectors = self._map(self._path("vectors", self._generation), self.dtype, (self._rows, self._dim))
+            if self.dtype == "int8":
+                self._scales = self._map(self._path("scales", self._generation), np.float32, (self._rows,))
+        self._records = self._map(self._path("records", self._generation), np.uint8, (self._records_bytes,))
+        self._offsets = self._map(self._path("offsets", self._generation), np.int64, (self._rows, 2))
+        self._codes = [self._map(self._column_path(self._generation, column), np.int32, (self._rows,))
+                       for column in range(len(self._columns))]
+
+    def _maybe_reload(self):
+        """Pick up changes flushed by the writer process"""
+        if self._writer_lock.held:
+            return
+        if self._manifest_stamp() != self._stamp:
+            self._load()
+
+    @staticmethod
+    def _write_at(path: str, offset: int, data: bytes):
+        """Write data at offset, overwriting anything a crashed writer left past the manifest's sizes"""
+        with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+            f.seek(offset)
+            f.write(data)
+
+    def _itemsize(self) -> int:
+        return 1 if self.dtype == "int8" else 2
+
+    # Single writer
+
+    def acquire_writer(self) -> bool:
+        with self._lock:
+            if self._writer_lock.held:
+                return True
+            if not self._writer_lock.acquire(blocking=False):
+                return False
+            # Start from the last flushed state, which may be newer than ours
+            self._load()
+            self._remove_unreferenced()
+            return True
+
+    def close(self):
+        """Give up the writer role (if held); the index stays readable"""
+        with self._lock:
+            self._writer_lock.release()
+
+    def _require_writer(self):
+        if not self.acquire_writer():
+            raise RuntimeError(f"Local index at {self.directory} is being written by another process")
+        if not self._alive.flags.writeable:
+            # Readers map these; the writer edits private copies until the next flush
+            self._alive = np.array(self._alive)
+            self._list_ids = np.array(self._list_ids)
+
+    def flush(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            self._require_writer()
+            id_hashes, id_rows = self._live_id_index()
+            live_rows = int(self._alive.sum())
+            if self._rows and live_rows < self._rows * 0.7:
+                keep = self._compact()
+                id_rows = np.searchsorted(keep, id_rows)
+            if self._centroids is None and live_rows >= self.ivf_min_rows:
+                self._train_ivf()
+
+            self._version += 1
+            self._alive.astype(np.uint8).tofile(self._path("alive", self._version))
+            self._list_ids.astype(np.int32).tofile(self._path("lists", self._version))
+            if self._centroids is not None:
+                self._centroids.astype(np.float32).tofile(self._path("centroids", self._version))
+            id_hashes.tofile(self._path("idhash", self._version))
+            id_rows.astype(np.int64).tofile(self._path("idrows", self._version))
+            self._id_hashes, self._id_rows = id_hashes, id_rows
+            self._pending_rows = {}
+
+            # The manifest goes last: until it is replaced readers keep using the previous files
+            manifest = {
+                "format": self.MANIFEST_FORMAT,
+                "generation": self._generation,
+                "version": self._version,
+                "dim": self._dim,
+                "dtype": self.dtype,
+                "rows": self._rows,
+                "records_bytes": self._records_bytes,
+                "nlist": 0 if self._centroids is None else len(self._centroids),
+                "live": len(id_hashes),
+                "columns": [[key, values_bytes] for key, values_bytes in zip(self._columns, self._values_bytes)],
+            }
+            tmp_path = self.manifest_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(manifest, f)
+            os.replace(tmp_path, self.manifest_path)
+            self._stamp = self._manifest_stamp()
+            self._dirty = False
+            self._remove_unreferenced()
+
+    def _remove_unreferenced(self):
+        """Delete data files the manifest no longer names"""
+        referenced = {os.path.basename(self._path(kind, self._generation))
+                      for kind in ("vectors", "scales", "records", "offsets")}
+        referenced |= {os.path.basename(self._path(kind, self._version))
+                       for kind in ("alive", "lists", "centroids", "idhash", "idrows")}
+        for column in range(len(self._columns)):
+            referenced.add(os.path.basename(self._column_path(self._generation, column)))
+            referenced.add(os.path.basename(self._path("values", column)))
+        for name in os.listdir(self.directory):
+            if name in referenced or not name.startswith(self.DATA_PREFIXES):
+                continue
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                # Still mapped by a reader on Windows; retried after the next flush
+                pass
+
+    def _compact(self) -> np.ndarray:
+        """Rewrite the per-row files without deleted rows, as a new generation; returns the kept rows"""
+        keep = np.flatnonzero(self._alive)
+        logger.info(f"Compacting local index: {self._rows} -> {len(keep)} rows")
+        generation = self._generation + 1
+        records_bytes = 0
+        with open(self._path("vectors", generation), "wb") as vectors_file, \
+                open(self._path("scales", generation), "wb") as scales_file, \
+                open(self._path("records", generation), "wb") as records_file, \
+                open(self._path("offsets", generation), "wb") as offsets_file:
+            for start in range(0, len(keep), self.BLOCK_ROWS):
+                rows = keep[start:start + self.BLOCK_ROWS]
+                vectors_file.write(np.asarray(self._vectors[rows]).tobytes())
+                if self.dtype == "int8":
+                    scales_file.write(np.asarray(self._scales[rows]).tobytes())
+                offsets = np.empty((len(rows), 2), dtype=np.int64)
+                for i, row in enumerate(rows):
+                    record = self._records[self._offsets[row, 0]:self._offsets[row, 1]].tobytes()
+                    records_file.write(record)
+                    offsets[i] = (records_bytes, records_bytes + len(record))
+                    records_bytes += len(record)
+                offsets_file.write(offsets.tobytes())
+        for column, codes in enumerate(self._codes):
+            # Codes index the values files, which are shared by all generations
+            with open(self._column_path(generation, column), "wb") as codes_file:
+                for start in range(0, len(keep), self.BLOCK_ROWS):
+                    codes_file.write(np.asarray(codes[keep[start:start + self.BLOCK_ROWS]]).tobytes())
+
+        self._generation = generation
+        self._rows = len(keep)
+        self._records_bytes = records_bytes
+        self._alive = np.ones(len(keep), dtype=bool)
+        self._list_ids = np.array(self._list_ids[keep])
+        self._open_maps()
+        return keep
+
+    # Quantization
+
+    def _quantize(self, vectors: np.ndarray):
+        if self.dtype == "float16":
+            return vectors.astype(np.float16), None
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+    def _dequantize(self, rows) -> np.ndarray:
+        block = np.asarray(self._vectors[rows], dtype=np.float32)
+        if self.dtype == "int8":
+            block *= np.asarray(self._scales[rows], dtype=np.float32)[:, None]
+        return block
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    # Writes
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        if not ids:
+            return
+        with self._lock:
+            self._require_writer()
+            vectors = self._normalize(np.asarray(embeddings, dtype=np.float32))
+            if self._dim is None:
+                self._dim = vectors.shape[1]
+            quantized, scales = self._quantize(vectors)
+
+            records = [
+                json.dumps({"id": chunk_id, "document": document, "metadata": metadata or {}},
+                           ensure_ascii=False).encode("utf-8") + b"\n"
+                for chunk_id, document, metadata in zip(ids, documents, metadatas)
+            ]
+            ends = self._records_bytes + np.cumsum([len(record) for record in records], dtype=np.int64)
+            offsets = np.stack([ends - [len(record) for record in records], ends], axis=1)
+
+            # Rows past the manifest's count stay invisible to readers until the next flush
+            self._write_at(self._path("vectors", self._generation), self._rows * self._dim * self._itemsize(), quantized.tobytes())
+            if scales is not None:
+                self._write_at(self._path("scales", self._generation), self._rows * 4, scales.tobytes())
+            self._write_at(self._path("records", self._generation), self._records_bytes, b"".join(records))
+            self._write_at(self._path("offsets", self._generation), self._rows * 16, offsets.tobytes())
+            self._write_columns([metadata or {} for metadata in metadatas])
+
+            found = self._find_rows(ids)
+            first_row = self._rows
+            self._alive = np.concatenate([self._alive, np.ones(len(ids), dtype=bool)])
+            for offset, chunk_id in enumerate(ids):
+                # Re-upserting an id replaces its previous row, even one earlier in this batch
+                previous = self._pending_rows.get(chunk_id, found[offset])
+                if previous is not None:
+                    self._alive[previous] = False
+                self._pending_rows[chunk_id] = first_row + offset
+            list_ids = self._assign_lists(vectors) if self._centroids is not None else np.full(len(ids), -1, np.int32)
+            self._list_ids = np.concatenate([self._list_ids, list_ids])
+            self._rows += len(ids)
+            self._records_bytes = int(ends[-1])
+            self._dirty = True
+            self._open_maps()
+
+    def _write_columns(self, metadatas: List[Dict[str, Any]]):
+        """Append a code per new row to every metadata column, adding columns and values as they appear"""
+        for metadata in metadatas:
+            for key in metadata:
+                if key not in self._columns:
+                    # Rows written before the key first appeared are missing it
+                    column = len(self._columns)
+                    self._write_at(self._column_path(self._generation, column), 0,
+                                   np.full(self._rows, -1, np.int32).tobytes())
+                    self._columns.append(key)
+                    self._values_bytes.append(0)
+        for column, key in enumerate(self._columns):
+            values, code_of = self._values(column)
+            codes = np.full(len(metadatas), -1, np.int32)
+            new_values = []
+            for i, metadata in enumerate(metadatas):
+                value = metadata.get(key)
+                if value is None:
+                    continue
+                value_key = self._value_key(value)
+                if value_key not in code_of:
+                    code_of[value_key] = len(values)
+                    values.append(value)
+                    new_values.append(json.dumps(value, ensure_ascii=False).encode("utf-8") + b"\n")
+                codes[i] = code_of[value_key]
+            if new_values:
+                data = b"".join(new_values)
+                self._write_at(self._path("values", column), self._values_bytes[column], data)
+                self._values_bytes[column] += len(data)
+            self._write_at(self._column_path(self._generation, column), self._rows * 4, codes.tobytes())
+
+    def delete(self, ids):
+        with self._lock:
+            self._require_writer()
+            for chunk_id, row in zip(ids, self._find_rows(ids)):
+                self._pending_rows.pop(chunk_id, None)
+                if row is not None:
+                    self._alive[row] = False
+                    self._dirty = True
+
+    # IVF partitioning
+
+    def train_ivf(self, nlist: int = None, iterations: int = 10, sample_size: int = 50000):
+        """Partition the vectors with k-means so queries scan only nearby partitions.
+
+        Readers see the new partitioning after the next flush.
+        """
+        with self._lock:
+            self._require_writer()
+            self._train_ivf(nlist, iterations, sample_size)
+
+    def _train_ivf(self, nlist: int = None, iterations: int = 10, sample_size: int = 50000):
+        live = np.flatnonzero(self._alive)
+        if len(live) == 0:
+            return
+        nlist = nlist or max(1, int(np.sqrt(len(live))))
+        rng = np.random.default_rng(0)
+        sample = np.sort(rng.choice(live, size=min(sample_size, len(live)), replace=False))
+        data = self._normalize(self._dequantize(sample))
+        centroids = data[rng.choice(len(data), size=min(nlist, len(data)), replace=False)]
+        for _ in range(iterations):
+            assignment = np.argmax(data @ centroids.T, axis=1)
+            for c in range(len(centroids)):
+                members = data[assignment == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids = self._normalize(centroids)
+
+        self._centroids = centroids.astype(np.float32)
+        list_ids = np.full(self._rows, -1, np.int32)
+        for start in range(0, self._rows, self.BLOCK_ROWS):
+            rows = np.arange(start, min(start + self.BLOCK_ROWS, self._rows))
+            list_ids[rows] = self._assign_lists(self._dequantize(rows))
+        self._list_ids = list_ids
+        self._dirty = True
+        logger.info(f"Trained IVF partitioning with {len(centroids)} lists over {len(live)} vectors")
+
+    def _assign_lists(self, vectors: np.ndarray) -> np.ndarray:
+        return np.argmax(self._normalize(vectors) @ self._centroids.T, axis=1).astype(np.int32)
+
+    # Reads
+
+    def _record(self, row: int) -> Dict[str, Any]:
+        start, end = self._offsets[row]
+        return json.loads(self._records[start:end].tobytes())
+
+    @staticmethod
+    def _id_hash(ids: List[str]) -> np.ndarray:
+        digests = b"".join(hashlib.blake2b(chunk_id.encode("utf-8"), digest_size=8).digest() for chunk_id in ids)
+        return np.frombuffer(digests, dtype="<u8").astype(np.uint64)
+
+    def _find_rows(self, ids: List[str]) -> List[Optional[int]]:
+        """Live row of each id, or None; a record is decoded only to confirm a hash match"""
+        if not ids:
+            return []
+        hashes = self._id_hash(ids)
+        starts = np.searchsorted(self._id_hashes, hashes, side="left")
+        ends = np.searchsorted(self._id_hashes, hashes, side="right")
+        rows = []
+        for chunk_id, start, end in zip(ids, starts, ends):
+            found = self._pending_rows.get(chunk_id)
+            if found is None:
+                for row in self._id_rows[start:end]:
+                    if self._alive[row] and self._record(row)["id"] == chunk_id:
+                        found = int(row)
+                        break
+            rows.append(found)
+        return rows
+
+    def _live_id_index(self):
+        """Sorted id hashes and rows of the live rows, for the next version"""
+        flushed = np.asarray(self._alive[self._id_rows], dtype=bool) if len(self._id_rows) else np.empty(0, bool)
+        pending = [(chunk_id, row) for chunk_id, row in self._pending_rows.items() if self._alive[row]]
+        hashes = np.concatenate([np.asarray(self._id_hashes)[flushed],
+                                 self._id_hash([chunk_id for chunk_id, _ in pending])])
+        rows = np.concatenate([np.asarray(self._id_rows)[flushed],
+                               np.array([row for _, row in pending], dtype=np.int64)])
+        order = np.argsort(hashes, kind="stable")
+        return hashes[order], rows[order]
+
+    def count(self):
+        with self._lock:
+            self._maybe_reload()
+            return int(np.count_nonzero(self._alive))
+
+    def get(self, ids=None):
+        with self._lock:
+            self._maybe_reload()
+            if ids is None:
+                rows = np.flatnonzero(self._alive).tolist()
+            else:
+                rows = [row for row in self._find_rows(list(ids)) if row is not None]
+            records = [self._record(row) for row in rows]
+            return {
+                "ids": [record["id"] for record in records],
+                "documents": [record["document"] for record in records],
+                "metadatas": [record["metadata"] for record in records],
+            }
+
+    @staticmethod
+    def _value_key(value):
+        """Key under which equal metadata values share a code, so 10 and 10.0 match"""
+        if _is_number(value):
+            return float(value)
+        return json.dumps(value, sort_keys=True)
+
+    def _values(self, column: int):
+        """Distinct values of a column, by code, and the code of each value key; read on first use"""
+        if column not in self._column_values:
+            values = []
+            if self._values_bytes[column]:
+                with open(self._path("values", column), "rb") as f:
+                    data = f.read(self._values_bytes[column])
+                values = [json.loads(line) for line in data.splitlines()]
+            self._column_values[column] = (values, {self._value_key(value): code for code, value in enumerate(values)})
+        return self._column_values[column]
+
+    def _matching(self, key: str, codes_wanted: List[int]) -> np.ndarray:
+        """Rows whose value for key has one of the given codes"""
+        if key not in self._columns or not codes_wanted:
+            return np.zeros(self._rows, dtype=bool)
+        codes = self._codes[self._columns.index(key)]
+        if len(codes_wanted) == 1:
+            return codes == codes_wanted[0]
+        return np.isin(codes, codes_wanted)
+
+    def _codes_of(self, key: str, wanted) -> List[int]:
+        if key not in self._columns:
+            return []
+        _, code_of = self._values(self._columns.index(key))
+        return [code_of[value_key] for value_key in {self._value_key(value) for value in wanted} if value_key in code_of]
+
+    def _where_mask(self, where: Optional[Dict[str, Any]]) -> np.ndarray:
+        """Evaluate a Chroma-style where clause over the metadata columns"""
+        if not where:
+            return np.ones(self._rows, dtype=bool)
+        mask = np.ones(self._rows, dtype=bool)
+        for key, condition in where.items():
+            if key == "$and":
+                for clause in condition:
+                    mask &= self._where_mask(clause)
+            elif key == "$or":
+                any_mask = np.zeros(self._rows, dtype=bool)
+                for clause in condition:
+                    any_mask |= self._where_mask(clause)
+                mask &= any_mask
+            else:
+                if not isinstance(condition, dict):
+                    condition = {"$eq": condition}
+                for op, value in condition.items():
+                    if op == "$eq":
+                        mask &= self._matching(key, self._codes_of(key, [value]))
+                    elif op == "$ne":
+                        mask &= ~self._matching(key, self._codes_of(key, [value]))
+                    elif op == "$in":
+                        mask &= self._matching(key, self._codes_of(key, value))
+                    elif op == "$nin":
+                        mask &= ~self._matching(key, self._codes_of(key, value))
+                    elif op in ("$gt", "$gte", "$lt", "$lte"):
+                        values = self._values(self._columns.index(key))[0] if key in self._columns else []
+                        if not all(_is_number(v) for v in values):
+                            raise ValueError(f"Range filter on non-numeric metadata field: {key}")
+                        compare = {"$gt": np.greater, "$gte": np.greater_equal,
+                                   "$lt": np.less, "$lte": np.less_equal}[op]
+                        # Compared once per distinct value; rows with the key missing never match
+                        codes = np.flatnonzero(compare(np.array(values, dtype=np.float64), value)) if values else []
+                        mask &= self._matching(key, [int(code) for code in codes])
+                    else:
+                        raise ValueError(f"Unsupported where operator: {op}")
+        return mask
+
+    def query(self, query_embeddings, n_results, where=None, include_embeddings=False):
+        with self._lock:
+            self._maybe_reload()
+            queries = self._normalize(np.asarray(query_embeddings, dtype=np.float32))
+            result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+            if include_embeddings:
+                result["embeddings"] = []
+
+            candidates = np.flatnonzero(self._alive & self._where_mask(where)) if self._rows else np.empty(0, np.int64)
+
+            if self._centroids is None:
+                # Exact search: score all candidates for every query at once, block by block
+                scores = np.empty((len(queries), len(candidates)), dtype=np.float32)
+                for start in range(0, len(candidates), self.BLOCK_ROWS):
+                    rows = candidates[start:start + self.BLOCK_ROWS]
+                    scores[:, start:start + len(rows)] = queries @ self._dequantize(rows).T
+                per_query = [(candidates, scores[i]) for i in range(len(queries))]
+            else:
+                per_query = []
+                probes = np.argsort(-(queries @ self._centroids.T), axis=1)[:, :self.nprobe]
+                for query, probe in zip(queries, probes):
+                    rows = candidates[np.isin(self._list_ids[candidates], probe)]
+                    per_query.append((rows, self._dequantize(rows) @ query if len(rows) else np.empty(0, np.float32)))
+
+            for rows, row_scores in per_query:
+                top = min(n_results, len(rows))
+                best = np.argpartition(-row_scores, top - 1)[:top] if top else np.empty(0, np.int64)
+                best = best[np.argsort(-row_scores[best])]
+                hit_rows = rows[best]
+                records = [self._record(row) for row in hit_rows]
+                result["ids"].append([record["id"] for record in records])
+                result["documents"].append([record["document"] for record in records])
+                result["metadatas"].append([record["metadata"] for record in records])
+                # Cosine distance, so smaller is closer as with Chroma
+                result["distances"].append((1.0 - row_scores[best]).tolist())
+                if include_embeddings:
+                    result["embeddings"].append(self._dequantize(hit_rows).tolist() if len(hit_rows) else [])
+            return result
+
+def create_backend(kind: str, persist_directory: str, collection_name: str) -> VectorBackend:
+    """Build the configured vector backend ("chroma" or "local")"""
+    if kind == "chroma":
+        return ChromaBackend(persist_directory, collection_name)
+    if kind == "local":
+        return LocalMmapBackend(
+            os.path.join(persist_directory, f"{collection_name}_local"),
+            dtype=os.getenv("LOCAL_INDEX_DTYPE", "int8"),
+            ivf_min_rows=int(os.getenv("LOCAL_INDEX_IVF_MIN_ROWS", "20000")),
+            nprobe=int(os.getenv("LOCAL_INDEX_NPROBE", "8")),
+        )
+    raise ValueError(f"Unknown vector backend: {kind}")
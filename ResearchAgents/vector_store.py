@@ -1,72 +1,137 @@
 import os
-import chromadb
-from chromadb.config import Settings
-from langchain_chroma import Chroma
-from langchain_community.embeddings import SentenceTransformerEmbeddings
-from langchain_community.document_loaders import DirectoryLoader, TextLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import json
+import time
+import threading
+import hashlib
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+import numpy as np
+from datetime import datetime
 from langchain_core.documents import Document
-from typing import List, Dict, Any
+from embedding_cache import CachedEmbeddings
+from ttl_cache import TTLCache
+from lexical_index import BM25Index, reciprocal_rank_fusion
+from context_packer import ContextPacker
+from markdown_chunker import MarkdownSectionChunker
+from vector_backends import create_backend
+from typing import List, Dict, Any, Optional, Tuple
 import logging
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+
+# Bump when chunk metadata changes so existing collections are rebuilt
+MANIFEST_VERSION = 3
+
+# Per-process embedding model used by ingestion workers
+_worker_embeddings = None
+
+def _init_embedding_worker(model_name: str):
+    """Load the embedding model once in each ingestion worker process"""
+    global _worker_embeddings
+    from langchain_community.embeddings import SentenceTransformerEmbeddings
+    _worker_embeddings = SentenceTransformerEmbeddings(model_name=model_name)
+
+def _embed_batch(texts: List[str]) -> List[List[float]]:
+    """Embed one batch of texts inside an ingestion worker process"""
+    return _worker_embeddings.embed_documents(texts)
+
 class ResearchVectorStore:
     """
-    Manages the vector store for equity research documents using ChromaDB
+    Manages the vector store for equity research documents.
+    
+    Vectors live in a pluggable backend: ChromaDB by default, or a quantized,
+    memory-mapped local index (VECTOR_BACKEND=local) for lower memory use.
     """
     
-    def __init__(self, persist_directory: str = "./chroma_db"):
+    def __init__(self, persist_directory: str = "./chroma_db",
+                 ingest_batch_size: int = None, ingest_workers: int = None,
+                 backend: str = None):
         self.persist_directory = persist_directory
         self.collection_name = "equity_research"
         
-        # Initialize embeddings using SentenceTransformers (compatible with LangChain)
-        self.embeddings = SentenceTransformerEmbeddings(
-            model_name="all-MiniLM-L6-v2"
-        )
+        # Storage backend: "chroma" (default) or "local" (quantized, memory-mapped)
+        self.backend_name = backend or os.getenv("VECTOR_BACKEND", "chroma")
+        # Each backend keeps its own manifest and lexical index so switching
+        # backends never mixes up what has been ingested where
+        suffix = "" if self.backend_name == "chroma" else f"_{self.backend_name}"
+        self.manifest_path = os.path.join(persist_directory, f"ingest_manifest{suffix}.json")
         
-        # Initialize ChromaDB
-        self.client = chromadb.PersistentClient(path=persist_directory)
+        # "hybrid" fuses BM25 and vector ranks; "vector" is dense search only
+        self.search_mode = os.getenv("SEARCH_MODE", "hybrid")
         
-        # Initialize Chroma vector store with LangChain-compatible embedding function
-        self.vectorstore = Chroma(
-            client=self.client,
-            collection_name=self.collection_name,
-            embedding_function=self.embeddings,
+        # Ingestion pipeline settings: chunks per embedding batch and number of
+        # embedding worker processes (0 or 1 embeds in-process)
+        self.ingest_batch_size = ingest_batch_size or int(os.getenv("INGEST_BATCH_SIZE", "64"))
+        if ingest_workers is None:
+            ingest_workers = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+        self.ingest_workers = ingest_workers
+        self.chunk_max_tokens = int(os.getenv("CHUNK_MAX_TOKENS", "400"))
+        
+        # Assembled context strings keyed by (company, query, k, collection version);
+        # the version is bumped on every write so stale entries are never served
+        self.collection_version = 0
+        self.context_cache = TTLCache(
+            max_size=int(os.getenv("CONTEXT_CACHE_SIZE", "256")),
+            ttl_seconds=float(os.getenv("CONTEXT_CACHE_TTL", "600"))
+        )
+        
+        # Initialize embeddings using SentenceTransformers (compatible with LangChain),
+        # behind a persistent cache so repeated texts and queries are encoded once.
+        # Imported here: it pulls in torch, which is slow to load at API startup.
+        from langchain_community.embeddings import SentenceTransformerEmbeddings
+        self.embeddings = CachedEmbeddings(
+            SentenceTransformerEmbeddings(model_name=EMBEDDING_MODEL_NAME),
+            model_name=EMBEDDING_MODEL_NAME,
+            cache_dir=os.path.join(persist_directory, "embedding_cache"),
         )
         
-        logger.info(f"ChromaDB initialized at {persist_directory}")
+        # Initialize the vector backend
+        self.backend = create_backend(self.backend_name, persist_directory, self.collection_name)
+        
+        # Lexical index kept next to the collection for exact-token matches
+        self.lexical_index = BM25Index(os.path.join(persist_directory, f"lexical_index{suffix}.json"))
+        self._load_lexical_index()
+        
+        # Callbacks told which companies' documents were added or removed
+        self._change_listeners = []
+        
+        # The writing process records after every ingestion pass which companies
+        # changed, under a version number; the others follow it on their next read
+        self.changes_path = os.path.join(persist_directory, f"changes{suffix}.json")
+        self._changes_lock = threading.Lock()
+        self._unpublished_companies = set()
+        self._changes_stamp, changes = self._read_changes()
+        self._changes_version = changes["version"]
+        
+        logger.info(f"Vector store ({self.backend_name}) initialized at {persist_directory}")
+    
+    def _load_lexical_index(self):
+        """Load the lexical index, rebuilding it from the collection if it is missing or stale"""
+        if self.lexical_index.load() and len(self.lexical_index) == self.backend.count():
+            return
+        
+        existing = self.backend.get()
+        self.lexical_index = BM25Index(self.lexical_index.index_path)
+        self.lexical_index.add(existing["ids"], existing["documents"], existing["metadatas"])
+        # Only the process that owns the index persists it; others keep theirs in memory
+        if self.backend.acquire_writer():
+            self.lexical_index.save()
+        logger.info(f"Rebuilt lexical index from {len(existing['ids'])} chunks")
     
     def load_documents_from_directory(self, docs_path: str) -> List[Document]:
         """Load and split documents from the docs directory"""
         try:
             # Load markdown files
-            loader = DirectoryLoader(
-                docs_path, 
-                glob="*.md",
-                loader_cls=TextLoader,
-                loader_kwargs={"encoding": "utf-8"}
-            )
-            documents = loader.load()
-            
-            # Split documents into chunks
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1000,
-                chunk_overlap=200,
-                separators=["\n## ", "\n### ", "\n#### ", "\n\n", "\n", " ", ""]
-            )
-            
-            split_docs = text_splitter.split_documents(documents)
-            
-            # Add metadata for better retrieval
-            for doc in split_docs:
-                # Extract company code from filename
-                filename = os.path.basename(doc.metadata.get('source', ''))
-                company_code = filename.split('_')[0] if '_' in filename else 'UNKNOWN'
-                doc.metadata['company_code'] = company_code
-                doc.metadata['document_type'] = 'research_report'
+            documents = [
+                _load_markdown(os.path.join(docs_path, filename))
+                for filename in sorted(os.listdir(docs_path)) if filename.endswith(".md")
+            ]
+            
+            split_docs = self._split_documents(documents)
             
             logger.info(f"Loaded {len(split_docs)} document chunks from {docs_path}")
             return split_docs
@@ -75,11 +140,36 @@ class ResearchVectorStore:
             logger.error(f"Error loading documents: {e}")
             return []
     
+    def _split_documents(self, documents: List[Document]) -> List[Document]:
+        """Split loaded documents into chunks and tag them with retrieval metadata"""
+        # Split documents along their Markdown sections; each chunk carries its
+        # heading, section path and byte offsets
+        text_splitter = MarkdownSectionChunker(max_tokens=self.chunk_max_tokens)
+        
+        split_docs = text_splitter.split_documents(documents)
+        
+        # Add metadata for better retrieval
+        for doc in split_docs:
+            # Extract company code from filename
+            filename = os.path.basename(doc.metadata.get('source', ''))
+            company_code = filename.split('_')[0] if '_' in filename else 'UNKNOWN'
+            doc.metadata['company_code'] = company_code
+            doc.metadata['document_type'] = 'research_report'
+            # Epoch seconds so Chroma can range-filter on it
+            doc.metadata['document_date'] = int(os.path.getmtime(doc.metadata['source'])) if os.path.exists(doc.metadata.get('source', '')) else 0
+        
+        return split_docs
+    
     def add_documents_to_store(self, documents: List[Document]):
         """Add documents to the vector store"""
         try:
-            if documents:
-                self.vectorstore.add_documents(documents)
+            if not self.backend.acquire_writer():
+                logger.warning("Vector store is written by another process; not adding documents")
+            elif documents:
+                self.ingest_documents(documents)
+                self.backend.flush()
+                self.lexical_index.save()
+                self._publish_changes()
                 logger.info(f"Added {len(documents)} documents to vector store")
             else:
                 logger.warning("No documents to add to vector store")
@@ -87,43 +177,317 @@ class ResearchVectorStore:
             logger.error(f"Error adding documents to vector store: {e}")
     
     def setup_vector_store(self, docs_path: str = "./docs"):
-        """Initialize the vector store with research documents"""
+        """Initialize the vector store with research documents.
+        
+        Ingestion is incremental: a manifest of per-file and per-chunk content
+        hashes is kept next to the Chroma data, so only chunks of new or edited
+        files are embedded and chunks of deleted files are removed.
+        """
+        docs_directory = os.path.join(os.path.dirname(__file__), docs_path)
+        if not os.path.exists(docs_directory):
+            logger.error(f"Docs directory not found: {docs_directory}")
+            return
+        
+        try:
+            self.sync_documents(docs_directory)
+        except Exception as e:
+            logger.error(f"Error syncing documents from {docs_directory}: {e}")
+    
+    def sync_documents(self, docs_directory: str) -> Dict[str, int]:
+        """Bring the collection in line with the markdown files in docs_directory"""
+        stats = {"files_changed": 0, "files_removed": 0, "chunks_added": 0, "chunks_updated": 0, "chunks_removed": 0}
+        if not self.backend.acquire_writer():
+            # Another worker owns the index and ingests; this one serves what it flushes
+            logger.info(f"Vector store ({self.backend_name}) is written by another process; skipping sync")
+            return stats
+        
+        manifest = self._load_manifest()
+        if manifest is None or manifest.get("version") != MANIFEST_VERSION:
+            # No manifest: the collection was built by an older version with
+            # random chunk ids or different chunk metadata, so it cannot be
+            # diffed. Rebuild it once.
+            self._clear_collection()
+            manifest = {"version": MANIFEST_VERSION, "files": {}}
+        elif manifest["files"] and self.backend.count() == 0:
+            # Collection was wiped behind our back; re-ingest everything
+            manifest = {"version": MANIFEST_VERSION, "files": {}}
+
+        known_files = manifest["files"]
+        current_files = {}
+        for filename in sorted(os.listdir(docs_directory)):
+            if filename.endswith(".md"):
+                current_files[filename] = os.path.join(docs_directory, filename)
+        
+        # Drop chunks belonging to files that no longer exist
+        for filename in list(known_files):
+            if filename not in current_files:
+                stale_ids = known_files.pop(filename)["chunk_ids"]
+                self._delete_chunks(stale_ids)
+                stats["files_removed"] += 1
+                stats["chunks_removed"] += len(stale_ids)
+        
+        pending_chunks, pending_ids = [], []
+        for filename, path in current_files.items():
+            with open(path, "rb") as f:
+                file_hash = hashlib.sha256(f.read()).hexdigest()
+            
+            entry = known_files.get(filename)
+            if entry and entry["file_hash"] == file_hash:
+                continue
+            
+            chunks, chunk_ids = self._chunk_file(filename, path)
+            old_ids = set(entry["chunk_ids"]) if entry else set()
+            new_ids = set(chunk_ids)
+            
+            to_remove = [chunk_id for chunk_id in old_ids if chunk_id not in new_ids]
+            
+            # Retained chunks are re-upserted too: their byte offsets, section
+            # path and document date depend on the rest of the file. Their
+            # vectors come from the embedding cache, so only new text is embedded.
+            pending_chunks.extend(chunks)
+            pending_ids.extend(chunk_ids)
+            self._delete_chunks(to_remove)
+            
+            known_files[filename] = {"file_hash": file_hash, "chunk_ids": chunk_ids}
+            stats["files_changed"] += 1
+            stats["chunks_added"] += len(new_ids - old_ids)
+            stats["chunks_updated"] += len(new_ids & old_ids)
+            stats["chunks_removed"] += len(to_remove)
+        
+        # Embed and upsert all new chunks in one pipelined pass. The manifest is
+        # only written afterwards; an interrupted sync simply re-upserts.
+        if pending_chunks:
+            self.ingest_documents(pending_chunks, ids=pending_ids)
+        
+        self.backend.flush()
+        self._save_manifest(manifest)
+        self.lexical_index.save()
+        self._publish_changes()
+        logger.info(f"Vector store sync complete: {stats}")
+        return stats
+    
+    def ingest_documents(self, documents: List[Document], ids: List[str] = None) -> Dict[str, float]:
+        """Embed documents in batches and stream upserts into the backend.
+        
+        Batches are encoded across a process pool while completed batches are
+        written to the collection, so backend writes overlap with encoding.
+        """
+        if not documents:
+            return {"chunks": 0, "seconds": 0.0, "chunks_per_second": 0.0}
+        if ids is None:
+            ids = [hashlib.sha256(f"{doc.metadata.get('source', '')}\0{doc.page_content}".encode("utf-8")).hexdigest()
+                   for doc in documents]
+        
+        started = time.perf_counter()
+        batch_size = max(1, self.ingest_batch_size)
+        batches = [(documents[i:i + batch_size], ids[i:i + batch_size])
+                   for i in range(0, len(documents), batch_size)]
+        
+        if self.ingest_workers <= 1 or len(batches) == 1:
+            # Spawning workers and loading the model per process costs more
+            # than it saves for small diffs
+            for batch_docs, batch_ids in batches:
+                embeddings = self.embeddings.embed_documents([doc.page_content for doc in batch_docs])
+                self._upsert_batch(batch_docs, batch_ids, embeddings)
+        else:
+            workers = min(self.ingest_workers, len(batches))
+            # spawn, not fork: torch state does not survive fork reliably
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                     initializer=_init_embedding_worker,
+                                     initargs=(EMBEDDING_MODEL_NAME,)) as pool:
+                pending = {}
+                next_batch = 0
+                # Keep a bounded number of batches in flight so memory stays flat
+                while next_batch < len(batches) or pending:
+                    while next_batch < len(batches) and len(pending) < workers * 2:
+                        batch_docs, batch_ids = batches[next_batch]
+                        next_batch += 1
+                        texts = [doc.page_content for doc in batch_docs]
+                        cached = self.embeddings.lookup(texts)
+                        missing = [i for i, vector in enumerate(cached) if vector is None]
+                        if not missing:
+                            self._upsert_batch(batch_docs, batch_ids, cached)
+                            continue
+                        future = pool.submit(_embed_batch, [texts[i] for i in missing])
+                        pending[future] = (batch_docs, batch_ids, cached, missing)
+                    if not pending:
+                        continue
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        batch_docs, batch_ids, embeddings, missing = pending.pop(future)
+                        computed = future.result()
+                        self.embeddings.store([batch_docs[i].page_content for i in missing], computed)
+                        for i, vector in zip(missing, computed):
+                            embeddings[i] = vector
+                        self._upsert_batch(batch_docs, batch_ids, embeddings)
+        
+        elapsed = time.perf_counter() - started
+        throughput = len(documents) / elapsed if elapsed > 0 else 0.0
+        logger.info(f"Ingested {len(documents)} chunks in {elapsed:.2f}s ({throughput:.1f} chunks/s)")
+        return {"chunks": len(documents), "seconds": elapsed, "chunks_per_second": throughput}
+    
+    def _upsert_batch(self, documents: List[Document], ids: List[str], embeddings: List[List[float]]):
+        """Write one batch of pre-embedded chunks to the collection"""
+        self.backend.upsert(
+            ids=ids,
+            embeddings=embeddings,
+            documents=[doc.page_content for doc in documents],
+            metadatas=[doc.metadata for doc in documents],
+        )
+        self.lexical_index.add(ids, [doc.page_content for doc in documents], [doc.metadata for doc in documents])
+        self._collection_changed({doc.metadata.get("company_code", "UNKNOWN") for doc in documents})
+    
+    def _collection_changed(self, company_codes):
+        """Account for a write by this process: local caches now, other processes once published"""
+        self._bump_collection_version()
+        self._unpublished_companies |= company_codes
+        self._notify_change(company_codes)
+    
+    def _bump_collection_version(self):
+        """Invalidate cached contexts after any write to the collection"""
+        self.collection_version += 1
+    
+    def _changes_file_stamp(self):
+        try:
+            stat = os.stat(self.changes_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    
+    def _read_changes(self):
+        """Stamp and contents of the published change record"""
+        stamp = self._changes_file_stamp()
         try:
-            # Check if vector store already has documents
-            collection = self.client.get_collection(self.collection_name)
-            if collection.count() > 0:
-                logger.info(f"Vector store already contains {collection.count()} documents")
+            with open(self.changes_path, "r", encoding="utf-8") as f:
+                return stamp, json.load(f)
+        except (FileNotFoundError, ValueError):
+            return stamp, {"version": 0, "companies": {}}
+    
+    def _publish_changes(self):
+        """Record the companies changed since the last publication, after the index files are saved"""
+        with self._changes_lock:
+            if not self._unpublished_companies:
                 return
-        except:
-            # Collection doesn't exist yet, that's fine
-            pass
+            _, changes = self._read_changes()
+            changes["version"] = max(changes["version"], self._changes_version) + 1
+            for company_code in self._unpublished_companies:
+                changes["companies"][company_code] = changes["version"]
+            tmp_path = self.changes_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(changes, f)
+            os.replace(tmp_path, self.changes_path)
+            self._changes_stamp = self._changes_file_stamp()
+            self._changes_version = changes["version"]
+            self._unpublished_companies = set()
+    
+    def _follow_writer(self):
+        """Catch up with ingestion passes published by another process.
         
-        # Load and add documents
-        docs_directory = os.path.join(os.path.dirname(__file__), docs_path)
-        if os.path.exists(docs_directory):
-            documents = self.load_documents_from_directory(docs_directory)
-            if documents:
-                self.add_documents_to_store(documents)
+        The backend itself remaps the writer's files; what this process keeps
+        on top of them (lexical index, context cache, change listeners such as
+        the report cache) is refreshed here.
+        """
+        if self._changes_file_stamp() == self._changes_stamp:
+            return
+        with self._changes_lock:
+            stamp, changes = self._read_changes()
+            if stamp == self._changes_stamp:
+                return
+            if changes["version"] < self._changes_version:
+                # The record was reset (e.g. the persist directory was rebuilt)
+                changed = set(changes["companies"])
             else:
-                logger.warning(f"No documents found in {docs_directory}")
-        else:
-            logger.error(f"Docs directory not found: {docs_directory}")
+                changed = {company_code for company_code, version in changes["companies"].items()
+                           if version > self._changes_version}
+            self._changes_stamp, self._changes_version = stamp, changes["version"]
+        logger.info(f"Vector store changed in another process for {sorted(changed)}; reloading")
+        self.lexical_index.load()
+        self._bump_collection_version()
+        self._notify_change(changed)
+    
+    def add_change_listener(self, callback):
+        """Call callback(company_codes) whenever chunks for those companies are added or removed"""
+        self._change_listeners.append(callback)
+    
+    def _notify_change(self, company_codes):
+        for callback in self._change_listeners:
+            try:
+                callback(company_codes)
+            except Exception as e:
+                logger.error(f"Error in vector store change listener: {e}")
+    
+    def _chunk_file(self, filename: str, path: str) -> Tuple[List[Document], List[str]]:
+        """Split one file and derive content-addressed ids for its chunks"""
+        documents = [_load_markdown(path)]
+        chunks = self._split_documents(documents)
+        
+        unique_chunks, chunk_ids = [], []
+        seen = set()
+        for chunk in chunks:
+            chunk_id = hashlib.sha256(f"{filename}\0{chunk.page_content}".encode("utf-8")).hexdigest()
+            # Identical chunks within a file would collide on id; keep one
+            if chunk_id in seen:
+                continue
+            seen.add(chunk_id)
+            unique_chunks.append(chunk)
+            chunk_ids.append(chunk_id)
+        
+        return unique_chunks, chunk_ids
+    
+    def _delete_chunks(self, chunk_ids: List[str]):
+        """Remove chunks from the collection by id"""
+        if chunk_ids:
+            metadatas = self.backend.get(ids=list(chunk_ids))["metadatas"]
+            company_codes = {(metadata or {}).get("company_code", "UNKNOWN") for metadata in metadatas}
+            self.backend.delete(list(chunk_ids))
+            self.lexical_index.remove(chunk_ids)
+            self._collection_changed(company_codes)
+    
+    def _clear_collection(self):
+        """Remove every chunk from the collection"""
+        existing_ids = self.backend.get()["ids"]
+        if existing_ids:
+            logger.info(f"Rebuilding collection: removing {len(existing_ids)} untracked chunks")
+            self._delete_chunks(existing_ids)
+    
+    def _load_manifest(self):
+        """Read the ingestion manifest, or None if it does not exist yet"""
+        if not os.path.exists(self.manifest_path):
+            return None
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable manifest {self.manifest_path}: {e}")
+            return None
     
-    # private
-    def __search_similar_documents(self, query: str, company_code: str = None, k: int = 5) -> List[Document]:
+    def _save_manifest(self, manifest: Dict[str, Any]):
+        """Atomically write the ingestion manifest"""
+        os.makedirs(self.persist_directory, exist_ok=True)
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+    
+    def search_similar_documents(self, query: str, company_code: str = None, k: int = 5) -> List[Document]:
         """Search for similar documents in the vector store"""
         try:
+            self._follow_writer()
             # Build filter if company code is specified
             filter_dict = None
             if company_code:
                 filter_dict = {"company_code": company_code}
             
-            # Search similar documents
-            results = self.vectorstore.similarity_search(
-                query, 
-                k=k,
-                filter=filter_dict
-            )
+            if self.search_mode == "hybrid":
+                results = self._hybrid_search(query, k, filter_dict)
+            else:
+                # Search similar documents
+                dense = self.backend.query([self.embeddings.embed_query(query)], k, where=filter_dict)
+                results = [
+                    Document(page_content=text, metadata=metadata or {})
+                    for text, metadata in zip(dense["documents"][0], dense["metadatas"][0])
+                ]
             
             logger.info(f"Found {len(results)} similar documents for query: {query[:50]}...")
             return results
@@ -132,58 +496,238 @@ class ResearchVectorStore:
             logger.error(f"Error searching documents: {e}")
             return []
     
-    def get_context_for_company(self, company_code: str, query: str = "", k: int = 10) -> str:
+    def _hybrid_search(self, query: str, k: int, filter_dict: Dict[str, Any] = None) -> List[Document]:
+        """Fuse BM25 and dense vector rankings with reciprocal-rank fusion"""
+        candidates = max(k * 2, 20)
+        
+        lexical_ids = [chunk_id for chunk_id, _ in self.lexical_index.search(query, candidates, filter_dict)]
+        
+        dense = self.backend.query([self.embeddings.embed_query(query)], candidates, where=filter_dict)
+        dense_ids = dense["ids"][0]
+        chunks = {
+            chunk_id: Document(page_content=text, metadata=metadata or {})
+            for chunk_id, text, metadata in zip(dense_ids, dense["documents"][0], dense["metadatas"][0])
+        }
+        
+        fused_ids = [chunk_id for chunk_id, _ in reciprocal_rank_fusion([lexical_ids, dense_ids])[:k]]
+        
+        # Lexical-only hits were not returned by the dense query; fetch their text
+        missing = [chunk_id for chunk_id in fused_ids if chunk_id not in chunks]
+        if missing:
+            fetched = self.backend.get(ids=missing)
+            for chunk_id, text, metadata in zip(fetched["ids"], fetched["documents"], fetched["metadatas"]):
+                chunks[chunk_id] = Document(page_content=text, metadata=metadata or {})
+        
+        return [chunks[chunk_id] for chunk_id in fused_ids if chunk_id in chunks]
+    
+    def search_documents(self, query: str, company_code: str = None, k: int = 5,
+                         filters: Dict[str, Any] = None, search_type: str = "similarity",
+                         score_threshold: float = None, fetch_k: int = 20,
+                         lambda_mult: float = 0.5) -> List[Tuple[Document, float]]:
+        """Search with scores, metadata filters and optional MMR diversification"""
+        return self.search_documents_batch(
+            [query], company_code, k, filters, search_type, score_threshold, fetch_k, lambda_mult
+        )[0]
+    
+    def search_documents_batch(self, queries: List[str], company_code: str = None, k: int = 5,
+                               filters: Dict[str, Any] = None, search_type: str = "similarity",
+                               score_threshold: float = None, fetch_k: int = 20,
+                               lambda_mult: float = 0.5) -> List[List[Tuple[Document, float]]]:
+        """
+        Run several searches in one backend query.
+        
+        Queries are embedded as a single matrix and filters are pushed down into
+        the backend's where clause. Each result is a (document, cosine similarity)
+        pair; search_type "mmr" re-ranks fetch_k candidates for diversity, and
+        score_threshold drops results below the given similarity.
+        """
+        if search_type not in ("similarity", "mmr"):
+            raise ValueError(f"Unsupported search_type: {search_type}")
+        if not queries:
+            return []
+        
+        query_vectors = np.asarray(self.embeddings.embed_queries(queries), dtype=np.float32)
+        n_results = max(k, fetch_k) if search_type == "mmr" else k
+        
+        response = self.backend.query(
+            query_vectors.tolist(),
+            n_results,
+            where=build_where_filter(company_code, filters),
+            include_embeddings=True
+        )
+        
+        all_results = []
+        for i, query_vector in enumerate(query_vectors):
+            texts = response["documents"][i]
+            if not texts:
+                all_results.append([])
+                continue
+            metadatas = response["metadatas"][i]
+            doc_vectors = np.asarray(response["embeddings"][i], dtype=np.float32)
+            scores = _cosine_similarity(query_vector, doc_vectors)
+            
+            if search_type == "mmr":
+                order = maximal_marginal_relevance(query_vector, doc_vectors, k, lambda_mult)
+            else:
+                order = list(range(min(k, len(texts))))
+            
+            results = []
+            for j in order:
+                score = float(scores[j])
+                if score_threshold is not None and score < score_threshold:
+                    continue
+                results.append((Document(page_content=texts[j], metadata=metadatas[j] or {}), score))
+            all_results.append(results)
+        
+        logger.info(f"Searched {len(queries)} queries ({search_type}), {sum(len(r) for r in all_results)} results")
+        return all_results
+    
+    def get_context_for_company(self, company_code: str, query: str = "", k: int = 10, token_budget: int = 1500) -> str:
         """Get relevant context for a specific company"""
+        return self.get_packed_context(company_code, query, k, token_budget)["context"]
+    
+    def get_packed_context(self, company_code: str, query: str = "", k: int = 10, token_budget: int = 1500) -> Dict[str, Any]:
+        """Get relevant context for a company packed into a token budget, with packing stats"""
         try:
             # If no specific query, get general company information
             search_query = query if query else f"{company_code} financial performance business overview"
             
+            self._follow_writer()
+            cache_key = (company_code, search_query, k, token_budget, self.collection_version)
+            cached_context = self.context_cache.get(cache_key)
+            if cached_context is not None:
+                logger.info(f"Context cache hit for {company_code}")
+                return cached_context
+            
             # Search for relevant documents
-            docs = self.__search_similar_documents(search_query, company_code, k)
+            docs = self.search_similar_documents(search_query, company_code, k)
             
             if not docs:
-                return f"No research context found for {company_code}"
-            
-            # Combine the content from retrieved documents
-            context_parts = []
-            for i, doc in enumerate(docs):
-                content = doc.page_content.strip()
-                if content:
-                    context_parts.append(f"Context {i+1}:\n{content}")
+                return {"context": f"No research context found for {company_code}", "tokens_used": 0, "chunks_used": 0, "chunks_dropped": 0}
             
-            context = "\n\n".join(context_parts)
+            # Dedupe overlapping chunks and fill the token budget by relevance
+            packed = ContextPacker(token_budget).pack(docs)
+            self.context_cache.set(cache_key, packed)
             
-            logger.info(f"Retrieved {len(docs)} context documents for {company_code}")
-            return context
+            logger.info(f"Retrieved {len(docs)} context documents for {company_code}, "
+                        f"packed {packed['chunks_used']} into {packed['tokens_used']} tokens")
+            return packed
             
         except Exception as e:
             logger.error(f"Error getting context for {company_code}: {e}")
-            return f"Error retrieving context for {company_code}: {str(e)}"
+            return {"context": f"Error retrieving context for {company_code}: {str(e)}", "tokens_used": 0, "chunks_used": 0, "chunks_dropped": 0}
     
     def get_collection_stats(self) -> Dict[str, Any]:
         """Get statistics about the vector store collection"""
         try:
-            collection = self.client.get_collection(self.collection_name)
             return {
-                "total_documents": collection.count(),
+                "total_documents": self.backend.count(),
+                "backend": self.backend_name,
                 "collection_name": self.collection_name,
-                "persist_directory": self.persist_directory
+                "persist_directory": self.persist_directory,
+                "collection_version": self.collection_version,
+                "embedding_cache": self.embeddings.get_stats(),
+                "context_cache": self.context_cache.get_stats()
             }
         except Exception as e:
             logger.error(f"Error getting collection stats: {e}")
             return {"error": str(e)}
 
+def _load_markdown(path: str) -> Document:
+    """Read a Markdown file with its line endings intact, so chunk byte offsets match the file"""
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        return Document(page_content=f.read(), metadata={"source": path})
+
+def _parse_date(value) -> int:
+    """Accept epoch seconds or an ISO date/datetime string"""
+    if isinstance(value, (int, float)):
+        return int(value)
+    return int(datetime.fromisoformat(value).timestamp())
+
+def build_where_filter(company_code: str = None, filters: Dict[str, Any] = None) -> Dict[str, Any]:
+    """
+    Translate search filters into a Chroma where clause.
+    
+    Supports company_code, document_type, section and heading (a value or a
+    list of values) and date_from/date_to bounds on the document date.
+    """
+    filters = dict(filters or {})
+    if company_code:
+        filters.setdefault("company_code", company_code)
+    
+    clauses = []
+    for key in ("company_code", "document_type", "section", "heading"):
+        value = filters.get(key)
+        if isinstance(value, (list, tuple)):
+            clauses.append({key: {"$in": list(value)}})
+        elif value:
+            clauses.append({key: value})
+    if filters.get("date_from") is not None:
+        clauses.append({"document_date": {"$gte": _parse_date(filters["date_from"])}})
+    if filters.get("date_to") is not None:
+        clauses.append({"document_date": {"$lte": _parse_date(filters["date_to"])}})
+    
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+def _cosine_similarity(query_vector: np.ndarray, doc_vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(doc_vectors, axis=1) * np.linalg.norm(query_vector)
+    return doc_vectors @ query_vector / np.where(norms == 0, 1, norms)
+
+def maximal_marginal_relevance(query_vector: np.ndarray, doc_vectors: np.ndarray,
+                               k: int, lambda_mult: float = 0.5) -> List[int]:
+    """Pick k candidate indices balancing relevance to the query against redundancy"""
+    if len(doc_vectors) == 0:
+        return []
+    relevance = _cosine_similarity(query_vector, doc_vectors)
+    normalized = doc_vectors / np.maximum(np.linalg.norm(doc_vectors, axis=1, keepdims=True), 1e-12)
+    pairwise = normalized @ normalized.T
+    
+    selected = [int(np.argmax(relevance))]
+    while len(selected) < min(k, len(doc_vectors)):
+        redundancy = pairwise[:, selected].max(axis=1)
+        mmr_scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        mmr_scores[selected] = -np.inf
+        selected.append(int(np.argmax(mmr_scores)))
+    return selected
+
 # Global instance
 research_vectorstore = None
+_research_vectorstore_lock = threading.Lock()
 
 def get_research_vectorstore() -> ResearchVectorStore:
     """Get or create the global research vector store instance"""
     global research_vectorstore
     if research_vectorstore is None:
-        research_vectorstore = ResearchVectorStore()
-        research_vectorstore.setup_vector_store()
+        # Concurrent requests may race here from worker threads; build it once
+        with _research_vectorstore_lock:
+            if research_vectorstore is None:
+                vectorstore = ResearchVectorStore()
+                vectorstore.setup_vector_store()
+                research_vectorstore = vectorstore
     return research_vectorstore
 
+# Background warm-up of the global instance (model load and ingestion)
+_warmup_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vectorstore-warmup")
+_warmup_future = None
+_warmup_lock = threading.Lock()
+
+def start_vectorstore_warmup() -> Future:
+    """Start building the global vector store in the background; returns its future.
+    
+    Calls share one future. A failed warm-up is retried on the next call.
+    """
+    global _warmup_future
+    with _warmup_lock:
+        if _warmup_future is None or (_warmup_future.done() and _warmup_future.exception() is not None):
+            _warmup_future = _warmup_executor.submit(initialize_vector_store)
+        return _warmup_future
+
+def get_vectorstore_warmup() -> Optional[Future]:
+    """The current warm-up future, or None if warm-up has not been started"""
+    return _warmup_future
+
 def initialize_vector_store():
     """Initialize the vector store - call this on startup"""
     logger.info("Initializing research vector store...")
@@ -1,4 +1,15 @@
+import asyncio
+import hashlib
+import heapq
+import itertools
+import json
 import operator
+import os
+import random
+import re
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
 from pydantic import BaseModel, Field
 from typing import Annotated, List
 from typing_extensions import TypedDict
@@ -6,14 +17,261 @@ from typing_extensions import TypedDict
 from langchain_community.document_loaders import WikipediaLoader
 from langchain_community.tools.tavily_search import TavilySearchResults
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, get_buffer_string
+from langchain_core.runnables import RunnableConfig
 from langchain_openai import ChatOpenAI
 
 from langgraph.constants import Send
 from langgraph.graph import END, MessagesState, START, StateGraph
+from langgraph.types import StreamWriter
 
 ### LLM
 
-llm = ChatOpenAI(model="gpt-4o", temperature=0) 
+# Retries are left to the scheduler below, so a 429 backs off the whole provider
+llm = ChatOpenAI(model="gpt-4o", temperature=0, max_retries=0, include_response_headers=True) 
+
+### Scheduling
+
+# Default per-provider limits, shared by every run in the process. A run can add
+# tighter limits of its own with "provider_limits" in the configurable,
+# e.g. {"openai": {"requests_per_minute": 60, "max_concurrency": 2}}
+provider_limits = {
+    "openai": {"requests_per_minute": 500, "burst": 20, "max_concurrency": 8},
+    "tavily": {"requests_per_minute": 100, "burst": 5, "max_concurrency": 4},
+    "wikipedia": {"requests_per_minute": 200, "burst": 5, "max_concurrency": 4},
+}
+
+# Scheduling priority of the final report writers, ahead of every interview
+report_priority = 1000
+
+def parse_wait(value) -> float:
+    """ Seconds from a rate-limit header value: "2", "0.5", "20ms", "6m0s" or an HTTP date """
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|s|m|h)", value)
+    if parts and "".join(number + unit for number, unit in parts) == value:
+        return sum(float(number) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit] for number, unit in parts)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def lower_headers(headers) -> dict:
+    return {str(name).lower(): value for name, value in dict(headers or {}).items()}
+
+def retry_after(headers) -> float:
+    """ How long a rate-limited provider asks us to wait, if its headers say """
+    headers = lower_headers(headers)
+    if "retry-after-ms" in headers:
+        wait = parse_wait(headers["retry-after-ms"])
+        if wait is not None:
+            return wait / 1000
+    for name in ("retry-after", "x-ratelimit-reset-requests", "x-ratelimit-reset-tokens"):
+        wait = parse_wait(headers.get(name))
+        if wait is not None:
+            return wait
+    return None
+
+def exhausted_wait(headers) -> float:
+    """ Wait until the next window when a successful response reports no requests or tokens left """
+    headers = lower_headers(headers)
+    waits = [
+        parse_wait(headers.get(f"x-ratelimit-reset-{kind}"))
+        for kind in ("requests", "tokens")
+        if str(headers.get(f"x-ratelimit-remaining-{kind}", "")).strip() == "0"
+    ]
+    return max([wait for wait in waits if wait is not None], default=None)
+
+def error_status(error: Exception):
+    return getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+
+def is_rate_limited(error: Exception) -> bool:
+    return error_status(error) == 429
+
+def is_transient(error: Exception) -> bool:
+    status = error_status(error)
+    return (isinstance(status, int) and status >= 500) or isinstance(error, (asyncio.TimeoutError, ConnectionError)) \
+        or type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+
+class ProviderLimiter:
+    """ Concurrency slots, a token bucket and adaptive backoff for one provider.
+
+    Waiting calls get a free slot in priority order (highest first, then first
+    come), then take a token from a bucket refilled at the current rate. A 429
+    halves the rate and pauses the provider for as long as its headers ask;
+    each success wins back a little of the configured rate.
+
+    A limiter with a parent also takes a slot and a token from the parent, and
+    passes rate-limit feedback on to it, so both sets of limits hold. """
+
+    def __init__(self, requests_per_minute: float, burst: int, max_concurrency: int, parent=None):
+        self.max_rate = requests_per_minute / 60
+        self.burst = max(1, burst)
+        self.max_concurrency = max(1, max_concurrency)
+        self.parent = parent
+        self.rate = self.max_rate # tokens per second
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.active = 0
+        self.waiters = [] # heap of (-priority, arrival, future)
+        self.arrivals = itertools.count()
+
+    def _wake(self):
+        while self.waiters and self.active < self.max_concurrency:
+            _, _, future = heapq.heappop(self.waiters)
+            if not future.done():
+                self.active += 1
+                future.set_result(None)
+
+    async def acquire(self, priority: float = 0):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (-priority, next(self.arrivals), future))
+        self._wake()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release()
+            raise
+        try:
+            await self._take_token()
+            if self.parent is not None:
+                await self.parent.acquire(priority)
+        except asyncio.CancelledError:
+            self._release()
+            raise
+
+    def release(self):
+        self._release()
+        if self.parent is not None:
+            self.parent.release()
+
+    def _release(self):
+        self.active -= 1
+        self._wake()
+
+    async def _take_token(self):
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def on_rate_limited(self, wait: float):
+        # 429s from calls already in flight when the first one arrived count once
+        if time.monotonic() >= self.paused_until:
+            self.rate = max(self.max_rate / 16, self.rate / 2)
+        self.tokens = 0.0
+        self.pause(wait)
+        if self.parent is not None:
+            self.parent.on_rate_limited(wait)
+
+    def on_success(self, headers=None):
+        self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+        wait = exhausted_wait(headers)
+        if wait:
+            self.pause(wait)
+        if self.parent is not None:
+            self.parent.on_success(headers)
+
+class BranchScheduler:
+    """ Runs the LLM and search calls of Send()-spawned branches under per-provider limits.
+
+    Limits are shared by every branch and run in the process; a run with
+    limits of its own uses a view from with_limits(). Branches closer
+    to completion pass a higher priority, so finishing interviews (and then
+    the report) is not starved by newly started ones. Rate-limited and
+    transient failures are retried with jittered exponential backoff. """
+
+    def __init__(self, limits: dict, max_attempts: int = 5):
+        self.limits = {provider: dict(settings) for provider, settings in limits.items()}
+        self.limiters = {provider: ProviderLimiter(**settings) for provider, settings in self.limits.items()}
+        self.max_attempts = max_attempts
+        self.overrides = {}
+
+    def with_limits(self, overrides: dict) -> "BranchScheduler":
+        """ A view of this scheduler for one run, leaving this one untouched.
+
+        Providers with overridden settings get a limiter of their own, nested
+        in the shared one; the rest use the shared limiters directly. """
+        view = BranchScheduler({}, self.max_attempts)
+        view.overrides = overrides or {}
+        for provider, settings in self.limits.items():
+            merged = {**settings, **view.overrides.get(provider, {})}
+            view.limits[provider] = merged
+            view.limiters[provider] = self.limiters[provider] if merged == settings \
+                else ProviderLimiter(**merged, parent=self.limiters[provider])
+        return view
+
+    async def run(self, provider: str, call, priority: float = 0):
+        """ Await call() once provider has a slot and a token for it """
+        limiter = self.limiters[provider]
+        for attempt in range(1, self.max_attempts + 1):
+            await limiter.acquire(priority)
+            try:
+                result = await call()
+            except Exception as error:
+                if attempt == self.max_attempts or not (is_rate_limited(error) or is_transient(error)):
+                    raise
+                wait = min(30.0, 2 ** attempt) * random.uniform(0.5, 1.0)
+                if is_rate_limited(error):
+                    limiter.on_rate_limited(retry_after(getattr(getattr(error, "response", None), "headers", None)) or wait)
+                    wait = 0
+            else:
+                limiter.on_success(getattr(result, "response_metadata", {}).get("headers"))
+                return result
+            finally:
+                limiter.release()
+            await asyncio.sleep(wait)
+
+scheduler = BranchScheduler(provider_limits)
+
+# Views of the shared scheduler for runs with their own "provider_limits", keyed by thread
+run_schedulers = OrderedDict()
+
+def get_scheduler(config: RunnableConfig) -> BranchScheduler:
+    """ The scheduler for the research run (thread) that config belongs to.
+
+    Runs without "provider_limits" in the configurable use the shared
+    scheduler; the others get a view of it with their limits applied. """
+    overrides = (config or {}).get("configurable", {}).get("provider_limits")
+    if not overrides:
+        return scheduler
+    view = get_run_scoped(run_schedulers, config, lambda: scheduler.with_limits(overrides))
+    if view.overrides != overrides:
+        view = run_schedulers[get_run_key(config)] = scheduler.with_limits(overrides)
+    return view
+
+async def invoke_llm(config: RunnableConfig, messages: list, priority: float = 0, schema=None):
+    """ Call the LLM (with structured output if a schema is given) through the scheduler """
+    model = llm.with_structured_output(schema) if schema else llm
+    return await get_scheduler(config).run("openai", lambda: model.ainvoke(messages), priority)
+
+async def stream_llm(config: RunnableConfig, messages: list, priority: float = 0):
+    """ Stream an LLM reply through the scheduler and return the full message.
+
+    Tokens reach clients streaming the graph with stream_mode="messages" as
+    they are generated. """
+    async def call():
+        message = None
+        async for chunk in llm.astream(messages, config):
+            message = chunk if message is None else message + chunk
+        return message
+    return await get_scheduler(config).run("openai", call, priority)
 
 ### Schema 
 
@@ -45,12 +303,29 @@ class GenerateAnalystsState(TypedDict):
     human_analyst_feedback: str # Human feedback
     analysts: List[Analyst] # Analyst asking questions
 
+def document_key(document: str) -> str:
+    """ Identify a formatted source document by its opening <Document .../> tag (href, or source and page) """
+    return document.split("\n", 1)[0]
+
+def dedupe_documents(left: list, right: list) -> list:
+    """ Reducer that appends source documents, dropping ones already in context """
+    merged = list(left or [])
+    seen = {document_key(document) for document in merged}
+    for document in right or []:
+        key = document_key(document)
+        if key not in seen:
+            seen.add(key)
+            merged.append(document)
+    return merged
+
 class InterviewState(MessagesState):
     max_num_turns: int # Number turns of conversation
-    context: Annotated[list, operator.add] # Source docs
+    context: Annotated[list, dedupe_documents] # Source docs, one formatted document per entry
+    search_query: str # Search query for the current turn, shared by all retrievers
     analyst: Analyst # Analyst asking questions
     interview: str # Interview transcript
     sections: list # Final key we duplicate in outer state for Send() API
+    deadline: float # Unix time the section must be written by (None to wait as long as it takes)
 
 class SearchQuery(BaseModel):
     search_query: str = Field(None, description="Search query for retrieval.")
@@ -61,6 +336,7 @@ class ResearchGraphState(TypedDict):
     human_analyst_feedback: str # Human feedback
     analysts: List[Analyst] # Analyst asking questions
     sections: Annotated[list, operator.add] # Send() API key
+    digest: str # Compact digest of the sections, for the introduction and conclusion
     introduction: str # Introduction for the final report
     content: str # Content for the final report
     conclusion: str # Conclusion for the final report
@@ -83,7 +359,7 @@ analyst_instructions="""You are tasked with creating a set of AI analyst persona
 
 5. Assign one analyst to each theme."""
 
-def create_analysts(state: GenerateAnalystsState):
+async def create_analysts(state: GenerateAnalystsState, config: RunnableConfig):
     
     """ Create analysts """
     
@@ -91,16 +367,14 @@ def create_analysts(state: GenerateAnalystsState):
     max_analysts=state['max_analysts']
     human_analyst_feedback=state.get('human_analyst_feedback', '')
         
-    # Enforce structured output
-    structured_llm = llm.with_structured_output(Perspectives)
-
     # System message
     system_message = analyst_instructions.format(topic=topic,
                                                             human_analyst_feedback=human_analyst_feedback, 
                                                             max_analysts=max_analysts)
 
     # Generate question 
-    analysts = structured_llm.invoke([SystemMessage(content=system_message)]+[HumanMessage(content="Generate the set of analysts.")])
+    analysts = await invoke_llm(config, [SystemMessage(content=system_message)]+[HumanMessage(content="Generate the set of analysts.")],
+                                schema=Perspectives)
     
     # Write the list of analysis to state
     return {"analysts": analysts.analysts}
@@ -128,7 +402,11 @@ When you are satisfied with your understanding, complete the interview with: "Th
 
 Remember to stay in character throughout your response, reflecting the persona and goals provided to you."""
 
-def generate_question(state: InterviewState):
+def count_expert_answers(messages: list, name: str = "expert") -> int:
+    """ Number of answers the expert has given; also how far an interview has progressed """
+    return len([m for m in messages if isinstance(m, AIMessage) and m.name == name])
+
+async def generate_question(state: InterviewState, config: RunnableConfig):
 
     """ Node to generate a question """
 
@@ -138,7 +416,8 @@ def generate_question(state: InterviewState):
 
     # Generate question 
     system_message = question_instructions.format(goals=analyst.persona)
-    question = llm.invoke([SystemMessage(content=system_message)]+messages)
+    question = await invoke_llm(config, [SystemMessage(content=system_message)]+messages,
+                                priority=count_expert_answers(messages))
         
     # Write messages to state
     return {"messages": [question]}
@@ -154,51 +433,183 @@ Pay particular attention to the final question posed by the analyst.
 
 Convert this final question into a well-structured web search query""")
 
-def search_web(state: InterviewState):
-    
-    """ Retrieve docs from web search """
-
-    # Search
-    tavily_search = TavilySearchResults(max_results=3)
+### Source document cache
+
+def normalize_query(query: str) -> str:
+    """ Normalize a search query so trivially different phrasings share a cache entry """
+    return " ".join(re.sub(r"[^\w\s]", " ", (query or "").lower()).split())
+
+# Seconds a persisted search result is reused, overridable with "source_cache_ttl"
+# in the configurable (or SOURCE_CACHE_TTL)
+source_cache_ttl = 24 * 3600
+
+class SourceCache:
+    """ Cache of retrieved source documents for one research run.
+
+    Searches are keyed by source and normalized query, and documents by URL, so
+    analysts issuing overlapping queries fetch and format each source once.
+    Concurrent identical searches share one in-flight fetch. With a directory
+    set, search results are also persisted and reused across runs for up to
+    ttl seconds after they were fetched. """
+
+    def __init__(self, persist_dir: str = None, ttl: float = None):
+        self.persist_dir = persist_dir
+        self.ttl = source_cache_ttl if ttl is None else ttl
+        self.results = {} # (source, normalized query) -> formatted documents
+        self.pending = {} # (source, normalized query) -> in-flight fetch
+        self.documents = {} # URL -> formatted document
+
+    def _path(self, key) -> str:
+        digest = hashlib.sha256("\n".join(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.persist_dir, key[0], f"{digest}.json")
+
+    def _load(self, key):
+        if self.persist_dir and os.path.exists(self._path(key)):
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            # Entries without a timestamp predate the TTL and count as expired
+            if isinstance(entry, dict) and time.time() - entry.get("fetched_at", 0) <= self.ttl:
+                return entry["documents"]
+        return None
+
+    def _save(self, key, documents):
+        if self.persist_dir:
+            path = self._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({"fetched_at": time.time(), "documents": documents}, f)
+            os.replace(path + ".tmp", path)
+
+    async def _fetch(self, key, fetch):
+        try:
+            documents = self._load(key)
+            if documents is None:
+                documents = [{"url": url, "document": document} for url, document in await fetch()]
+                self._save(key, documents)
+            # Share one formatted copy of each URL across queries
+            formatted = [self.documents.setdefault(item["url"], item["document"]) for item in documents]
+            self.results[key] = formatted
+            return formatted
+        finally:
+            self.pending.pop(key, None)
+
+    async def search(self, source: str, query: str, fetch, timeout: float) -> list:
+        """ Formatted documents for query, calling fetch() only on a cache miss.
+
+        fetch returns (url, formatted document) pairs. On timeout an empty list
+        is returned; the fetch keeps running and fills the cache for later turns. """
+        key = (source, normalize_query(query))
+        if key in self.results:
+            return self.results[key]
+        task = self.pending.get(key)
+        if task is None:
+            task = self.pending[key] = asyncio.ensure_future(self._fetch(key, fetch))
+            # A fetch that fails after every caller timed out has no one left to
+            # await it; retrieve its exception so it is not reported as unhandled
+            task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout=timeout)
+        except asyncio.TimeoutError:
+            return []
+
+# Source caches of recent research runs, keyed by thread
+source_caches = OrderedDict()
+max_cached_runs = 16
+
+def get_run_key(config: RunnableConfig):
+    return (config or {}).get("configurable", {}).get("thread_id", "default")
+
+def get_run_scoped(registry: OrderedDict, config: RunnableConfig, factory):
+    """ The registry entry for the research run (thread) that config belongs to, created with factory() """
+    run_key = get_run_key(config)
+    value = registry.get(run_key)
+    if value is None:
+        value = registry[run_key] = factory()
+        while len(registry) > max_cached_runs:
+            registry.popitem(last=False)
+    registry.move_to_end(run_key)
+    return value
+
+def get_source_cache(config: RunnableConfig) -> SourceCache:
+    """ Source cache for the research run (thread) that config belongs to.
+
+    Set "source_cache_dir" in the configurable (or SOURCE_CACHE_DIR) to persist
+    search results across runs, and "source_cache_ttl" (or SOURCE_CACHE_TTL) to
+    change how long they stay fresh. """
+    configurable = (config or {}).get("configurable", {})
+    persist_dir = configurable.get("source_cache_dir") or os.getenv("SOURCE_CACHE_DIR")
+    ttl = float(configurable.get("source_cache_ttl", os.getenv("SOURCE_CACHE_TTL", source_cache_ttl)))
+    return get_run_scoped(source_caches, config, lambda: SourceCache(persist_dir, ttl))
+
+# Per-source retrieval timeouts in seconds, overridable with "web_search_timeout" /
+# "wikipedia_search_timeout" in the configurable. A source that times out
+# contributes no documents instead of holding up the answer.
+search_timeouts = {"web": 10.0, "wikipedia": 10.0}
+
+def get_search_timeout(config: RunnableConfig, source: str) -> float:
+    return (config or {}).get("configurable", {}).get(f"{source}_search_timeout", search_timeouts[source])
+
+async def generate_search_query(state: InterviewState, config: RunnableConfig):
+
+    """ Generate one search query per turn, shared by all retrievers """
 
     # Search query
-    structured_llm = llm.with_structured_output(SearchQuery)
-    search_query = structured_llm.invoke([search_instructions]+state['messages'])
+    search_query = await invoke_llm(config, [search_instructions]+state['messages'],
+                                    priority=count_expert_answers(state['messages']), schema=SearchQuery)
+
+    return {"search_query": search_query.search_query}
+
+class SearchError(RuntimeError):
+    """ A search failure the tool reported as text.
+
+    status_code is the HTTP status from the tool's error formats,
+    "Error 429: ..." (async) or "429 Client Error: ..." (sync), if present. """
+
+    def __init__(self, message: str):
+        super().__init__(message)
+        match = re.search(r"\bError (\d{3}):|\b(\d{3}) (?:Client|Server) Error\b", message)
+        self.status_code = int(match.group(1) or match.group(2)) if match else None
+
+async def search_web(state: InterviewState, config: RunnableConfig):
     
-    # Search
-    search_docs = tavily_search.invoke(search_query.search_query)
+    """ Retrieve docs from web search """
 
-     # Format
-    formatted_search_docs = "\n\n---\n\n".join(
-        [
-            f'<Document href="{doc["url"]}"/>\n{doc["content"]}\n</Document>'
-            for doc in search_docs
-        ]
-    )
+    async def fetch():
+        # Search
+        tavily_search = TavilySearchResults(max_results=3)
+        search_docs = await get_scheduler(config).run("tavily", lambda: tavily_search.ainvoke(state["search_query"]),
+                                                      count_expert_answers(state["messages"]))
+        if isinstance(search_docs, str):
+            # The tool returns API errors (including 429s) as text
+            raise SearchError(search_docs)
 
-    return {"context": [formatted_search_docs]} 
+        # Format
+        return [(doc["url"], f'<Document href="{doc["url"]}"/>\n{doc["content"]}\n</Document>') for doc in search_docs]
 
-def search_wikipedia(state: InterviewState):
+    search_docs = await get_source_cache(config).search("web", state["search_query"], fetch,
+                                                         get_search_timeout(config, "web"))
+    return {"context": search_docs}
+
+async def search_wikipedia(state: InterviewState, config: RunnableConfig):
     
     """ Retrieve docs from wikipedia """
 
-    # Search query
-    structured_llm = llm.with_structured_output(SearchQuery)
-    search_query = structured_llm.invoke([search_instructions]+state['messages'])
-    
-    # Search
-    search_docs = WikipediaLoader(query=search_query.search_query, 
-                                  load_max_docs=2).load()
-
-     # Format
-    formatted_search_docs = "\n\n---\n\n".join(
-        [
-            f'<Document source="{doc.metadata["source"]}" page="{doc.metadata.get("page", "")}"/>\n{doc.page_content}\n</Document>'
+    async def fetch():
+        # Search (WikipediaLoader is blocking, so run it in a worker thread)
+        loader = WikipediaLoader(query=state["search_query"], load_max_docs=2)
+        search_docs = await get_scheduler(config).run("wikipedia", lambda: asyncio.to_thread(loader.load),
+                                                      count_expert_answers(state["messages"]))
+
+        # Format
+        return [
+            (doc.metadata["source"],
+             f'<Document source="{doc.metadata["source"]}" page="{doc.metadata.get("page", "")}"/>\n{doc.page_content}\n</Document>')
             for doc in search_docs
         ]
-    )
 
-    return {"context": [formatted_search_docs]} 
+    search_docs = await get_source_cache(config).search("wikipedia", state["search_query"], fetch,
+                                                        get_search_timeout(config, "wikipedia"))
+    return {"context": search_docs}
 
 # Generate expert answer
 answer_instructions = """You are an expert being interviewed by an analyst.
@@ -229,7 +640,7 @@ When answering questions, follow these guidelines:
         
 And skip the addition of the brackets as well as the Document source preamble in your citation."""
 
-def generate_answer(state: InterviewState):
+async def generate_answer(state: InterviewState, config: RunnableConfig):
     
     """ Node to answer a question """
 
@@ -239,8 +650,9 @@ def generate_answer(state: InterviewState):
     context = state["context"]
 
     # Answer question
-    system_message = answer_instructions.format(goals=analyst.persona, context=context)
-    answer = llm.invoke([SystemMessage(content=system_message)]+messages)
+    system_message = answer_instructions.format(goals=analyst.persona, context="\n\n---\n\n".join(context))
+    answer = await invoke_llm(config, [SystemMessage(content=system_message)]+messages,
+                              priority=count_expert_answers(messages))
             
     # Name the message as coming from the expert
     answer.name = "expert"
@@ -262,6 +674,7 @@ def save_interview(state: InterviewState):
     return {"interview": interview}
 
 def route_messages(state: InterviewState, 
+                   config: RunnableConfig,
                    name: str = "expert"):
 
     """ Route between question and answer """
@@ -271,14 +684,17 @@ def route_messages(state: InterviewState,
     max_num_turns = state.get('max_num_turns',2)
 
     # Check the number of expert answers 
-    num_responses = len(
-        [m for m in messages if isinstance(m, AIMessage) and m.name == name]
-    )
+    num_responses = count_expert_answers(messages, name)
 
     # End if expert has answered more than the max turns
     if num_responses >= max_num_turns:
         return 'save_interview'
 
+    # End early if the remaining time is only enough to write the section
+    deadline = state.get("deadline")
+    if deadline is not None and time.time() >= deadline - get_deadline_settings(config)["section_write_reserve"]:
+        return 'save_interview'
+
     # This router is run after each question - answer pair 
     # Get the last question asked to check if it signals the end of discussion
     last_question = messages[-2]
@@ -339,7 +755,7 @@ There should be no redundant sources. It should simply be:
 - Include no preamble before the title of the report
 - Check that all guidelines have been followed"""
 
-def write_section(state: InterviewState):
+async def write_section(state: InterviewState, config: RunnableConfig):
 
     """ Node to write a section """
 
@@ -350,7 +766,10 @@ def write_section(state: InterviewState):
    
     # Write section using either the gathered source docs from interview (context) or the interview itself (interview)
     system_message = section_writer_instructions.format(focus=analyst.description)
-    section = llm.invoke([SystemMessage(content=system_message)]+[HumanMessage(content=f"Use this source to write your section: {context}")]) 
+    formatted_context = "\n\n---\n\n".join(context)
+    # The last step of an interview, so it goes ahead of any branch still asking questions
+    section = await invoke_llm(config, [SystemMessage(content=system_message)]+[HumanMessage(content=f"Use this source to write your section: {formatted_context}")],
+                               priority=state.get("max_num_turns", 2) + 1) 
                 
     # Append it to state
     return {"sections": [section.content]}
@@ -358,6 +777,7 @@ def write_section(state: InterviewState):
 # Add nodes and edges 
 interview_builder = StateGraph(InterviewState)
 interview_builder.add_node("ask_question", generate_question)
+interview_builder.add_node("generate_search_query", generate_search_query)
 interview_builder.add_node("search_web", search_web)
 interview_builder.add_node("search_wikipedia", search_wikipedia)
 interview_builder.add_node("answer_question", generate_answer)
@@ -366,15 +786,55 @@ interview_builder.add_node("write_section", write_section)
 
 # Flow
 interview_builder.add_edge(START, "ask_question")
-interview_builder.add_edge("ask_question", "search_web")
-interview_builder.add_edge("ask_question", "search_wikipedia")
+interview_builder.add_edge("ask_question", "generate_search_query")
+interview_builder.add_edge("generate_search_query", "search_web")
+interview_builder.add_edge("generate_search_query", "search_wikipedia")
 interview_builder.add_edge("search_web", "answer_question")
 interview_builder.add_edge("search_wikipedia", "answer_question")
 interview_builder.add_conditional_edges("answer_question", route_messages,['ask_question','save_interview'])
 interview_builder.add_edge("save_interview", "write_section")
 interview_builder.add_edge("write_section", END)
 
-def initiate_all_interviews(state: ResearchGraphState):
+interview_graph = interview_builder.compile()
+
+# Report drafts of recent research runs, keyed by thread: sections in the order they finished
+report_drafts = OrderedDict()
+
+# Seconds after the interviews start by which every section must be written
+# (None waits for all of them), and the time kept back for write_section.
+# Overridable with "report_deadline" / "section_write_reserve" in the configurable.
+deadline_settings = {"report_deadline": None, "section_write_reserve": 30.0}
+
+def get_deadline_settings(config: RunnableConfig) -> dict:
+    configurable = (config or {}).get("configurable", {})
+    return {name: configurable.get(name, default) for name, default in deadline_settings.items()}
+
+async def conduct_interview(state: InterviewState, config: RunnableConfig, writer: StreamWriter):
+
+    """ Node to run one interview and stream its section as soon as it is written.
+
+    Each finished section is emitted to stream_mode="custom" together with
+    the running report draft. An interview still running at the deadline is
+    dropped, so the report goes out with the sections that finished in time. """
+
+    analyst = state["analyst"]
+    deadline = state.get("deadline")
+    timeout = None if deadline is None else max(0.0, deadline - time.time())
+    try:
+        interview = await asyncio.wait_for(interview_graph.ainvoke(state, config), timeout)
+    except asyncio.TimeoutError:
+        writer({"event": "section_dropped", "analyst": analyst.name})
+        return {"sections": []}
+
+    # Update the running draft
+    draft = get_run_scoped(report_drafts, config, list)
+    for section in interview["sections"]:
+        draft.append(section)
+        writer({"event": "section", "analyst": analyst.name, "section": section,
+                "draft": "\n\n".join(draft), "sections_done": len(draft)})
+    return {"sections": interview["sections"]}
+
+def initiate_all_interviews(state: ResearchGraphState, config: RunnableConfig):
 
     """ Conditional edge to initiate all interviews via Send() API or return to create_analysts """    
 
@@ -387,7 +847,13 @@ def initiate_all_interviews(state: ResearchGraphState):
     # Otherwise kick off interviews in parallel via Send() API
     else:
         topic = state["topic"]
+        report_deadline = get_deadline_settings(config)["report_deadline"]
+        deadline = None if report_deadline is None else time.time() + report_deadline
+
+        # Start a fresh draft for this run
+        get_run_scoped(report_drafts, config, list).clear()
         return [Send("conduct_interview", {"analyst": analyst,
+                                           "deadline": deadline,
                                            "messages": [HumanMessage(
                                                content=f"So you said you were writing an article on {topic}?"
                                            )
@@ -428,7 +894,7 @@ Here are the memos from your analysts to build your report from:
 
 {context}"""
 
-def write_report(state: ResearchGraphState):
+async def write_report(state: ResearchGraphState, config: RunnableConfig):
 
     """ Node to write the final report body """
 
@@ -441,13 +907,29 @@ def write_report(state: ResearchGraphState):
     
     # Summarize the sections into a final report
     system_message = report_writer_instructions.format(topic=topic, context=formatted_str_sections)    
-    report = llm.invoke([SystemMessage(content=system_message)]+[HumanMessage(content=f"Write a report based upon these memos.")]) 
+    report = await stream_llm(config, [SystemMessage(content=system_message)]+[HumanMessage(content=f"Write a report based upon these memos.")],
+                              priority=report_priority) 
     return {"content": report.content}
 
+def section_digest(section: str, max_words: int = 60) -> str:
+    """ Title and opening summary of a section memo, without its sources """
+    body = section.split("### Sources")[0]
+    lines = [line.strip() for line in body.splitlines() if line.strip()]
+    title = next((line for line in lines if line.startswith("## ")), "")
+    words = " ".join(line for line in lines if not line.startswith("#")).split()
+    summary = " ".join(words[:max_words]) + (" ..." if len(words) > max_words else "")
+    return f"{title}\n{summary}".strip()
+
+def digest_sections(state: ResearchGraphState):
+
+    """ Node to build the compact digest of all sections once, before the report writers start """
+
+    return {"digest": "\n\n".join(section_digest(section) for section in state["sections"])}
+
 # Write the introduction or conclusion
 intro_conclusion_instructions = """You are a technical writer finishing a report on {topic}
 
-You will be given all of the sections of the report.
+You will be given a digest of the sections of the report: the title and opening summary of each.
 
 You job is to write a crisp and compelling introduction or conclusion section.
 
@@ -465,60 +947,40 @@ For your introduction, use ## Introduction as the section header.
 
 For your conclusion, use ## Conclusion as the section header.
 
-Here are the sections to reflect on for writing: {formatted_str_sections}"""
+Here is the digest of the sections to reflect on for writing: {digest}"""
 
-def write_introduction(state: ResearchGraphState):
+async def write_introduction(state: ResearchGraphState, config: RunnableConfig):
 
     """ Node to write the introduction """
 
-    # Full set of sections
-    sections = state["sections"]
-    topic = state["topic"]
-
-    # Concat all sections together
-    formatted_str_sections = "\n\n".join([f"{section}" for section in sections])
-    
-    # Summarize the sections into a final report
-    
-    instructions = intro_conclusion_instructions.format(topic=topic, formatted_str_sections=formatted_str_sections)    
-    intro = llm.invoke([instructions]+[HumanMessage(content=f"Write the report introduction")]) 
+    # Digest of all sections
+    instructions = intro_conclusion_instructions.format(topic=state["topic"], digest=state["digest"])
+    intro = await stream_llm(config, [instructions]+[HumanMessage(content=f"Write the report introduction")],
+                             priority=report_priority) 
     return {"introduction": intro.content}
 
-def write_conclusion(state: ResearchGraphState):
+async def write_conclusion(state: ResearchGraphState, config: RunnableConfig):
 
     """ Node to write the conclusion """
 
-    # Full set of sections
-    sections = state["sections"]
-    topic = state["topic"]
-
-    # Concat all sections together
-    formatted_str_sections = "\n\n".join([f"{section}" for section in sections])
-    
-    # Summarize the sections into a final report
-    
-    instructions = intro_conclusion_instructions.format(topic=topic, formatted_str_sections=formatted_str_sections)    
-    conclusion = llm.invoke([instructions]+[HumanMessage(content=f"Write the report conclusion")]) 
+    # Digest of all sections
+    instructions = intro_conclusion_instructions.format(topic=state["topic"], digest=state["digest"])
+    conclusion = await stream_llm(config, [instructions]+[HumanMessage(content=f"Write the report conclusion")],
+                                  priority=report_priority) 
     return {"conclusion": conclusion.content}
 
 def finalize_report(state: ResearchGraphState):
 
-    """ The is the "reduce" step where we gather all the sections, combine them, and reflect on them to write the intro/conclusion """
+    """ The is the "reduce" step where we stitch the concurrently written introduction, report body and conclusion together """
 
     # Save full final report
-    content = state["content"]
+    content = state["content"].strip()
     if content.startswith("## Insights"):
-        content = content.strip("## Insights")
-    if "## Sources" in content:
-        try:
-            content, sources = content.split("\n## Sources\n")
-        except:
-            sources = None
-    else:
-        sources = None
+        content = content[len("## Insights"):].strip()
+    content, sources_header, sources = content.partition("\n## Sources\n")
 
     final_report = state["introduction"] + "\n\n---\n\n" + content + "\n\n---\n\n" + state["conclusion"]
-    if sources is not None:
+    if sources_header:
         final_report += "\n\n## Sources\n" + sources
     return {"final_report": final_report}
 
@@ -526,8 +988,9 @@ def finalize_report(state: ResearchGraphState):
 builder = StateGraph(ResearchGraphState)
 builder.add_node("create_analysts", create_analysts)
 builder.add_node("human_feedback", human_feedback)
-builder.add_node("conduct_interview", interview_builder.compile())
+builder.add_node("conduct_interview", conduct_interview)
 builder.add_node("write_report",write_report)
+builder.add_node("digest_sections",digest_sections)
 builder.add_node("write_introduction",write_introduction)
 builder.add_node("write_conclusion",write_conclusion)
 builder.add_node("finalize_report",finalize_report)
@@ -536,9 +999,11 @@ builder.add_node("finalize_report",finalize_report)
 builder.add_edge(START, "create_analysts")
 builder.add_edge("create_analysts", "human_feedback")
 builder.add_conditional_edges("human_feedback", initiate_all_interviews, ["create_analysts", "conduct_interview"])
-builder.add_edge("conduct_interview", "write_report")
-builder.add_edge("conduct_interview", "write_introduction")
-builder.add_edge("conduct_interview", "write_conclusion")
+# The digest is cheap, so all three writers start together right after it
+builder.add_edge("conduct_interview", "digest_sections")
+builder.add_edge("digest_sections", "write_report")
+builder.add_edge("digest_sections", "write_introduction")
+builder.add_edge("digest_sections", "write_conclusion")
 builder.add_edge(["write_conclusion", "write_report", "write_introduction"], "finalize_report")
 builder.add_edge("finalize_report", END)
 
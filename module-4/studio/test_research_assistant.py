@@ -0,0 +1,363 @@
+import asyncio
+import gc
+import json
+import os
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("TAVILY_API_KEY", "test")
+
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+import research_assistant as ra
+
+def test_persisted_results_expire_after_ttl(tmp_path):
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        return [("https://example.com", "document")]
+
+    async def search(ttl):
+        return await ra.SourceCache(str(tmp_path), ttl).search("web", "Query?", fetch, timeout=1)
+
+    assert asyncio.run(search(60)) == ["document"]
+    assert asyncio.run(search(60)) == ["document"]
+    assert len(calls) == 1
+
+    path = ra.SourceCache(str(tmp_path))._path(("web", "query"))
+    with open(path, "r", encoding="utf-8") as f:
+        entry = json.load(f)
+    entry["fetched_at"] = time.time() - 120
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(entry, f)
+
+    assert asyncio.run(search(60)) == ["document"]
+    assert len(calls) == 2
+
+def test_entries_without_timestamp_are_refetched(tmp_path):
+    cache = ra.SourceCache(str(tmp_path))
+    path = cache._path(("web", "query"))
+    os.makedirs(os.path.dirname(path))
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump([{"url": "https://example.com", "document": "old"}], f)
+
+    async def fetch():
+        return [("https://example.com", "new")]
+
+    assert asyncio.run(cache.search("web", "query", fetch, timeout=1)) == ["new"]
+
+def test_fetch_failing_after_timeout_is_retrieved():
+    unhandled = []
+
+    async def fetch():
+        await asyncio.sleep(0.05)
+        raise RuntimeError("search failed")
+
+    async def main():
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: unhandled.append(context))
+        cache = ra.SourceCache()
+        assert await cache.search("web", "query", fetch, timeout=0.01) == []
+        await asyncio.sleep(0.1)
+        assert not cache.pending and not cache.results
+        gc.collect()
+
+    asyncio.run(main())
+    assert unhandled == []
+
+def test_run_limits_leave_the_shared_scheduler_untouched(monkeypatch):
+    monkeypatch.setattr(ra, "run_schedulers", ra.OrderedDict())
+    shared = ra.scheduler.limiters["openai"]
+    settings = (shared.max_rate, shared.max_concurrency)
+    config = {"configurable": {"thread_id": "run", "provider_limits": {"openai": {"max_concurrency": 1}}}}
+
+    view = ra.get_scheduler(config)
+    assert view is not ra.scheduler and ra.get_scheduler(config) is view
+    assert view.limiters["openai"].max_concurrency == 1 and view.limiters["openai"].parent is shared
+    assert view.limiters["tavily"] is ra.scheduler.limiters["tavily"]
+    assert (shared.max_rate, shared.max_concurrency) == settings
+    assert ra.scheduler.limits == ra.provider_limits
+    assert ra.get_scheduler({"configurable": {"thread_id": "other"}}) is ra.scheduler
+
+def test_run_limiter_holds_its_own_and_the_shared_limits():
+    async def main():
+        shared = ra.ProviderLimiter(6000, 10, 2)
+        run = ra.ProviderLimiter(6000, 10, 1, parent=shared)
+        running, peak = [0, 0], [0, 0]
+
+        async def call(limiter, index):
+            await limiter.acquire()
+            running[index] += 1
+            peak[index] = max(peak[index], running[index])
+            await asyncio.sleep(0.01)
+            running[index] -= 1
+            limiter.release()
+
+        await asyncio.gather(*[call(run, 0) for _ in range(3)], *[call(shared, 1) for _ in range(3)])
+        assert peak[0] == 1 and shared.active == 0 and run.active == 0
+
+        run.on_rate_limited(5)
+        assert shared.paused_until > time.monotonic()
+
+    asyncio.run(main())
+
+def test_rate_limits_are_detected_by_status_code():
+    class Response:
+        status_code = 429
+
+    class HTTPError(Exception):
+        response = Response()
+
+    assert ra.is_rate_limited(HTTPError("slow down"))
+    assert not ra.is_rate_limited(ValueError("item 429 of the report"))
+    assert ra.is_rate_limited(ra.SearchError("Exception('Error 429: Too Many Requests')"))
+    assert ra.is_rate_limited(ra.SearchError("HTTPError('429 Client Error: Too Many Requests for url: x')"))
+    assert ra.SearchError("Exception('Error 502: Bad Gateway')").status_code == 502
+    assert ra.SearchError("ValueError('no results for 429 query')").status_code is None
+
+class StatusError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = type("Response", (), {"headers": headers or {}})()
+
+def test_waiting_calls_get_slots_by_priority():
+    async def main():
+        limiter = ra.ProviderLimiter(6000, 100, 1)
+        order = []
+        await limiter.acquire()
+
+        async def call(priority):
+            await limiter.acquire(priority)
+            order.append(priority)
+            await asyncio.sleep(0.01)
+            limiter.release()
+
+        tasks = [asyncio.create_task(call(priority)) for priority in (0, 3, 1, 5)]
+        await asyncio.sleep(0.01)
+        tasks[2].cancel()
+        limiter.release()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return order, limiter.active
+
+    assert asyncio.run(main()) == ([5, 3, 0], 0)
+
+def test_scheduler_retries_rate_limited_and_transient_failures(monkeypatch):
+    monkeypatch.setattr(ra.random, "uniform", lambda low, high: 0.0)
+    errors = [StatusError(429, {"retry-after-ms": "20"}), StatusError(503)]
+
+    async def call():
+        if errors:
+            raise errors.pop(0)
+        return "done"
+
+    async def main():
+        scheduler = ra.BranchScheduler({"openai": {"requests_per_minute": 6000, "burst": 10, "max_concurrency": 2}})
+        limiter = scheduler.limiters["openai"]
+        started = time.monotonic()
+        result = await scheduler.run("openai", call)
+        return result, time.monotonic() - started, limiter
+
+    result, elapsed, limiter = asyncio.run(main())
+    assert result == "done" and not errors
+    # The 429 paused the provider for as long as its headers asked and cut the rate
+    assert elapsed >= 0.02
+    assert limiter.rate < limiter.max_rate and limiter.active == 0
+
+def test_scheduler_raises_other_errors_and_gives_up_after_max_attempts(monkeypatch):
+    monkeypatch.setattr(ra.random, "uniform", lambda low, high: 0.0)
+    calls = []
+
+    async def failing(error):
+        calls.append(error)
+        raise error
+
+    async def main(error):
+        scheduler = ra.BranchScheduler({"openai": {"requests_per_minute": 6000, "burst": 10, "max_concurrency": 2}},
+                                       max_attempts=3)
+        try:
+            await scheduler.run("openai", lambda: failing(error))
+        except Exception as raised:
+            return raised, scheduler.limiters["openai"].active
+
+    error = StatusError(400)
+    assert asyncio.run(main(error)) == (error, 0) and len(calls) == 1
+    calls.clear()
+    error = StatusError(502)
+    assert asyncio.run(main(error)) == (error, 0) and len(calls) == 3
+
+class StreamingLLM:
+    """ Fake chat model that records which prompts are streamed at the same time """
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+        self.prompts = []
+
+    async def astream(self, messages, config=None):
+        self.prompts.append(messages)
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+            request = messages[-1].content
+            if "introduction" in request:
+                yield AIMessageChunk(content="# Title\n## Introduction\nintro")
+            elif "conclusion" in request:
+                yield AIMessageChunk(content="## Conclusion\nconclusion")
+            else:
+                yield AIMessageChunk(content="## Insights\nbody")
+                yield AIMessageChunk(content="\n## Sources\n[1] https://example.com")
+        finally:
+            self.active -= 1
+
+SECTIONS = [
+    "## Chips\n### Summary\nDemand for accelerators keeps growing. " + "word " * 100 + "\n### Sources\n[1] https://a",
+    "## Power\n### Summary\nData centers need more power.\n### Sources\n[1] https://b",
+]
+
+def test_section_digest_keeps_title_and_opening_summary():
+    digest = ra.section_digest(SECTIONS[0], max_words=6)
+    assert digest == "## Chips\nDemand for accelerators keeps growing. word ..."
+    assert "https://a" not in ra.section_digest(SECTIONS[0])
+
+def test_report_writers_run_concurrently_from_one_digest(monkeypatch):
+    fake = StreamingLLM()
+    monkeypatch.setattr(ra, "llm", fake)
+
+    async def main():
+        graph = ra.builder.compile(checkpointer=MemorySaver())
+        config = {"configurable": {"thread_id": "report"}}
+        await graph.aupdate_state(config, {"topic": "AI infrastructure", "sections": SECTIONS}, as_node="conduct_interview")
+        return await graph.ainvoke(None, config)
+
+    state = asyncio.run(main())
+    assert len(fake.prompts) == 3 and fake.peak == 3
+
+    assert state["digest"] == "\n\n".join(ra.section_digest(section) for section in SECTIONS)
+    for messages in fake.prompts:
+        if "report introduction" in messages[-1].content or "report conclusion" in messages[-1].content:
+            assert state["digest"] in messages[0] and "https://a" not in messages[0]
+
+    assert state["final_report"] == ("# Title\n## Introduction\nintro\n\n---\n\nbody\n\n---\n\n"
+                                     "## Conclusion\nconclusion\n\n## Sources\n[1] https://example.com")
+
+class InterviewLLM(StreamingLLM):
+    """ Fake chat model for whole interviews; calls mentioning slow_focus hang """
+
+    def __init__(self, slow_focus=None, delay=0.01):
+        super().__init__(delay)
+        self.slow_focus = slow_focus
+        self.queries = 0
+
+    def with_structured_output(self, schema):
+        fake = self
+
+        class Structured:
+            async def ainvoke(self, messages):
+                fake.queries += 1
+                return ra.SearchQuery(search_query="AI chip supply?")
+        return Structured()
+
+    async def ainvoke(self, messages):
+        if self.slow_focus and any(self.slow_focus in str(message.content) for message in messages):
+            await asyncio.sleep(5)
+        await asyncio.sleep(self.delay)
+        return AIMessage(content=f"## Reply\n{len(messages)} messages")
+
+def fake_sources(monkeypatch, wikipedia_delay=0.0):
+    """ Patch Tavily and Wikipedia with fakes; returns the queries each one received """
+    queries = {"web": [], "wikipedia": []}
+
+    class Tavily:
+        def __init__(self, max_results):
+            pass
+
+        async def ainvoke(self, query):
+            queries["web"].append(query)
+            return [{"url": "https://example.com/chips", "content": "web content"}]
+
+    class Wikipedia:
+        def __init__(self, query, load_max_docs):
+            self.query = query
+
+        def load(self):
+            queries["wikipedia"].append(self.query)
+            time.sleep(wikipedia_delay)
+            return [Document(page_content="wiki content", metadata={"source": "https://en.wikipedia.org/wiki/Chip"})]
+
+    monkeypatch.setattr(ra, "TavilySearchResults", Tavily)
+    monkeypatch.setattr(ra, "WikipediaLoader", Wikipedia)
+    monkeypatch.setattr(ra, "source_caches", ra.OrderedDict())
+    return queries
+
+ANALYST = ra.Analyst(affiliation="Lab", name="Ada", role="Researcher", description="focus on supply")
+
+def run_interview(config, max_num_turns=1):
+    """ Run one interview; returns its final state and how long it took """
+    state = {"analyst": ANALYST, "max_num_turns": max_num_turns,
+             "messages": [HumanMessage(content="So you said you were writing an article on AI chips?")]}
+
+    async def main():
+        started = time.monotonic()
+        final = await ra.interview_graph.ainvoke(state, config)
+        return final, time.monotonic() - started
+    return asyncio.run(main())
+
+def test_each_turn_sends_one_query_to_both_sources(monkeypatch):
+    fake = InterviewLLM()
+    monkeypatch.setattr(ra, "llm", fake)
+    queries = fake_sources(monkeypatch)
+
+    state, _ = run_interview({"configurable": {"thread_id": "shared-query"}}, max_num_turns=2)
+    assert fake.queries == 2
+    # The second turn's identical query is served from the run's source cache
+    assert queries == {"web": ["AI chip supply?"], "wikipedia": ["AI chip supply?"]}
+    # and its documents are not added to the context twice
+    assert [document.split("\n", 1)[0] for document in state["context"]] == [
+        '<Document href="https://example.com/chips"/>',
+        '<Document source="https://en.wikipedia.org/wiki/Chip" page=""/>',
+    ]
+
+def test_slow_source_is_skipped_after_its_timeout(monkeypatch):
+    monkeypatch.setattr(ra, "llm", InterviewLLM())
+    fake_sources(monkeypatch, wikipedia_delay=0.5)
+
+    state, elapsed = run_interview({"configurable": {"thread_id": "timeout", "wikipedia_search_timeout": 0.05}})
+    assert elapsed < 0.4
+    assert state["context"] == ['<Document href="https://example.com/chips"/>\nweb content\n</Document>']
+
+def test_dedupe_documents_keeps_the_first_copy_of_each_source():
+    first = '<Document href="https://a"/>\nold\n</Document>'
+    merged = ra.dedupe_documents([first], ['<Document href="https://a"/>\nnew\n</Document>',
+                                           '<Document source="b.pdf" page="2"/>\nb\n</Document>'])
+    assert merged == [first, '<Document source="b.pdf" page="2"/>\nb\n</Document>']
+    assert ra.dedupe_documents(None, [first, first]) == [first]
+
+def test_interviews_past_the_deadline_are_dropped(monkeypatch):
+    monkeypatch.setattr(ra, "llm", InterviewLLM(slow_focus="focus 2"))
+    fake_sources(monkeypatch)
+    analysts = [ra.Analyst(affiliation="Lab", name=f"Analyst {i}", role="Researcher", description=f"focus {i}")
+                for i in range(3)]
+
+    async def main():
+        graph = ra.builder.compile(checkpointer=MemorySaver())
+        config = {"configurable": {"thread_id": "deadline", "report_deadline": 1.0, "section_write_reserve": 0.2}}
+        await graph.aupdate_state(config, {"topic": "AI chips", "analysts": analysts, "human_analyst_feedback": "approve"},
+                                  as_node="human_feedback")
+        started = time.monotonic()
+        events = [event async for event in graph.astream(None, config, stream_mode="custom")]
+        return events, (await graph.aget_state(config)).values, time.monotonic() - started
+
+    events, state, elapsed = asyncio.run(main())
+    assert elapsed < 3
+    sections = [event for event in events if event["event"] == "section"]
+    assert sorted(event["analyst"] for event in sections) == ["Analyst 0", "Analyst 1"]
+    assert [event["sections_done"] for event in sections] == [1, 2]
+    assert sections[-1]["draft"] == "\n\n".join(event["section"] for event in sections)
+    assert [event for event in events if event["event"] == "section_dropped"] == [
+        {"event": "section_dropped", "analyst": "Analyst 2"}]
+    assert len(state["sections"]) == 2 and state["final_report"]